@@ -0,0 +1,344 @@
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+import papers
+import pyq_db
+from pipeline_log import get_logger
+
+try:
+    import fcntl
+except ImportError:  # no flock on Windows; live updates are then unavailable
+    fcntl = None
+
+# Precomputed question and mark counts for topic-weightage views. The cube is
+# an int32 array of shape (paper, year, label, question type, measure), kept
+# as a memory-mapped .npy file. The label axis lists every (section, subject,
+# topic) leaf of the paper definitions, section by section and subject by
+# subject, so a subject or section total is a sum over a contiguous range;
+# each subject also has a (subject, None) leaf for rows without a topic, and
+# each section a (section, None, None) leaf for rows without a subject.
+# cube_rows.npz remembers where every question was counted, so a label
+# change moves one count instead of triggering a rebuild. A cube has a single
+# writer: build() and live updates both hold an exclusive lock on cube.lock
+# for the life of the process, so a second classifier process skips live
+# updates instead of racing on the counts and cube_rows.npz, and a rebuild
+# waits for no one's stale map of the replaced file.
+CUBE_CONFIG = {
+    "dir": "analytics",
+    "first_year": 1991,
+    "last_year": 2040,
+    "question_types": ["MCQ", "NAT", "MSQ"],  # anything else is counted as "other"
+    "live_updates": False,  # count classifier labels as they are written (else at the next build)
+}
+
+MEASURES = ("questions", "marks")
+
+logger = get_logger("analytics")
+
+cube = None
+cube_lock = threading.Lock()
+writer_locks = {}  # cube dir -> open lock file held by this process
+
+def taxonomy_axes():
+    """Paper, year, label and question type axes from the paper definitions"""
+    shared = papers.PAPERS_CONFIG["shared_section"]
+    leaves = []
+    for section in sorted(papers.load_papers()):
+        leaves.append((section, None, None))
+        for subject in papers.subjects_for(section):
+            leaves.append((section, subject, None))
+            leaves.extend((section, subject, topic) for topic in papers.topics_for(section, subject) or {})
+    return {
+        "papers": sorted(code for code in papers.load_papers() if code != shared),
+        "years": list(range(CUBE_CONFIG["first_year"], CUBE_CONFIG["last_year"] + 1)),
+        "labels": leaves,
+        "question_types": CUBE_CONFIG["question_types"] + ["other"],
+        "measures": list(MEASURES),
+    }
+
+def axes_version(axes):
+    return hashlib.sha256(json.dumps(axes, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+
+class AnalyticsCube:
+    """Count cube with its axes; slices are NumPy views over the memory map"""
+
+    def __init__(self, axes, data, rows=None):
+        self.axes = axes
+        self.data = data
+        self.rows = rows if rows is not None else {}  # question id -> (paper, year, label, type, marks)
+        self.dirty = False
+        self.present = None  # years with any questions, recomputed after updates
+        self.paper_index = {code: i for i, code in enumerate(axes["papers"])}
+        self.type_index = {t: i for i, t in enumerate(axes["question_types"])}
+        self.first_year = axes["years"][0]
+
+        # Contiguous label ranges per section and per subject
+        self.label_index = {}
+        self.section_range = {}
+        self.subject_range = {}
+        for i, (section, subject, topic) in enumerate(map(tuple, axes["labels"])):
+            self.label_index[(section, subject, topic)] = i
+            start, _ = self.section_range.get(section, (i, i))
+            self.section_range[section] = (start, i + 1)
+            if subject is not None:
+                start, _ = self.subject_range.get((section, subject), (i, i))
+                self.subject_range[(section, subject)] = (start, i + 1)
+
+    def coordinates(self, row):
+        """(paper, year, label, type, marks) indices of a PYQ row, or None if outside the axes"""
+        paper = self.paper_index.get(row["paper"])
+        year = row["year"] - self.first_year
+        if paper is None or not 0 <= year < len(self.axes["years"]):
+            return None
+        section, subject, topic = row["section"], row.get("subject"), row.get("topic")
+        label = self.label_index.get((section, subject, topic))
+        if label is None:
+            # Labels missing from the taxonomy count as unlabeled at the deepest known level
+            label = self.label_index.get((section, subject, None), self.label_index.get((section, None, None)))
+        if label is None:
+            return None
+        qtype = self.type_index.get(row["question_type"], len(self.type_index) - 1)
+        marks = papers.question_marks(row["year"], row["question_number"]) or 0
+        return (paper, year, label, qtype, marks)
+
+    def _count(self, coordinates, sign):
+        paper, year, label, qtype, marks = coordinates
+        self.data[paper, year, label, qtype, 0] += sign
+        self.data[paper, year, label, qtype, 1] += sign * marks
+
+    def update(self, row):
+        """
+        Count a row, moving its previous count if its labels changed.
+
+        Returns:
+            bool: True if the cube changed
+        """
+        question_id = pyq_db.question_id(row)
+        new = self.coordinates(row)
+        old = self.rows.get(question_id)
+        if new == old:
+            return False
+        if old is not None:
+            self._count(old, -1)
+            del self.rows[question_id]
+        if new is not None:
+            self._count(new, 1)
+            self.rows[question_id] = new
+        self.dirty = True
+        self.present = None
+        return True
+
+    def _label_range(self, section=None, subject=None, topic=None):
+        if topic is not None:
+            i = self.label_index[(section, subject, topic)]
+            return i, i + 1
+        if subject is not None:
+            return self.subject_range[(section, subject)]
+        if section is not None:
+            return self.section_range[section]
+        return 0, len(self.axes["labels"])
+
+    def select(self, paper=None, section=None, subject=None, topic=None, question_type=None, measure="marks"):
+        """
+        Per-year totals for a slice of the cube.
+
+        Args:
+            paper: Paper code, None for all papers
+            section, subject, topic: Label prefix, e.g. ("EE", "Power Systems")
+            question_type: "MCQ", "NAT", ... or None for all types
+            measure: "questions" or "marks"
+
+        Returns:
+            numpy.ndarray: One total per entry of axes["years"]
+        """
+        papers_slice = slice(None) if paper is None else self.paper_index[paper]
+        start, stop = self._label_range(section, subject, topic)
+        type_slice = slice(None) if question_type is None else self.type_index[question_type]
+        view = self.data[papers_slice, :, start:stop, type_slice, MEASURES.index(measure)]
+        if paper is not None:
+            view = view[None]
+        if question_type is not None:
+            view = view[..., None]
+        return view.sum(axis=(0, 2, 3))
+
+    def trend(self, **selection):
+        """{year: total} over the years that have any questions"""
+        totals = self.select(**selection)
+        if self.present is None:
+            self.present = self.data[..., 0].sum(axis=(0, 2, 3)) > 0
+        return {year: int(total) for year, total, seen in zip(self.axes["years"], totals, self.present) if seen}
+
+    def shares(self, section, paper=None, year=None, measure="marks"):
+        """Share of each subject of a section in its total, for one year or all years"""
+        papers_slice = slice(None) if paper is None else self.paper_index[paper]
+        years_slice = slice(None) if year is None else year - self.first_year
+        subjects = papers.subjects_for(section)
+        first, stop = self.section_range[section]
+        starts = [self.subject_range[(section, subject)][0] - first for subject in subjects]
+        view = self.data[papers_slice, years_slice, first:stop, :, MEASURES.index(measure)]
+        per_label = view.reshape(-1, stop - first, view.shape[-1]).sum(axis=(0, 2))
+        per_subject = np.add.reduceat(per_label, starts) if starts else per_label[:0]
+        total = per_subject.sum()
+        return {subject: (float(value) / float(total) if total else 0.0) for subject, value in zip(subjects, per_subject)}
+
+    def flush(self, cube_dir=None):
+        """Persist the memory-mapped counts and the per-question coordinates"""
+        cube_dir = Path(cube_dir or CUBE_CONFIG["dir"])
+        self.data.flush()
+        ids = list(self.rows)
+        tmp_path = cube_dir / "cube_rows.tmp.npz"
+        np.savez(tmp_path, ids=np.array(ids, dtype=str),
+                 coordinates=np.array([self.rows[i] for i in ids], dtype=np.int32).reshape(-1, 5))
+        os.replace(tmp_path, cube_dir / "cube_rows.npz")
+        self.dirty = False
+
+def acquire_writer_lock(cube_dir):
+    """
+    Take the cube's single-writer lock for the rest of the process.
+
+    Returns:
+        bool: False if another process holds it (or locking is unavailable)
+    """
+    key = Path(cube_dir).resolve()
+    if key in writer_locks:
+        return True
+    if fcntl is None:
+        return False
+    f = open(key / "cube.lock", 'a')
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        return False
+    writer_locks[key] = f
+    return True
+
+def build(rows, cube_dir=None):
+    """
+    Write a new cube for rows and return it opened read-write.
+
+    Raises:
+        RuntimeError: If another process holds the writer lock
+    """
+    cube_dir = Path(cube_dir or CUBE_CONFIG["dir"])
+    cube_dir.mkdir(parents=True, exist_ok=True)
+    if not acquire_writer_lock(cube_dir):
+        raise RuntimeError(f"Another process is writing the analytics cube in {cube_dir}")
+    axes = taxonomy_axes()
+    shape = (len(axes["papers"]), len(axes["years"]), len(axes["labels"]), len(axes["question_types"]), len(MEASURES))
+
+    tmp_path = cube_dir / "cube.tmp.npy"
+    data = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.int32, shape=shape)
+    built = AnalyticsCube(axes, data)
+    started = time.perf_counter()
+    skipped = sum(not built.update(row) for row in rows)
+    data.flush()
+    counted = built.rows
+    del data, built
+    os.replace(tmp_path, cube_dir / "cube.npy")
+    with open(cube_dir / "cube_axes.json", 'w') as f:
+        json.dump(dict(axes, version=axes_version(axes)), f)
+
+    opened = open_cube(cube_dir, "r+")
+    opened.rows = counted
+    opened.flush(cube_dir)
+    logger.info(f"Built analytics cube {shape} from {len(opened.rows)} questions in "
+                f"{time.perf_counter() - started:.2f}s ({skipped} outside the axes)")
+    return opened
+
+def open_cube(cube_dir=None, mode="r"):
+    """Cube saved in cube_dir, or None if there is none for the current paper definitions"""
+    cube_dir = Path(cube_dir or CUBE_CONFIG["dir"])
+    if not (cube_dir / "cube.npy").exists():
+        return None
+    with open(cube_dir / "cube_axes.json") as f:
+        axes = json.load(f)
+    version = axes.pop("version")
+    if version != axes_version(taxonomy_axes()):
+        logger.warning(f"Analytics cube in {cube_dir} predates the current paper definitions; rebuild it")
+        return None
+    rows = {}
+    if (cube_dir / "cube_rows.npz").exists():
+        with np.load(cube_dir / "cube_rows.npz") as saved:
+            rows = {question_id: tuple(c) for question_id, c in zip(saved["ids"].tolist(),
+                                                                    saved["coordinates"].tolist())}
+    return AnalyticsCube(axes, np.load(cube_dir / "cube.npy", mmap_mode=mode), rows)
+
+def get_cube():
+    """
+    Process-wide writable cube, opened on first use. None unless live updates
+    are on, a cube has been built and this process got the writer lock.
+    """
+    global cube
+    with cube_lock:
+        if cube is None:
+            cube_dir = Path(CUBE_CONFIG["dir"])
+            if not CUBE_CONFIG["live_updates"] or not (cube_dir / "cube.npy").exists():
+                cube = False
+            elif not acquire_writer_lock(cube_dir):
+                logger.warning(f"Another process is writing the analytics cube in {cube_dir}; "
+                               f"labels from this run are counted at the next build")
+                cube = False
+            else:
+                cube = open_cube(cube_dir, "r+") or False
+    return cube or None
+
+def update_records(records):
+    """Count new or relabeled rows; a no-op unless get_cube() has a writable cube"""
+    opened = get_cube()
+    if opened:
+        with cube_lock:
+            for record in records:
+                opened.update(record)
+
+def flush():
+    with cube_lock:
+        if cube and cube.dirty:
+            cube.flush()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Year x label x question type count cube")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("build", help="rebuild the cube from PYQ")
+    trend_parser = commands.add_parser("trend", help="totals per year for a label prefix")
+    trend_parser.add_argument("--paper")
+    trend_parser.add_argument("--section")
+    trend_parser.add_argument("--subject")
+    trend_parser.add_argument("--topic")
+    trend_parser.add_argument("--type", dest="question_type")
+    trend_parser.add_argument("--measure", choices=MEASURES, default="marks")
+    shares_parser = commands.add_parser("shares", help="subject shares of a section")
+    shares_parser.add_argument("section")
+    shares_parser.add_argument("--paper")
+    shares_parser.add_argument("--year", type=int)
+    shares_parser.add_argument("--measure", choices=MEASURES, default="marks")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        pyq_db.init_connection_pool()
+        try:
+            build(pyq_db.fetch_rows())
+        except RuntimeError as e:
+            raise SystemExit(str(e))
+    else:
+        opened = open_cube()
+        if opened is None:
+            raise SystemExit("No analytics cube for the current paper definitions; run: python analytics_cube.py build")
+        started = time.perf_counter()
+        if args.command == "trend":
+            section = args.section or (papers.PAPERS_CONFIG["default_paper"] if args.subject else None)
+            result = opened.trend(paper=args.paper, section=section, subject=args.subject, topic=args.topic,
+                                  question_type=args.question_type, measure=args.measure)
+        else:
+            result = opened.shares(args.section, args.paper, args.year, args.measure)
+        elapsed_us = (time.perf_counter() - started) * 1e6
+        for key, value in result.items():
+            print(f"{key}: {value:.3f}" if isinstance(value, float) else f"{key}: {value}")
+        print(f"({elapsed_us:.0f} us)")
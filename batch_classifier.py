@@ -0,0 +1,268 @@
+import argparse
+import importlib
+import json
+import os
+import time
+import mysql.connector
+from openai import OpenAI
+from openai.types.chat import ChatCompletion
+import analytics_cube
+import dead_letter
+import llm_usage
+import near_duplicates
+import papers
+from pipeline_log import get_logger
+
+# Classifier module of each stage; labels are written through its store_label
+STAGES = {
+    "subject": "subjectClassiferLLAMA",
+    "topic": "topicClassiferLLAMA",
+}
+
+BATCH_CONFIG = {
+    "batch_dir": "batches",
+    "completion_window": "24h",
+    "poll_interval": 30,  # seconds between status checks
+}
+
+TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+logger = get_logger("batch")
+
+def record_custom_id(record):
+    """Stable id that ties a batch line back to its PYQ row"""
+    return f"{record['paper']}-{record['year']}-{record['page_number']}-{record['question_number']}"
+
+def record_key(record):
+    """Record key used by llm_usage, as in the online classifiers"""
+    return f"{record['paper']}/{record['year']}/{record['page_number']}/{record['question_number']}"
+
+def fetch_records(classifier, stage, relabel=False, paper_codes=None):
+    """
+    Records to submit: the stage's pending rows, or with relabel every row the
+    stage can label (for topics, every row with a subject), e.g. after a
+    syllabus change. Returns None if the rows could not be read.
+    """
+    classifier.PAPER_FILTER = paper_codes or None
+    if not relabel:
+        return classifier.get_unclassified_records()
+
+    conn = None
+    try:
+        conn = classifier.get_connection_from_pool()
+        if not conn:
+            return None
+        cursor = conn.cursor(dictionary=True)
+        conditions = ["subject IS NOT NULL"] if stage == "topic" else []
+        if paper_codes:
+            conditions.append(papers.paper_clause(paper_codes))
+        query = "SELECT * FROM PYQ"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        cursor.execute(query + " ORDER BY paper, year, page_number, question_number")
+        records = cursor.fetchall()
+        cursor.close()
+        return records
+    except mysql.connector.Error as e:
+        logger.error(f"Error retrieving records: {e}")
+        return None
+    finally:
+        if conn:
+            conn.close()
+
+def write_batch_file(classifier, records, batch_path):
+    """Write one chat completion request per record to a JSONL batch file"""
+    mode_arguments = classifier.code_mode_arguments() if classifier.OUTPUT_MODE == "code" else {}
+    written = 0
+    with open(batch_path, 'w') as f:
+        for record in records:
+            system_prompt, question_prompt, labels = classifier.construct_prompt(record)
+            if system_prompt is None or not labels:
+                logger.warning(f"Skipping {record_custom_id(record)}: no labels for this record")
+                continue
+
+            line = {
+                "custom_id": record_custom_id(record),
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": classifier.build_request(system_prompt, question_prompt, **mode_arguments),
+            }
+            f.write(json.dumps(line) + "\n")
+            written += 1
+
+    logger.info(f"Wrote {written} requests to {batch_path}")
+    return written
+
+def submit_batch(client, batch_path):
+    """Upload the batch file and create the batch, returns the batch id"""
+    with open(batch_path, 'rb') as f:
+        batch_file = client.files.create(file=f, purpose="batch")
+
+    batch = client.batches.create(
+        input_file_id=batch_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window=BATCH_CONFIG["completion_window"],
+    )
+    logger.info(f"Submitted batch {batch.id} (input file {batch_file.id})")
+    return batch.id
+
+def poll_batch(client, batch_id):
+    """Wait until the batch reaches a terminal status and return it"""
+    while True:
+        batch = client.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        if counts:
+            logger.info(f"Batch {batch_id}: {batch.status} ({counts.completed}/{counts.total} done, {counts.failed} failed)")
+        else:
+            logger.info(f"Batch {batch_id}: {batch.status}")
+
+        if batch.status in TERMINAL_STATUSES:
+            return batch
+        time.sleep(BATCH_CONFIG["poll_interval"])
+
+def apply_batch_results(stage, classifier, records, output_text, relabel=False):
+    """
+    Validate each batch response and write the label through the
+    classifier's store_label, so the near-duplicate index and analytics cube
+    see it as they do online labels. Every response is recorded in llm_usage
+    like an online call. When a subject relabel changes a row's subject, its
+    topic is cleared so the topic stage labels it again.
+
+    Returns:
+        tuple: (applied count, [(record, reason, last response)] of failures)
+    """
+    records_by_id = {record_custom_id(record): record for record in records}
+    model = classifier.PROVIDER_CONFIG.get("model")
+    applied = 0
+    failed = []
+
+    for line in output_text.splitlines():
+        if not line.strip():
+            continue
+        try:
+            result = json.loads(line)
+        except ValueError:
+            logger.warning(f"Skipping unreadable batch output line: {line[:200]!r}")
+            continue
+        record = records_by_id.get(result.get("custom_id"))
+        if record is None:
+            continue
+        llm_usage.set_record(record_key(record))
+
+        response = result.get("response") or {}
+        if result.get("error") or response.get("status_code") != 200:
+            llm_usage.record_call(stage, model, {}, None, "error")
+            failed.append((record, f"request error: {result.get('error')}", None))
+            continue
+
+        try:
+            completion = ChatCompletion.model_validate(response.get("body"))
+            choice = completion.choices[0]
+        except (ValueError, IndexError) as e:
+            llm_usage.record_call(stage, model, {}, None, "error")
+            failed.append((record, f"malformed response: {str(e)[:200]}", json.dumps(response.get("body"))[:2000]))
+            continue
+        _, _, labels = classifier.construct_prompt(record)
+        label = classifier.parse_label(choice.message.content or "", labels)
+        llm_usage.record_call(stage, completion.model or model, llm_usage.usage_from_openai(completion), None,
+                              "ok" if label else "invalid")
+        if not label:
+            failed.append((record, "invalid response", choice.message.content))
+            continue
+
+        confidence = classifier.code_confidence(choice) if classifier.OUTPUT_MODE == "code" else None
+        subject_changed = stage == "subject" and record.get('subject') != label
+        if not classifier.store_label(record, label, confidence):
+            failed.append((record, "database update failed", label))
+            continue
+        applied += 1
+
+        if relabel and subject_changed and record.get('topic'):
+            topic_classifier = importlib.import_module(STAGES["topic"])
+            if not topic_classifier.store_label(record, None):
+                logger.error(f"Could not clear the topic of {record_custom_id(record)} after its subject changed")
+
+    return applied, failed
+
+def run_batch(stage, batch_id=None, relabel=False, paper_codes=None):
+    """
+    Classify a stage's records through the Batch API.
+
+    Args:
+        stage: "subject" or "topic"
+        batch_id: Poll and apply an already submitted batch instead of submitting
+        relabel: Submit every labelable row instead of only unlabeled ones
+        paper_codes: Restrict to these papers, None for all
+    """
+    classifier = importlib.import_module(STAGES[stage])
+
+    classifier.init_connection_pool()
+    if not classifier.check_paper_column():
+        return
+    dead_letter.ensure_table(classifier.get_connection_from_pool)
+    records = fetch_records(classifier, stage, relabel, paper_codes)
+    if records is None:
+        logger.error("Could not read records from PYQ. Exiting.")
+        return
+    if not records:
+        logger.info("No records to classify. Exiting.")
+        return
+
+    client = OpenAI(
+        base_url=classifier.PROVIDER_CONFIG.get("base_url"),
+        api_key=classifier.PROVIDER_CONFIG.get("api_key"),
+    )
+
+    if batch_id is None:
+        os.makedirs(BATCH_CONFIG["batch_dir"], exist_ok=True)
+        batch_path = os.path.join(BATCH_CONFIG["batch_dir"], f"{stage}_{int(time.time())}.jsonl")
+        if not write_batch_file(classifier, records, batch_path):
+            return
+        batch_id = submit_batch(client, batch_path)
+        logger.info(f"Resume later with: --resume {batch_id} (and the same --relabel/--papers options)")
+
+    batch = poll_batch(client, batch_id)
+    if batch.status != "completed" or not batch.output_file_id:
+        logger.warning(f"Batch {batch_id} ended with status {batch.status}; nothing applied.")
+        return
+
+    output_text = client.files.content(batch.output_file_id).text
+    applied, failed = apply_batch_results(stage, classifier, records, output_text, relabel)
+
+    if batch.error_file_id:
+        records_by_id = {record_custom_id(record): record for record in records}
+        error_text = client.files.content(batch.error_file_id).text
+        for line in error_text.splitlines():
+            if line.strip():
+                result = json.loads(line)
+                record = records_by_id.get(result.get("custom_id"))
+                if record is not None:
+                    llm_usage.set_record(record_key(record))
+                    llm_usage.record_call(stage, classifier.PROVIDER_CONFIG.get("model"), {}, None, "error")
+                    failed.append((record, f"batch error: {result.get('error')}", None))
+
+    # Failed items go to the dead-letter table, as in the online classifiers
+    for record, reason, last_response in failed:
+        logger.warning(f"Not classified {record_custom_id(record)}: {reason}")
+        dead_letter.record_failure(classifier.get_connection_from_pool, record, stage, reason, last_response)
+    logger.info(f"Batch {stage} classification applied {applied}/{len(records)} records, {len(failed)} failed.")
+    if classifier.REUSE_NEAR_DUPLICATES:
+        near_duplicates.save_index()
+    analytics_cube.flush()
+    llm_usage.print_run_summary()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk classification through the Batch API")
+    parser.add_argument("stage", choices=sorted(STAGES))
+    parser.add_argument("--resume", metavar="BATCH_ID", help="poll and apply an already submitted batch")
+    parser.add_argument("--base-url", help="override PROVIDER_CONFIG base_url (e.g. a local mock_llm_server)")
+    parser.add_argument("--relabel", action="store_true",
+                        help="re-classify every row, not only unlabeled ones (e.g. after a syllabus change)")
+    parser.add_argument("--papers", help="comma-separated paper codes (default: all)")
+    args = parser.parse_args()
+
+    if args.base_url:
+        importlib.import_module(STAGES[args.stage]).PROVIDER_CONFIG["base_url"] = args.base_url
+
+    run_batch(args.stage, batch_id=args.resume, relabel=args.relabel,
+              paper_codes=args.papers.split(",") if args.papers else None)
@@ -0,0 +1,246 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import threading
+import time
+from pathlib import Path
+from PIL import Image
+
+import dead_letter
+import mock_llm_server
+import pipeline
+import questionTranscribe
+import subjectClassiferLLAMA
+import topicClassiferLLAMA
+from sqlite_pyq import SQLitePool
+
+# Offline benchmark: runs questionTranscribe.process_images and both
+# classifier main() paths against mock_llm_server and a SQLite PYQ, and
+# appends the results to BENCH_CONFIG["results_file"] for comparison over time.
+BENCH_CONFIG = {
+    "workdir": "bench_work",
+    "results_file": "bench_results.jsonl",
+    "fixtures": "output.json",
+    "latency": 0.2,
+    "latency_jitter": 0.1,
+    "error_rate": 0.02,
+    "rate_limit_rate": 0.03,
+    "seed": 0,
+}
+
+class CallTimer:
+    """Wraps a module function to record the latency of every call"""
+
+    def __init__(self, module, name):
+        self.module = module
+        self.name = name
+        self.original = getattr(module, name)
+        self.latencies = []
+        self.lock = threading.Lock()
+
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return self.original(*args, **kwargs)
+            finally:
+                with self.lock:
+                    self.latencies.append(time.perf_counter() - started)
+
+        setattr(module, name, timed)
+
+    def restore(self):
+        setattr(self.module, self.name, self.original)
+
+def percentile(samples, p):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+def latency_summary(latencies):
+    return {f"p{int(p * 100)}": round(percentile(latencies, p), 4) if latencies else None
+            for p in (0.5, 0.95, 0.99)}
+
+def server_stats():
+    with mock_llm_server.state_lock:
+        return dict(mock_llm_server.stats)
+
+def stats_delta(before, after):
+    return {key: after.get(key, 0) - before.get(key, 0) for key in after if after.get(key, 0) != before.get(key, 0)}
+
+def server_retries(server, kind, items):
+    """
+    Requests the mock server saw beyond one per item. Counted on the server so
+    the SDKs' own 429/5xx retries, which never reach the wrapped functions, are included.
+    """
+    return max(server.get(f"{kind}_requests", 0) - items, 0)
+
+def bench_transcription(workdir, server_url):
+    """Time process_images over one generated page image per fixture page"""
+    root = workdir / "gate_images"
+    year_dir = root / "2007"
+    year_dir.mkdir(parents=True)
+
+    for i in range(1, len(mock_llm_server.fixtures) + 1):
+        # Distinct pixel content so each image maps to its own fixture page
+        image = Image.new("L", (400, 560), 255)
+        image.putpixel((i, i), 0)
+        image.save(year_dir / f"2007_EE_{i:02d}.png")
+
+    questionTranscribe.GEMINI_CONFIG.update(
+        api_key="bench", transport="rest", client_options={"api_endpoint": server_url},
+    )
+    timer = CallTimer(questionTranscribe, "gemini_extract_question_data")
+    before = server_stats()
+    started = time.perf_counter()
+    try:
+        output = questionTranscribe.process_images(str(root), output_file=str(workdir / "transcribe.json"))
+    finally:
+        timer.restore()
+    wall = time.perf_counter() - started
+
+    pages = len(mock_llm_server.fixtures)
+    questions = sum(len(qs) for year in output.values() for qs in year.values() if isinstance(qs, list))
+    server = stats_delta(before, server_stats())
+    return {
+        "stage": "transcribe",
+        "items": pages,
+        "questions": questions,
+        "wall_s": round(wall, 3),
+        "questions_per_s": round(questions / wall, 3),
+        "latency_s": latency_summary(timer.latencies),
+        "calls": len(timer.latencies),
+        "retries": server_retries(server, "gemini", pages),
+        "db_round_trips": 0,
+        "server": server,
+    }
+
+def seed_pyq(pool):
+    """Load every fixture question into the SQLite PYQ table"""
+    records = []
+    for page_number, questions in enumerate(mock_llm_server.fixtures, start=1):
+        page = {'paper': 'EE', 'year': 2016, 'page_number': page_number}
+        records += [pipeline.question_record(page, q) for q in questions]
+
+    conn = pool.get_connection()
+    cursor = conn.cursor()
+    cursor.executemany(
+        """INSERT INTO PYQ (paper, year, page_number, question_number, section, question_text,
+                            question_type, option_a, option_b, option_c, option_d, has_diagram)
+           VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)""",
+        [(r['paper'], r['year'], r['page_number'], r['question_number'], r['section'], r['question_text'],
+          r['question_type'], r['option_a'], r['option_b'], r['option_c'], r['option_d'],
+          r['has_diagram']) for r in records]
+    )
+    conn.commit()
+    return len(records)
+
+def bench_classifier(stage, classifier, pool, server_url):
+    """Time a classifier's main() against the SQLite PYQ and mock server"""
+    classifier.connection_pool = pool
+    classifier.PROVIDER_CONFIG.update(base_url=server_url + "/v1", api_key="bench")
+    dead_letter.ensure_table(classifier.get_connection_from_pool)
+
+    pending = len(classifier.get_unclassified_records())
+    timer = CallTimer(classifier, "query_model")
+    before_trips = pool.round_trips
+    before = server_stats()
+    started = time.perf_counter()
+    try:
+        classifier.main()
+    finally:
+        timer.restore()
+    wall = time.perf_counter() - started
+    server = stats_delta(before, server_stats())
+
+    return {
+        "stage": stage,
+        "items": pending,
+        "questions": pending,
+        "wall_s": round(wall, 3),
+        "questions_per_s": round(pending / wall, 3) if wall else None,
+        "latency_s": latency_summary(timer.latencies),
+        "calls": len(timer.latencies),
+        "retries": server_retries(server, "chat", pending),
+        "db_round_trips": pool.round_trips - before_trips,
+        "server": server,
+    }
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+def run_benchmarks(config=BENCH_CONFIG, stages=("transcribe", "subject", "topic")):
+    workdir = Path(config["workdir"])
+    if workdir.exists():
+        shutil.rmtree(workdir)
+    workdir.mkdir(parents=True)
+
+    mock_llm_server.SERVER_CONFIG.update(
+        latency=config["latency"],
+        latency_jitter=config["latency_jitter"],
+        error_rate=config["error_rate"],
+        rate_limit_rate=config["rate_limit_rate"],
+        fixtures=config["fixtures"],
+        seed=config["seed"],
+    )
+    server = mock_llm_server.start_server(port=0)
+    server_url = f"http://127.0.0.1:{server.server_port}"
+
+    results = []
+    try:
+        if "transcribe" in stages:
+            results.append(bench_transcription(workdir, server_url))
+
+        pool = SQLitePool(str(workdir / "pyq.sqlite3"))
+        seed_pyq(pool)
+        if "subject" in stages:
+            results.append(bench_classifier("subject", subjectClassiferLLAMA, pool, server_url))
+        if "topic" in stages:
+            results.append(bench_classifier("topic", topicClassiferLLAMA, pool, server_url))
+    finally:
+        server.shutdown()
+
+    run = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "revision": git_revision(),
+        "config": config,
+        "results": results,
+    }
+    with open(config["results_file"], 'a') as f:
+        f.write(json.dumps(run) + "\n")
+    return run
+
+def print_report(run):
+    print(f"\nBenchmark at {run['timestamp']} (revision {run['revision']})")
+    print(f"{'stage':<11}{'items':>7}{'q/s':>9}{'p50':>8}{'p95':>8}{'p99':>8}{'calls':>7}{'retries':>9}{'db trips':>10}")
+    for r in run["results"]:
+        lat = r["latency_s"]
+        print(f"{r['stage']:<11}{r['items']:>7}{r['questions_per_s']:>9}"
+              f"{lat['p50'] or 0:>8.3f}{lat['p95'] or 0:>8.3f}{lat['p99'] or 0:>8.3f}"
+              f"{r['calls']:>7}{r['retries']:>9}{r['db_round_trips']:>10}")
+        if r["server"]:
+            print(f"{'':<11}server: {r['server']}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline pipeline throughput benchmark")
+    parser.add_argument("--stages", default="transcribe,subject,topic")
+    parser.add_argument("--latency", type=float, default=BENCH_CONFIG["latency"])
+    parser.add_argument("--latency-jitter", type=float, default=BENCH_CONFIG["latency_jitter"])
+    parser.add_argument("--error-rate", type=float, default=BENCH_CONFIG["error_rate"])
+    parser.add_argument("--rate-limit-rate", type=float, default=BENCH_CONFIG["rate_limit_rate"])
+    parser.add_argument("--fixtures", default=BENCH_CONFIG["fixtures"])
+    args = parser.parse_args()
+
+    config = dict(BENCH_CONFIG,
+                  latency=args.latency,
+                  latency_jitter=args.latency_jitter,
+                  error_rate=args.error_rate,
+                  rate_limit_rate=args.rate_limit_rate,
+                  fixtures=os.path.abspath(args.fixtures))
+    print_report(run_benchmarks(config, stages=tuple(args.stages.split(","))))
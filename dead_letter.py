@@ -0,0 +1,245 @@
+import argparse
+import importlib
+import re
+import time
+import mysql.connector
+from openai import OpenAI
+import rate_limit
+from pipeline_log import get_logger
+
+# Records that exhaust their retries in a classifier run land here, one row
+# per (question, stage). Main runs skip them; `redrive` retries them later
+# with a different model and several questions per prompt.
+# Tables created before multi-paper runs need:
+#   ALTER TABLE PYQ_DEAD_LETTER ADD paper VARCHAR(8) NOT NULL DEFAULT 'EE' FIRST,
+#       DROP PRIMARY KEY, ADD PRIMARY KEY (paper, year, page_number, question_number, stage);
+CREATE_TABLE_SQL = """CREATE TABLE IF NOT EXISTS PYQ_DEAD_LETTER (
+    paper VARCHAR(8) NOT NULL DEFAULT 'EE',
+    year INT NOT NULL,
+    page_number INT NOT NULL,
+    question_number INT NOT NULL,
+    stage VARCHAR(16) NOT NULL,
+    reason VARCHAR(255) NOT NULL,
+    last_response TEXT NULL,
+    attempts INT NOT NULL DEFAULT 0,
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (paper, year, page_number, question_number, stage)
+)"""
+
+# Classifier module and update function for each stage
+STAGES = {
+    "subject": ("subjectClassiferLLAMA", "update_subject"),
+    "topic": ("topicClassiferLLAMA", "update_topic"),
+}
+
+REDRIVE_CONFIG = {
+    "model": "deepseek/deepseek-chat",  # a different model than the main run
+    "batch_size": 5,  # questions per prompt
+    "delay": 5.0,  # seconds between prompts, keeps re-drive low priority
+    "max_attempts": 15,  # give up re-driving after this many total attempts
+}
+
+logger = get_logger("dead_letter")
+
+def skip_clause(stage):
+    """SQL predicate that excludes PYQ rows already dead-lettered for stage"""
+    return f"""NOT EXISTS (
+        SELECT 1 FROM PYQ_DEAD_LETTER d
+        WHERE d.paper = PYQ.paper AND d.year = PYQ.year AND d.page_number = PYQ.page_number
+          AND d.question_number = PYQ.question_number AND d.stage = '{stage}')"""
+
+def ensure_table(get_connection):
+    """Create the dead-letter table if it does not exist"""
+    conn = None
+    try:
+        conn = get_connection()
+        if not conn:
+            return
+        cursor = conn.cursor()
+        cursor.execute(CREATE_TABLE_SQL)
+        conn.commit()
+        cursor.close()
+    except mysql.connector.Error as e:
+        logger.error(f"Error creating dead-letter table: {e}")
+    finally:
+        if conn:
+            conn.close()
+
+def record_failure(get_connection, record, stage, reason, last_response=None, attempts=1):
+    """Add a record to the dead-letter table, or bump its attempt count"""
+    conn = None
+    try:
+        conn = get_connection()
+        if not conn:
+            return False
+        cursor = conn.cursor()
+        cursor.execute(
+            """INSERT INTO PYQ_DEAD_LETTER
+                   (paper, year, page_number, question_number, stage, reason, last_response, attempts)
+               VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+               ON DUPLICATE KEY UPDATE reason = VALUES(reason),
+                   last_response = VALUES(last_response),
+                   attempts = attempts + VALUES(attempts)""",
+            (record['paper'], record['year'], record['page_number'], record['question_number'],
+             stage, reason[:255], last_response, attempts)
+        )
+        conn.commit()
+        cursor.close()
+        return True
+    except mysql.connector.Error as e:
+        logger.error(f"Error writing dead letter: {e}")
+        if conn:
+            conn.rollback()
+        return False
+    finally:
+        if conn:
+            conn.close()
+
+def resolve(get_connection, record, stage):
+    """Remove a record from the dead-letter table after it was classified"""
+    conn = None
+    try:
+        conn = get_connection()
+        if not conn:
+            return
+        cursor = conn.cursor()
+        cursor.execute(
+            """DELETE FROM PYQ_DEAD_LETTER
+               WHERE paper = %s AND year = %s AND page_number = %s AND question_number = %s
+                 AND stage = %s""",
+            (record['paper'], record['year'], record['page_number'], record['question_number'], stage)
+        )
+        conn.commit()
+        cursor.close()
+    except mysql.connector.Error as e:
+        logger.error(f"Error resolving dead letter: {e}")
+    finally:
+        if conn:
+            conn.close()
+
+def fetch_dead_letters(get_connection, stage, max_attempts=None):
+    """PYQ rows dead-lettered for stage, with reason and attempts columns"""
+    conn = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor(dictionary=True)
+        query = """SELECT p.*, d.reason AS dl_reason, d.attempts AS dl_attempts
+                   FROM PYQ_DEAD_LETTER d
+                   JOIN PYQ p ON p.paper = d.paper AND p.year = d.year AND p.page_number = d.page_number
+                             AND p.question_number = d.question_number
+                   WHERE d.stage = %s"""
+        params = [stage]
+        if max_attempts is not None:
+            query += " AND d.attempts < %s"
+            params.append(max_attempts)
+        cursor.execute(query + " ORDER BY d.updated_at", params)
+        records = cursor.fetchall()
+        cursor.close()
+        return records
+    except mysql.connector.Error as e:
+        logger.error(f"Error retrieving dead letters: {e}")
+        return []
+    finally:
+        if conn:
+            conn.close()
+
+def construct_batch_prompt(stage, records, labels, format_question):
+    """One prompt asking for a label for each of several numbered questions"""
+    prompt = f"""You are an extremely precise classifier for GATE exam questions.
+For EACH numbered question below, choose the single, most appropriate {stage} from this list:
+{', '.join(labels)}
+Respond with exactly one line per question, in EXACTLY this format and nothing else:
+<{stage} id="QUESTION NUMBER">Your Chosen {stage.capitalize()}</{stage}>
+
+"""
+    for i, record in enumerate(records, start=1):
+        prompt += f"[{i}]\n{format_question(record)}\n"
+    return prompt
+
+def parse_batch_response(stage, response, count, labels):
+    """Map question number (1-based) to a valid label from a batched response"""
+    results = {}
+    for match in re.finditer(rf'<{stage} id="?(\d+)"?>(.*?)</{stage}>', response, re.DOTALL):
+        index, label = int(match.group(1)), match.group(2).strip()
+        if 1 <= index <= count and label in labels:
+            results[index] = label
+    return results
+
+def redrive(stage, model=None):
+    """Re-classify dead-lettered records with another model and batched prompts"""
+    module_name, update_name = STAGES[stage]
+    classifier = importlib.import_module(module_name)
+    update_fn = getattr(classifier, update_name)
+
+    classifier.init_connection_pool()
+    get_connection = classifier.get_connection_from_pool
+    records = fetch_dead_letters(get_connection, stage, REDRIVE_CONFIG["max_attempts"])
+    if not records:
+        logger.info(f"No dead-lettered {stage} records to re-drive.")
+        return
+
+    provider = dict(classifier.FALLBACK_PROVIDER_CONFIG, model=model or REDRIVE_CONFIG["model"])
+    client = OpenAI(base_url=provider["base_url"], api_key=provider["api_key"])
+
+    # Questions can only share a prompt if they share a label list
+    groups = {}
+    for record in records:
+        system_prompt, _, labels = classifier.construct_prompt(record)
+        if system_prompt is None or not labels:
+            record_failure(get_connection, record, stage, "redrive: no labels for record", attempts=1)
+            continue
+        groups.setdefault(tuple(labels), []).append(record)
+
+    resolved = 0
+    for labels, group in groups.items():
+        for start in range(0, len(group), REDRIVE_CONFIG["batch_size"]):
+            chunk = group[start:start + REDRIVE_CONFIG["batch_size"]]
+            prompt = construct_batch_prompt(stage, chunk, labels, classifier.format_question)
+            rate_limit.acquire(provider["base_url"])
+            try:
+                completion = client.chat.completions.create(
+                    model=provider["model"],
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=0.2,
+                )
+                response = completion.choices[0].message.content or ""
+            except Exception as e:
+                logger.warning(f"Re-drive API call failed: {e}")
+                response = ""
+
+            results = parse_batch_response(stage, response, len(chunk), labels)
+            for i, record in enumerate(chunk, start=1):
+                label = results.get(i)
+                if label and update_fn(record['paper'], record['year'], record['page_number'], record['question_number'], label):
+                    resolve(get_connection, record, stage)
+                    resolved += 1
+                else:
+                    reason = "redrive: invalid response" if response else "redrive: API error"
+                    record_failure(get_connection, record, stage, reason, response, attempts=1)
+
+            time.sleep(REDRIVE_CONFIG["delay"])
+
+    logger.info(f"Re-drive {stage} resolved {resolved}/{len(records)} dead-lettered records.")
+
+def list_dead_letters(stage):
+    """Print the dead-lettered records of a stage"""
+    classifier = importlib.import_module(STAGES[stage][0])
+    classifier.init_connection_pool()
+    records = fetch_dead_letters(classifier.get_connection_from_pool, stage)
+    for record in records:
+        print(f"paper={record['paper']}, year={record['year']}, page={record['page_number']}, question={record['question_number']}: "
+              f"{record['dl_reason']} ({record['dl_attempts']} attempts)")
+    print(f"{len(records)} dead-lettered {stage} records.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect and re-drive dead-lettered classifications")
+    parser.add_argument("command", choices=["list", "redrive"])
+    parser.add_argument("stage", choices=sorted(STAGES))
+    parser.add_argument("--model", help="model for re-drive (defaults to REDRIVE_CONFIG['model'])")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        list_dead_letters(args.stage)
+    else:
+        redrive(args.stage, model=args.model)
@@ -0,0 +1,306 @@
+import argparse
+import json
+import os
+import time
+from pathlib import Path
+
+import google.generativeai as genai
+import mysql.connector
+import numpy as np
+from PIL import Image
+
+import llm_usage
+import papers
+import pdf_image_extractor
+import pyq_db
+import questionTranscribe
+import rate_limit
+from pipeline_log import get_logger
+from tracing import span, traced
+
+# Crops the figure of each has_diagram question out of its page image and
+# saves it as a small palette-quantized PNG or WebP, linked from PYQ. Figures
+# are located locally with connected components on a downsampled ink mask
+# (tall components are figures, text lines stay short), or by asking Gemini
+# for per-question bounding boxes.
+# Requires: ALTER TABLE PYQ ADD diagram_image VARCHAR(255) NULL;
+DIAGRAM_CONFIG = {
+    "out_dir": "gate_images/diagrams",
+    "locator": "local",  # "local" or "gemini"
+    "format": "png",  # "png" or "webp"
+    "colors": 8,  # palette size; diagrams are line art
+    "ink_threshold": 160,  # gray levels below this count as ink
+    "downsample": 4,  # page pixels per mask cell
+    "dilate_x": 6,  # mask cells, joins the strokes of a figure
+    "dilate_y": 0,  # vertical dilation would merge text lines into paragraphs
+    "min_height_lines": 3.0,  # figure height in median component heights
+    "min_width": 20,  # mask cells
+    "merge_gap": 4,  # mask cells between boxes that belong to one figure
+    "padding": 12,  # page pixels around each crop
+}
+
+logger = get_logger("diagrams")
+
+def dilate(mask, dx, dy):
+    """Binary dilation by a (2*dy+1) x (2*dx+1) rectangle"""
+    out = mask.copy()
+    for shift in range(1, dx + 1):
+        out[:, shift:] |= mask[:, :-shift]
+        out[:, :-shift] |= mask[:, shift:]
+    rows = out.copy()
+    for shift in range(1, dy + 1):
+        out[shift:, :] |= rows[:-shift, :]
+        out[:-shift, :] |= rows[shift:, :]
+    return out
+
+def label_components(mask):
+    """
+    4-connected component labels of a boolean mask. Each pixel ends up with
+    the flat index of the first pixel of its component; background gets
+    mask.size. Min-label propagation with pointer jumping converges in a
+    number of passes roughly logarithmic in the component size.
+    """
+    background = mask.size
+    labels = np.where(mask, np.arange(mask.size).reshape(mask.shape), background)
+    while True:
+        merged = labels.copy()
+        np.minimum(merged[1:, :], labels[:-1, :], out=merged[1:, :])
+        np.minimum(merged[:-1, :], labels[1:, :], out=merged[:-1, :])
+        np.minimum(merged[:, 1:], labels[:, :-1], out=merged[:, 1:])
+        np.minimum(merged[:, :-1], labels[:, 1:], out=merged[:, :-1])
+        merged[~mask] = background
+
+        # A label is the index of a pixel in the same component, so adopt its label
+        flat = merged.ravel()
+        foreground = flat < background
+        flat[foreground] = flat[flat[foreground]]
+
+        if np.array_equal(merged, labels):
+            return labels
+        labels = merged
+
+def component_boxes(mask):
+    """(top, left, bottom, right) of each connected component, inclusive"""
+    labels = label_components(mask)
+    ys, xs = np.nonzero(mask)
+    if not len(ys):
+        return np.empty((0, 4), dtype=int)
+    _, inverse = np.unique(labels[ys, xs], return_inverse=True)
+    count = inverse.max() + 1
+    top = np.full(count, mask.shape[0]); left = np.full(count, mask.shape[1])
+    bottom = np.zeros(count, dtype=int); right = np.zeros(count, dtype=int)
+    np.minimum.at(top, inverse, ys)
+    np.minimum.at(left, inverse, xs)
+    np.maximum.at(bottom, inverse, ys)
+    np.maximum.at(right, inverse, xs)
+    return np.stack([top, left, bottom, right], axis=1)
+
+def merge_boxes(boxes, gap):
+    """Merge boxes that overlap horizontally and are at most gap apart vertically"""
+    merged = []
+    for box in sorted(boxes, key=lambda b: b[0]):
+        for other in merged:
+            if box[0] <= other[2] + gap and box[1] <= other[3] and box[3] >= other[1]:
+                other[:] = [min(other[0], box[0]), min(other[1], box[1]), max(other[2], box[2]), max(other[3], box[3])]
+                break
+        else:
+            merged.append([int(v) for v in box])
+    return merged
+
+@traced("diagram.locate")
+def local_figure_boxes(image):
+    """Figure boxes (left, top, right, bottom) in page pixels, top to bottom"""
+    c = DIAGRAM_CONFIG
+    f = c["downsample"]
+    gray = np.asarray(image.convert("L"))
+    h, w = gray.shape[0] // f * f, gray.shape[1] // f * f
+    ink = (gray[:h, :w] < c["ink_threshold"]).reshape(h // f, f, w // f, f).any(axis=(1, 3))
+    boxes = component_boxes(dilate(ink, c["dilate_x"], c["dilate_y"]))
+    if not len(boxes):
+        return []
+
+    heights = boxes[:, 2] - boxes[:, 0] + 1
+    widths = boxes[:, 3] - boxes[:, 1] + 1
+    line_height = np.median(heights)
+    figures = boxes[(heights >= c["min_height_lines"] * line_height) & (widths >= c["min_width"])]
+
+    pad = c["padding"]
+    return [
+        (max(left * f - pad, 0), max(top * f - pad, 0),
+         min((right + 1) * f + pad, gray.shape[1]), min((bottom + 1) * f + pad, gray.shape[0]))
+        for top, left, bottom, right in merge_boxes(figures, c["merge_gap"])
+    ]
+
+@traced("diagram.gemini_locate")
+def gemini_figure_boxes(image, question_numbers):
+    """Question number -> figure box (left, top, right, bottom) from Gemini"""
+    config = questionTranscribe.GEMINI_CONFIG
+    genai.configure(api_key=config["api_key"], transport=config["transport"], client_options=config["client_options"])
+    model = genai.GenerativeModel(
+        model_name=config["model"],
+        generation_config={"temperature": 0.0, "response_mime_type": "application/json"},
+    )
+    prompt = (
+        "This is a page of a GATE exam paper. For each of the questions "
+        f"{', '.join(str(n) for n in question_numbers)}, give the bounding box of its diagram, "
+        "circuit, figure, table or graph (not the question text or options). Respond with a JSON "
+        'list of {"question_number": <int>, "box_2d": [ymin, xmin, ymax, xmax]} with coordinates '
+        "normalized to 0-1000."
+    )
+
+    rate_limit.acquire((config["client_options"] or {}).get("api_endpoint", questionTranscribe.GEMINI_ENDPOINT))
+    started = time.monotonic()
+    try:
+        response = model.generate_content([image, prompt])
+    except Exception:
+        llm_usage.record_call("diagram", config["model"], {}, time.monotonic() - started, "error")
+        raise
+    llm_usage.record_call("diagram", config["model"], llm_usage.usage_from_gemini(response),
+                          time.monotonic() - started)
+
+    boxes = {}
+    pad = DIAGRAM_CONFIG["padding"]
+    for item in json.loads(response.text):
+        ymin, xmin, ymax, xmax = item["box_2d"]
+        boxes[int(item["question_number"])] = (
+            max(int(xmin * image.width / 1000) - pad, 0), max(int(ymin * image.height / 1000) - pad, 0),
+            min(int(xmax * image.width / 1000) + pad, image.width), min(int(ymax * image.height / 1000) + pad, image.height),
+        )
+    return boxes
+
+def diagram_path(record):
+    page = pdf_image_extractor.page_image_path(record['year'], record['page_number'], record['paper'])
+    return Path(DIAGRAM_CONFIG["out_dir"]) / record['paper'] / str(record['year']) / \
+        f"{page.stem}_q{record['question_number']}.{DIAGRAM_CONFIG['format']}"
+
+@traced("diagram.save")
+def save_crop(image, box, path):
+    """Save the box as a palette-quantized image, returns its size in bytes"""
+    crop = image.crop(box).convert("L").quantize(colors=DIAGRAM_CONFIG["colors"])
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if DIAGRAM_CONFIG["format"] == "webp":
+        # Lossless WebP keeps the small palette, so the quantized image is saved as is
+        crop.save(path, "WEBP", lossless=True, method=6)
+    else:
+        crop.save(path, "PNG", optimize=True)
+    return path.stat().st_size
+
+def crop_page(records):
+    """
+    Crop the diagrams of one page's has_diagram questions.
+
+    Returns:
+        dict: question_number -> saved crop path, for the questions whose figure was found
+    """
+    first = records[0]
+    page_path = pdf_image_extractor.page_image_path(first['year'], first['page_number'], first['paper'])
+    if not page_path.exists():
+        logger.warning(f"Page image {page_path} not found", extra={"record_id": str(page_path)})
+        return {}
+
+    with span("image.open"):
+        image = Image.open(page_path)
+        image.load()
+
+    records = sorted(records, key=lambda r: r['question_number'])
+    if DIAGRAM_CONFIG["locator"] == "gemini":
+        llm_usage.set_record(str(page_path))
+        boxes = gemini_figure_boxes(image, [r['question_number'] for r in records])
+    else:
+        # Figures and diagram questions both run top to bottom on the page
+        figures = local_figure_boxes(image)
+        if len(figures) != len(records):
+            logger.warning(f"Found {len(figures)} figures for {len(records)} diagram questions; skipping page",
+                           extra={"record_id": str(page_path)})
+            return {}
+        boxes = {r['question_number']: box for r, box in zip(records, figures)}
+
+    saved = {}
+    page_bytes = os.path.getsize(page_path)
+    for record in records:
+        box = boxes.get(record['question_number'])
+        if not box:
+            continue
+        path = diagram_path(record)
+        size = save_crop(image, box, path)
+        saved[record['question_number']] = str(path)
+        logger.debug(f"Saved {path} ({size} bytes, page {page_bytes} bytes)")
+    return saved
+
+def fetch_pending(paper_codes=None):
+    """has_diagram rows without a crop yet"""
+    conn = None
+    try:
+        conn = pyq_db.get_connection_from_pool()
+        cursor = conn.cursor(dictionary=True)
+        query = """SELECT paper, year, page_number, question_number FROM PYQ
+                   WHERE has_diagram AND diagram_image IS NULL"""
+        if paper_codes:
+            query += " AND " + papers.paper_clause(paper_codes)
+        cursor.execute(query + " ORDER BY paper, year, page_number, question_number")
+        records = cursor.fetchall()
+        cursor.close()
+        return records
+    except mysql.connector.Error as e:
+        logger.error(f"Error retrieving records: {e}")
+        return []
+    finally:
+        if conn:
+            conn.close()
+
+def store_paths(rows):
+    """Write (diagram_image, paper, year, page_number, question_number) rows to PYQ"""
+    conn = None
+    try:
+        conn = pyq_db.get_connection_from_pool()
+        cursor = conn.cursor()
+        cursor.executemany(
+            """UPDATE PYQ SET diagram_image = %s
+               WHERE paper = %s AND year = %s AND page_number = %s AND question_number = %s""",
+            rows
+        )
+        conn.commit()
+        cursor.close()
+        return True
+    except mysql.connector.Error as e:
+        logger.error(f"Error updating record: {e}")
+        if conn:
+            conn.rollback()
+        return False
+    finally:
+        if conn:
+            conn.close()
+
+def run(paper_codes=None):
+    """Crop every pending diagram, page by page"""
+    pages = {}
+    for record in fetch_pending(paper_codes):
+        pages.setdefault((record['paper'], record['year'], record['page_number']), []).append(record)
+
+    cropped = page_bytes = crop_bytes = 0
+    for (paper, year, page_number), records in pages.items():
+        try:
+            saved = crop_page(records)
+        except Exception as e:
+            logger.error(f"Error cropping {paper}/{year}/{page_number}: {e}")
+            continue
+        if not saved:
+            continue
+        store_paths([(path, paper, year, page_number, qn) for qn, path in saved.items()])
+        cropped += len(saved)
+        page_bytes += os.path.getsize(pdf_image_extractor.page_image_path(year, page_number, paper)) * len(saved)
+        crop_bytes += sum(os.path.getsize(path) for path in saved.values())
+
+    logger.info(f"Cropped {cropped} diagrams from {len(pages)} pages; {crop_bytes / max(cropped, 1):.0f} bytes "
+                f"per question instead of {page_bytes / max(cropped, 1):.0f} for the full page")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Crop question diagrams out of page images")
+    parser.add_argument("--papers", help="comma-separated paper codes (default: all)")
+    parser.add_argument("--locator", choices=["local", "gemini"], default=DIAGRAM_CONFIG["locator"])
+    parser.add_argument("--format", choices=["png", "webp"], default=DIAGRAM_CONFIG["format"])
+    args = parser.parse_args()
+
+    DIAGRAM_CONFIG.update(locator=args.locator, format=args.format)
+    pyq_db.init_connection_pool()
+    run(args.papers.split(",") if args.papers else None)
@@ -0,0 +1,119 @@
+import collections
+import concurrent.futures
+import contextvars
+import threading
+import time
+
+class HedgedCaller:
+    """
+    Runs a request against the primary provider and, if it has not returned
+    by the given latency percentile, sends the same request to a fallback
+    provider. The first valid result wins; the other request is cancelled if
+    it has not started yet and its result is discarded otherwise.
+
+    Args:
+        primary: Provider config passed to the request function first
+        fallback: Provider config used for the hedge request
+        percentile: Primary latency percentile (0-1) after which to hedge
+        max_hedge_rate: Upper bound on hedged calls as a fraction of all calls
+        min_samples: Primary latencies needed before the percentile is trusted
+        initial_delay: Hedge delay in seconds until min_samples is reached
+        max_workers: Threads available for in-flight requests
+    """
+
+    def __init__(self, primary, fallback, percentile=0.95, max_hedge_rate=0.1,
+                 min_samples=20, initial_delay=15.0, max_workers=40):
+        self.primary = primary
+        self.fallback = fallback
+        self.percentile = percentile
+        self.max_hedge_rate = max_hedge_rate
+        self.min_samples = min_samples
+        self.initial_delay = initial_delay
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+        self.latencies = collections.deque(maxlen=500)
+        self.lock = threading.Lock()
+        self.metrics = collections.Counter()
+
+    def hedge_delay(self):
+        """Current primary latency at the configured percentile"""
+        with self.lock:
+            samples = sorted(self.latencies)
+        if len(samples) < self.min_samples:
+            return self.initial_delay
+        index = min(len(samples) - 1, int(self.percentile * len(samples)))
+        return samples[index]
+
+    def _may_hedge(self):
+        with self.lock:
+            if self.metrics["hedges_sent"] + 1 > self.max_hedge_rate * max(self.metrics["calls"], 1):
+                self.metrics["hedges_skipped"] += 1
+                return False
+            self.metrics["hedges_sent"] += 1
+            return True
+
+    def _record_latency(self, started, future):
+        if not future.cancelled() and future.exception() is None:
+            with self.lock:
+                self.latencies.append(time.monotonic() - started)
+
+    def call(self, request_fn, is_valid):
+        """
+        Call request_fn(provider) with hedging.
+
+        Args:
+            request_fn: Function that performs the request for a provider config
+            is_valid: Predicate deciding whether a result can win
+
+        Returns:
+            The first valid result, or the last result if none is valid
+        """
+        with self.lock:
+            self.metrics["calls"] += 1
+
+        started = time.monotonic()
+        # Run requests in the caller's context so per-record context follows them
+        primary = self.executor.submit(contextvars.copy_context().run, request_fn, self.primary)
+        primary.add_done_callback(lambda f: self._record_latency(started, f))
+
+        try:
+            return primary.result(timeout=self.hedge_delay())
+        except concurrent.futures.TimeoutError:
+            pass
+
+        if not self._may_hedge():
+            return primary.result()
+
+        hedge = self.executor.submit(contextvars.copy_context().run, request_fn, self.fallback)
+        owners = {primary: "primary", hedge: "hedge"}
+        pending = {primary, hedge}
+        result = None
+
+        while pending:
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except Exception:
+                    continue
+                if is_valid(result):
+                    for other in pending:
+                        other.cancel()
+                    with self.lock:
+                        self.metrics[f"{owners[future]}_wins"] += 1
+                    return result
+
+        with self.lock:
+            self.metrics["no_valid_result"] += 1
+        return result
+
+    def summary(self):
+        """One-line hedge metrics summary"""
+        with self.lock:
+            m = dict(self.metrics)
+        calls = m.get("calls", 0)
+        sent = m.get("hedges_sent", 0)
+        return (f"Hedging: {calls} calls, {sent} hedged ({sent / max(calls, 1):.1%}), "
+                f"hedge won {m.get('hedge_wins', 0)}, primary won {m.get('primary_wins', 0)}, "
+                f"skipped by rate cap {m.get('hedges_skipped', 0)}, "
+                f"no valid result {m.get('no_valid_result', 0)}, "
+                f"current delay {self.hedge_delay():.2f}s")
@@ -0,0 +1,232 @@
+import argparse
+import atexit
+import contextvars
+import json
+import sqlite3
+import threading
+import time
+import uuid
+
+# Per-call LLM usage accounting. Calls are kept in memory during a run and
+# flushed to a local SQLite table; summaries can be printed or exported as
+# JSON or a Prometheus textfile.
+USAGE_CONFIG = {
+    "db_path": "llm_usage.sqlite3",
+}
+
+# USD per million tokens; update to your providers' current prices
+PRICING = {
+    "gemini-1.5-flash": {"input": 0.075, "output": 0.30, "cached": 0.01875},
+    "meta-llama/llama-3.1-70b-instruct": {"input": 0.12, "output": 0.30},
+    "meta-llama/llama-3.1-8b-instruct": {"input": 0.02, "output": 0.05},
+    "deepseek/deepseek-chat": {"input": 0.27, "output": 1.10, "cached": 0.07},
+}
+
+CREATE_TABLE_SQL = """CREATE TABLE IF NOT EXISTS llm_calls (
+    run_id TEXT NOT NULL,
+    ts REAL NOT NULL,
+    stage TEXT NOT NULL,
+    model TEXT,
+    record_key TEXT,
+    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+    completion_tokens INTEGER NOT NULL DEFAULT 0,
+    cached_tokens INTEGER NOT NULL DEFAULT 0,
+    image_tokens INTEGER NOT NULL DEFAULT 0,
+    latency_s REAL,
+    status TEXT NOT NULL
+)"""
+
+COLUMNS = ["run_id", "ts", "stage", "model", "record_key", "prompt_tokens", "completion_tokens",
+           "cached_tokens", "image_tokens", "latency_s", "status"]
+
+RUN_ID = time.strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6]
+
+# Record (question or page) the current call belongs to
+current_record = contextvars.ContextVar("current_record", default=None)
+
+pending_calls = []
+last_call = {}
+calls_lock = threading.Lock()
+
+def set_record(record_key):
+    """Attribute the following calls in this context to record_key"""
+    current_record.set(record_key)
+
+def usage_from_openai(completion):
+    """Token counts from an OpenAI-compatible chat completion"""
+    usage = getattr(completion, "usage", None)
+    if not usage:
+        return {}
+    details = getattr(usage, "prompt_tokens_details", None)
+    return {
+        "prompt_tokens": usage.prompt_tokens or 0,
+        "completion_tokens": usage.completion_tokens or 0,
+        "cached_tokens": (getattr(details, "cached_tokens", 0) or 0) if details else 0,
+    }
+
+def usage_from_gemini(response):
+    """Token counts from a Gemini generate_content response"""
+    usage = getattr(response, "usage_metadata", None)
+    if not usage:
+        return {}
+    image_tokens = 0
+    for detail in getattr(usage, "prompt_tokens_details", None) or []:
+        if "IMAGE" in str(getattr(detail, "modality", "")):
+            image_tokens += detail.token_count
+    return {
+        "prompt_tokens": usage.prompt_token_count or 0,
+        "completion_tokens": usage.candidates_token_count or 0,
+        "cached_tokens": getattr(usage, "cached_content_token_count", 0) or 0,
+        "image_tokens": image_tokens,
+    }
+
+def record_call(stage, model, usage, latency_s, status="ok"):
+    """
+    Record one LLM call.
+
+    Args:
+        stage: Pipeline stage ("transcribe", "subject", "topic", ...)
+        model: Model name the call went to
+        usage: Dict from usage_from_openai/usage_from_gemini (may be empty)
+        latency_s: Wall time of the call in seconds
+        status: "ok", "invalid" (response failed validation) or "error"
+    """
+    row = {
+        "run_id": RUN_ID,
+        "ts": time.time(),
+        "stage": stage,
+        "model": model,
+        "record_key": current_record.get(),
+        "prompt_tokens": usage.get("prompt_tokens", 0),
+        "completion_tokens": usage.get("completion_tokens", 0),
+        "cached_tokens": usage.get("cached_tokens", 0),
+        "image_tokens": usage.get("image_tokens", 0),
+        "latency_s": latency_s,
+        "status": status,
+    }
+    with calls_lock:
+        pending_calls.append(row)
+        last_call[(stage, row["record_key"])] = row
+
+def mark_invalid(stage):
+    """Mark the latest call of the current record as wasted on an invalid response"""
+    with calls_lock:
+        row = last_call.get((stage, current_record.get()))
+        if row and row["status"] == "ok":
+            row["status"] = "invalid"
+
+def _connect():
+    conn = sqlite3.connect(USAGE_CONFIG["db_path"], timeout=30)
+    conn.execute(CREATE_TABLE_SQL)
+    return conn
+
+def flush():
+    """Write the calls recorded so far to the usage table"""
+    with calls_lock:
+        rows = list(pending_calls)
+        pending_calls.clear()
+        last_call.clear()
+    if not rows:
+        return
+    conn = _connect()
+    with conn:
+        conn.executemany(
+            f"INSERT INTO llm_calls ({', '.join(COLUMNS)}) VALUES ({', '.join('?' for _ in COLUMNS)})",
+            [tuple(row[c] for c in COLUMNS) for row in rows]
+        )
+    conn.close()
+
+atexit.register(flush)
+
+def call_cost(row):
+    price = PRICING.get(row["model"])
+    if not price:
+        return 0.0
+    uncached = row["prompt_tokens"] - row["cached_tokens"]
+    return (uncached * price["input"]
+            + row["cached_tokens"] * price.get("cached", price["input"])
+            + row["completion_tokens"] * price["output"]) / 1_000_000
+
+def run_summary(run_id=None):
+    """Per-stage totals for a run (the current one by default)"""
+    flush()
+    conn = _connect()
+    conn.row_factory = sqlite3.Row
+    rows = [dict(r) for r in conn.execute("SELECT * FROM llm_calls WHERE run_id = ?", (run_id or RUN_ID,))]
+    conn.close()
+
+    stages = {}
+    for row in rows:
+        s = stages.setdefault(row["stage"], {
+            "calls": 0, "records": set(), "prompt_tokens": 0, "completion_tokens": 0,
+            "cached_tokens": 0, "image_tokens": 0, "wasted_tokens": 0, "invalid_calls": 0,
+            "error_calls": 0, "latency_s": 0.0, "cost_usd": 0.0,
+        })
+        tokens = row["prompt_tokens"] + row["completion_tokens"]
+        s["calls"] += 1
+        s["records"].add(row["record_key"])
+        for key in ("prompt_tokens", "completion_tokens", "cached_tokens", "image_tokens"):
+            s[key] += row[key]
+        s["latency_s"] += row["latency_s"] or 0.0
+        s["cost_usd"] += call_cost(row)
+        if row["status"] != "ok":
+            s["wasted_tokens"] += tokens
+            s[f"{row['status']}_calls"] += 1
+
+    for s in stages.values():
+        records = len(s.pop("records"))
+        s["records"] = records
+        s["retry_calls"] = s["calls"] - records
+        s["tokens_per_record"] = round((s["prompt_tokens"] + s["completion_tokens"]) / max(records, 1), 1)
+        s["cost_usd"] = round(s["cost_usd"], 6)
+        s["latency_s"] = round(s["latency_s"], 3)
+
+    return {"run_id": run_id or RUN_ID, "stages": stages}
+
+def print_run_summary(run_id=None):
+    summary = run_summary(run_id)
+    print(f"LLM usage for run {summary['run_id']}:")
+    for stage, s in summary["stages"].items():
+        print(f"  {stage}: {s['calls']} calls for {s['records']} records "
+              f"({s['retry_calls']} retries), {s['tokens_per_record']} tokens/record, "
+              f"{s['wasted_tokens']} wasted tokens, {s['latency_s']}s in calls, ${s['cost_usd']:.4f}")
+
+def export_json(path, run_id=None):
+    with open(path, 'w') as f:
+        json.dump(run_summary(run_id), f, indent=4)
+
+def export_prometheus(path, run_id=None):
+    """Write a node_exporter textfile-collector file for the run"""
+    summary = run_summary(run_id)
+    metrics = {
+        "calls": "gauge", "records": "gauge", "retry_calls": "gauge", "prompt_tokens": "gauge",
+        "completion_tokens": "gauge", "cached_tokens": "gauge", "image_tokens": "gauge",
+        "wasted_tokens": "gauge", "cost_usd": "gauge", "latency_s": "gauge",
+    }
+    lines = []
+    for metric, kind in metrics.items():
+        lines.append(f"# TYPE gate_llm_{metric} {kind}")
+        for stage, s in summary["stages"].items():
+            lines.append(f'gate_llm_{metric}{{run_id="{summary["run_id"]}",stage="{stage}"}} {s[metric]}')
+    with open(path, 'w') as f:
+        f.write("\n".join(lines) + "\n")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize recorded LLM usage")
+    parser.add_argument("--run", help="run id (defaults to the latest run)")
+    parser.add_argument("--json", help="also export the summary as JSON to this path")
+    parser.add_argument("--prom", help="also export a Prometheus textfile to this path")
+    args = parser.parse_args()
+
+    run_id = args.run
+    if run_id is None:
+        conn = _connect()
+        latest = conn.execute("SELECT run_id FROM llm_calls ORDER BY ts DESC LIMIT 1").fetchone()
+        conn.close()
+        run_id = latest[0] if latest else RUN_ID
+
+    print_run_summary(run_id)
+    if args.json:
+        export_json(args.json, run_id)
+    if args.prom:
+        export_prometheus(args.prom, run_id)
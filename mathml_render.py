@@ -0,0 +1,113 @@
+import html
+import json
+import os
+import re
+import threading
+
+try:
+    from latex2mathml.converter import convert as latex_to_mathml
+except ImportError:  # optional, without it export keeps raw MathJax
+    latex_to_mathml = None
+
+# Converts the inline \( ... \) and display \[ ... \] MathJax in question text
+# to MathML once at export time, so clients do not typeset on every view.
+# Conversions are memoized per expression (the same units and symbols repeat
+# thousands of times) and kept in a JSON cache between runs. Expressions that
+# fail to convert stay as TeX, so the client can still fall back to MathJax.
+MATHML_CONFIG = {
+    "cache_file": "mathml_cache.json",
+    "report_file": "mathml_failures.json",
+}
+
+MATH_PATTERN = re.compile(r'\\\((.+?)\\\)|\\\[(.+?)\\\]', re.DOTALL)
+
+cache = {}
+failures = {}
+stats = {"hits": 0, "misses": 0}
+cache_lock = threading.Lock()
+cache_loaded = False
+
+def available():
+    return latex_to_mathml is not None
+
+def load_cache():
+    """Read the expression cache written by earlier runs"""
+    global cache_loaded
+    with cache_lock:
+        if cache_loaded:
+            return
+        cache_loaded = True
+        if MATHML_CONFIG["cache_file"] and os.path.exists(MATHML_CONFIG["cache_file"]):
+            with open(MATHML_CONFIG["cache_file"]) as f:
+                cache.update(json.load(f))
+
+def save_cache():
+    if not MATHML_CONFIG["cache_file"]:
+        return
+    with cache_lock:
+        data = dict(cache)
+    tmp_path = MATHML_CONFIG["cache_file"] + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, separators=(",", ":"))
+    os.replace(tmp_path, MATHML_CONFIG["cache_file"])
+
+def render_expression(tex, display=False, source=None):
+    """MathML for one TeX expression, or None if it cannot be converted"""
+    key = ("D:" if display else "I:") + tex.strip()
+    with cache_lock:
+        if key in cache:
+            stats["hits"] += 1
+            return cache[key]
+        if key in failures:
+            failures[key]["count"] += 1
+            return None
+        stats["misses"] += 1
+
+    try:
+        mathml = latex_to_mathml(tex.strip(), display="block" if display else "inline")
+        error = None if mathml else "empty output"
+    except Exception as e:
+        mathml, error = None, f"{type(e).__name__}: {e}"
+
+    with cache_lock:
+        if error:
+            failure = failures.setdefault(key, {"tex": tex, "error": error, "count": 0, "examples": []})
+            failure["count"] += 1
+            if source and len(failure["examples"]) < 5:
+                failure["examples"].append(source)
+        else:
+            cache[key] = mathml
+    return mathml
+
+def render_text(text, source=None):
+    """Text as HTML with its math converted to MathML where possible"""
+    if not text:
+        return text
+    parts = []
+    position = 0
+    for match in MATH_PATTERN.finditer(text):
+        parts.append(html.escape(text[position:match.start()], quote=False))
+        inline, display = match.group(1), match.group(2)
+        mathml = render_expression(inline if inline is not None else display, display is not None, source)
+        parts.append(mathml or html.escape(match.group(0), quote=False))
+        position = match.end()
+    parts.append(html.escape(text[position:], quote=False))
+    return "".join(parts)
+
+def render_entry(entry):
+    """Copy of an export entry with its text and options rendered to HTML+MathML"""
+    entry = dict(entry)
+    entry["text"] = render_text(entry["text"], entry["id"])
+    if "options" in entry:
+        entry["options"] = [render_text(option, entry["id"]) for option in entry["options"]]
+    return entry
+
+def write_report(path=None):
+    """Write the expressions that failed to convert, most frequent first"""
+    path = path or MATHML_CONFIG["report_file"]
+    with cache_lock:
+        report = sorted(failures.values(), key=lambda f: -f["count"])
+        summary = dict(stats, cached=len(cache), failed=len(report))
+    with open(path, 'w') as f:
+        json.dump({"summary": summary, "failures": report}, f, indent=4)
+    return summary
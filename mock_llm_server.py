@@ -0,0 +1,323 @@
+import argparse
+import base64
+import collections
+import email.parser
+import json
+import random
+import re
+import threading
+import time
+import uuid
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-in for the OpenAI-compatible and Gemini APIs: chat completions,
+# the files/batches endpoints used by batch_classifier.py and Gemini
+# generateContent. Classifier answers are derived from the label list in the
+# prompt, so they always validate; Gemini answers replay pages from a fixture
+# file in the output.json shape.
+SERVER_CONFIG = {
+    "host": "127.0.0.1",
+    "port": 8765,
+    "batch_delay": 2.0,  # seconds before a submitted batch completes
+    "latency": 0.0,  # mean seconds added to each chat/Gemini response
+    "latency_jitter": 0.0,  # +/- uniform jitter around latency
+    "error_rate": 0.0,  # share of requests answered with HTTP 500
+    "rate_limit_rate": 0.0,  # share of requests answered with HTTP 429
+    "fixtures": "output.json",
+    "seed": 0,
+}
+
+files = {}
+batches = {}
+fixtures = []
+stats = collections.Counter()
+state_lock = threading.Lock()
+rng = random.Random(SERVER_CONFIG["seed"])
+
+def load_fixtures(path):
+    """
+    Page question lists from a file in the output.json shape. Pages are read
+    one at a time, so a truncated file still yields every complete page.
+    """
+    with open(path) as f:
+        text = f.read()
+
+    decoder = json.JSONDecoder()
+    pages = []
+    for match in re.finditer(r'"(\d+)":\s*\[', text):
+        try:
+            questions, _ = decoder.raw_decode(text, match.end() - 1)
+        except json.JSONDecodeError:
+            continue
+        if questions:
+            pages.append(questions)
+    return pages
+
+def inject_fault():
+    """Sleep for the configured latency and maybe pick an injected error status"""
+    with state_lock:
+        delay = SERVER_CONFIG["latency"] + rng.uniform(-1, 1) * SERVER_CONFIG["latency_jitter"]
+        roll = rng.random()
+    time.sleep(max(0.0, delay))
+
+    if roll < SERVER_CONFIG["rate_limit_rate"]:
+        return 429
+    if roll < SERVER_CONFIG["rate_limit_rate"] + SERVER_CONFIG["error_rate"]:
+        return 500
+    return None
+
+def gemini_response(body):
+    """generateContent response replaying a fixture page chosen from the image"""
+    image_data = b""
+    for content in body.get("contents", []):
+        for part in content.get("parts", []):
+            if "inlineData" in part:
+                image_data += base64.b64decode(part["inlineData"]["data"])
+
+    page = fixtures[zlib.crc32(image_data) % len(fixtures)] if fixtures else []
+    text = json.dumps(page)
+    return {
+        "candidates": [{
+            "content": {"parts": [{"text": text}], "role": "model"},
+            "finishReason": "STOP",
+            "index": 0,
+        }],
+        "usageMetadata": {
+            "promptTokenCount": 258 + 700,
+            "candidatesTokenCount": len(text) // 4,
+            "totalTokenCount": 958 + len(text) // 4,
+        },
+    }
+
+def pick_label(prompt):
+    """Deterministically choose one label from the prompt's label list"""
+    question = prompt.split("Question:", 1)[-1]
+    choice = zlib.crc32(question.encode())
+
+    if "Respond with ONLY the number" in prompt:
+        codes = re.findall(r'^(\d+)\. ', prompt, re.MULTILINE)
+        return codes[choice % len(codes)] if codes else "1"
+
+    tag_match = re.search(r'<(\w+)>Your Chosen', prompt)
+    list_match = re.search(r'(?:following list|following topics):\n(.*)\n', prompt)
+    if not tag_match or not list_match:
+        return "I am not sure."
+    labels = list_match.group(1).split(", ")
+    tag = tag_match.group(1)
+    return f"<{tag}>{labels[choice % len(labels)]}</{tag}>"
+
+def chat_completion(body):
+    """Build a chat completion response for a request body"""
+    prompt = "".join(m.get("content", "") for m in body.get("messages", []) if isinstance(m.get("content"), str))
+    answer = pick_label(prompt)
+
+    choice = {
+        "index": 0,
+        "finish_reason": "stop",
+        "message": {"role": "assistant", "content": answer},
+    }
+    if body.get("logprobs"):
+        top = [{"token": answer, "logprob": -0.05, "bytes": None}]
+        top += [{"token": str(i), "logprob": -3.0 - i, "bytes": None} for i in range(1, body.get("top_logprobs", 1))]
+        choice["logprobs"] = {"content": [{"token": answer, "logprob": -0.05, "bytes": None, "top_logprobs": top}]}
+
+    prompt_tokens = len(prompt) // 4
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "mock"),
+        "choices": [choice],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": max(1, len(answer) // 4),
+            "total_tokens": prompt_tokens + max(1, len(answer) // 4),
+        },
+    }
+
+def store_file(filename, purpose, data):
+    """Keep an uploaded or generated file in memory and return its metadata"""
+    file_id = f"file-{uuid.uuid4().hex[:12]}"
+    meta = {
+        "id": file_id,
+        "object": "file",
+        "bytes": len(data),
+        "created_at": int(time.time()),
+        "filename": filename,
+        "purpose": purpose,
+        "status": "processed",
+    }
+    with state_lock:
+        files[file_id] = (meta, data)
+    return meta
+
+def run_batch(batch_id):
+    """Answer every line of a batch input file and attach the output file"""
+    time.sleep(SERVER_CONFIG["batch_delay"])
+    with state_lock:
+        batch = batches[batch_id]
+        _, data = files[batch["input_file_id"]]
+
+    output_lines = []
+    for line in data.decode().splitlines():
+        if not line.strip():
+            continue
+        request = json.loads(line)
+        output_lines.append(json.dumps({
+            "id": f"batch_req_{uuid.uuid4().hex[:12]}",
+            "custom_id": request["custom_id"],
+            "response": {
+                "status_code": 200,
+                "request_id": uuid.uuid4().hex,
+                "body": chat_completion(request["body"]),
+            },
+            "error": None,
+        }))
+
+    output = store_file(f"{batch_id}_output.jsonl", "batch_output", ("\n".join(output_lines) + "\n").encode())
+    with state_lock:
+        batch.update({
+            "status": "completed",
+            "output_file_id": output["id"],
+            "completed_at": int(time.time()),
+            "request_counts": {"total": len(output_lines), "completed": len(output_lines), "failed": 0},
+        })
+
+def parse_multipart(content_type, body):
+    """Split a multipart/form-data body into {name: (filename, bytes)}"""
+    message = email.parser.BytesParser().parsebytes(
+        b"Content-Type: " + content_type.encode() + b"\r\n\r\n" + body
+    )
+    fields = {}
+    for part in message.get_payload():
+        name = part.get_param("name", header="content-disposition")
+        fields[name] = (part.get_filename(), part.get_payload(decode=True))
+    return fields
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def send_fault(self, status):
+        with state_lock:
+            stats[f"injected_{status}"] += 1
+        self.send_response(status)
+        body = json.dumps({"error": {"message": "injected fault", "code": status}}).encode()
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if status == 429:
+            self.send_header("Retry-After", "1")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        body = self.read_body()
+
+        if self.path.endswith("/chat/completions") or ":generateContent" in self.path:
+            kind = "chat" if self.path.endswith("/chat/completions") else "gemini"
+            with state_lock:
+                stats[f"{kind}_requests"] += 1
+            status = inject_fault()
+            if status:
+                self.send_fault(status)
+            elif kind == "chat":
+                self.send_json(200, chat_completion(json.loads(body)))
+            else:
+                self.send_json(200, gemini_response(json.loads(body)))
+
+        elif self.path.endswith("/files"):
+            fields = parse_multipart(self.headers["Content-Type"], body)
+            filename, data = fields["file"]
+            purpose = fields.get("purpose", (None, b"batch"))[1].decode()
+            self.send_json(200, store_file(filename, purpose, data))
+
+        elif self.path.endswith("/batches"):
+            request = json.loads(body)
+            batch_id = f"batch_{uuid.uuid4().hex[:12]}"
+            batch = {
+                "id": batch_id,
+                "object": "batch",
+                "endpoint": request["endpoint"],
+                "input_file_id": request["input_file_id"],
+                "completion_window": request["completion_window"],
+                "status": "in_progress",
+                "created_at": int(time.time()),
+                "output_file_id": None,
+                "error_file_id": None,
+                "request_counts": {"total": 0, "completed": 0, "failed": 0},
+            }
+            with state_lock:
+                batches[batch_id] = batch
+            threading.Thread(target=run_batch, args=(batch_id,), daemon=True).start()
+            self.send_json(200, batch)
+
+        else:
+            self.send_json(404, {"error": {"message": f"Unknown endpoint {self.path}"}})
+
+    def do_GET(self):
+        batch_match = re.search(r'/batches/([\w-]+)$', self.path)
+        content_match = re.search(r'/files/([\w-]+)/content$', self.path)
+
+        if batch_match and batch_match.group(1) in batches:
+            with state_lock:
+                self.send_json(200, dict(batches[batch_match.group(1)]))
+
+        elif content_match and content_match.group(1) in files:
+            _, data = files[content_match.group(1)]
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        else:
+            self.send_json(404, {"error": {"message": f"Unknown resource {self.path}"}})
+
+    def log_message(self, format, *args):
+        pass
+
+def start_server(host=None, port=None):
+    """Start the server on a background thread and return it"""
+    if not fixtures and SERVER_CONFIG["fixtures"]:
+        fixtures.extend(load_fixtures(SERVER_CONFIG["fixtures"]))
+    rng.seed(SERVER_CONFIG["seed"])
+    server = ThreadingHTTPServer(
+        (host or SERVER_CONFIG["host"], SERVER_CONFIG["port"] if port is None else port),
+        MockLLMHandler,
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible stand-in server")
+    parser.add_argument("--port", type=int, default=SERVER_CONFIG["port"])
+    parser.add_argument("--batch-delay", type=float, default=SERVER_CONFIG["batch_delay"])
+    parser.add_argument("--latency", type=float, default=SERVER_CONFIG["latency"])
+    parser.add_argument("--latency-jitter", type=float, default=SERVER_CONFIG["latency_jitter"])
+    parser.add_argument("--error-rate", type=float, default=SERVER_CONFIG["error_rate"])
+    parser.add_argument("--rate-limit-rate", type=float, default=SERVER_CONFIG["rate_limit_rate"])
+    parser.add_argument("--fixtures", default=SERVER_CONFIG["fixtures"])
+    args = parser.parse_args()
+
+    SERVER_CONFIG.update(
+        batch_delay=args.batch_delay,
+        latency=args.latency,
+        latency_jitter=args.latency_jitter,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        fixtures=args.fixtures,
+    )
+    fixtures.extend(load_fixtures(args.fixtures))
+    server = ThreadingHTTPServer((SERVER_CONFIG["host"], args.port), MockLLMHandler)
+    print(f"Mock LLM server listening on http://{SERVER_CONFIG['host']}:{args.port}/v1 "
+          f"({len(fixtures)} fixture pages)")
+    server.serve_forever()
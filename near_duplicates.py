@@ -0,0 +1,444 @@
+import argparse
+import contextlib
+import functools
+import os
+import re
+import threading
+import time
+import zlib
+from collections import Counter
+
+import numpy as np
+
+import papers
+import pyq_db
+import question_text
+from pipeline_log import get_logger
+
+try:
+    import fcntl
+except ImportError:  # no flock on Windows; saves are then not serialized across processes
+    fcntl = None
+
+# MinHash + LSH index of near-duplicate questions across years. Each question
+# (text and options, tokenized like the search index, numbers masked so a
+# reused pattern with new values still matches) becomes a set of token
+# shingles and a num_perm MinHash signature. Signatures are split into bands;
+# questions sharing any band are candidates, and candidates whose estimated
+# Jaccard similarity reaches "threshold" are linked into clusters. Rows are
+# added one at a time as they land in PYQ and the index is kept in index_file.
+# Several processes may save it (pipeline, classifiers, build); saves take a
+# lock file next to index_file and merge what others saved in the meantime.
+NEAR_DUP_CONFIG = {
+    "index_file": "near_duplicates.npz",
+    "num_perm": 128,
+    "bands": 32,  # 4 rows per band: pairs above ~0.5 similarity almost always share a band
+    "shingle_size": 3,
+    "mask_numbers": True,
+    "seed": 1,
+    "threshold": 0.6,  # estimated Jaccard similarity for "similar questions"
+    "reuse_threshold": 0.85,  # similarity needed to copy a subject/topic label
+}
+
+# Prime just above 2**32, so (a * x + b) fits in uint64 for a < 2**31 and 32-bit x
+HASH_PRIME = np.uint64(4294967311)
+
+NUMBER_PATTERN = re.compile(r'^\d+(?:\.\d+)?$')
+
+STAGES = ("subject", "topic")
+
+logger = get_logger("near_duplicates")
+
+index = None
+index_lock = threading.Lock()
+
+def shingles(row, shingle_size=None, mask_numbers=None):
+    """Set of crc32 hashes of the token n-grams of a question's text and options"""
+    shingle_size = shingle_size or NEAR_DUP_CONFIG["shingle_size"]
+    mask_numbers = NEAR_DUP_CONFIG["mask_numbers"] if mask_numbers is None else mask_numbers
+    tokens = question_text.tokenize(question_text.document_text(row))
+    if mask_numbers:
+        tokens = ["#" if NUMBER_PATTERN.match(t) else t for t in tokens]
+    if len(tokens) < shingle_size:
+        grams = tokens
+    else:
+        grams = [" ".join(tokens[i:i + shingle_size]) for i in range(len(tokens) - shingle_size + 1)]
+    return {zlib.crc32(gram.encode("utf-8")) for gram in grams}
+
+def text_hash(row):
+    return zlib.crc32(question_text.document_text(row).encode("utf-8"))
+
+class NearDuplicateIndex:
+    """
+    In-memory MinHash/LSH index. Lookups hash the query once and probe one
+    dict per band; cluster members are kept per union-find root, so
+    cluster() is a dict lookup. Not thread-safe, see get_index().
+    """
+
+    def __init__(self, config=NEAR_DUP_CONFIG):
+        self.num_perm = config["num_perm"]
+        self.bands = config["bands"]
+        self.rows_per_band = self.num_perm // self.bands
+        self.shingle_size = config["shingle_size"]
+        self.mask_numbers = config["mask_numbers"]
+        self.seed = config["seed"]
+        self.threshold = config["threshold"]
+
+        rng = np.random.default_rng(self.seed)
+        self.a = rng.integers(1, 2 ** 31, self.num_perm, dtype=np.uint64)[:, None]
+        self.b = rng.integers(0, 2 ** 31, self.num_perm, dtype=np.uint64)[:, None]
+
+        self.ids = []
+        self.positions = {}
+        self.signatures = np.empty((0, self.num_perm), dtype=np.uint64)
+        self.count = 0
+        self.meta = []  # per doc: {"section", "subject", "topic", "hash"}
+        self.buckets = [{} for _ in range(self.bands)]
+        self.parent = []
+        self.members = {}
+        self.dirty = False
+        self.touched = set()  # ids added or relabeled since the last load or save
+
+    def params(self):
+        return np.array([self.num_perm, self.bands, self.shingle_size, int(self.mask_numbers), self.seed])
+
+    def signature(self, row):
+        """MinHash signature of a row, or None if it has no text"""
+        hashes = shingles(row, self.shingle_size, self.mask_numbers)
+        if not hashes:
+            return None
+        x = np.fromiter(hashes, dtype=np.uint64, count=len(hashes))[None, :]
+        return ((self.a * x + self.b) % HASH_PRIME).min(axis=1)
+
+    def _band_keys(self, signature):
+        r = self.rows_per_band
+        return [signature[i * r:(i + 1) * r].tobytes() for i in range(self.bands)]
+
+    def _matches(self, signature, min_similarity, exclude=None):
+        """(doc, estimated similarity) of candidates at or above min_similarity"""
+        candidates = set()
+        for bucket, key in zip(self.buckets, self._band_keys(signature)):
+            candidates.update(bucket.get(key, ()))
+        candidates.discard(exclude)
+        if not candidates:
+            return []
+        docs = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+        similarity = (self.signatures[docs] == signature).mean(axis=1)
+        keep = similarity >= min_similarity
+        return sorted(zip(docs[keep].tolist(), similarity[keep].tolist()), key=lambda m: -m[1])
+
+    def _find(self, doc):
+        while self.parent[doc] != doc:
+            self.parent[doc] = self.parent[self.parent[doc]]
+            doc = self.parent[doc]
+        return doc
+
+    def _union(self, x, y):
+        x, y = self._find(x), self._find(y)
+        if x == y:
+            return
+        if len(self.members[x]) < len(self.members[y]):
+            x, y = y, x
+        self.parent[y] = x
+        self.members[x].extend(self.members.pop(y))
+
+    def _append(self, question_id, signature, meta):
+        doc = self.count
+        if doc == len(self.signatures):
+            grown = np.empty((max(64, 2 * doc), self.num_perm), dtype=np.uint64)
+            grown[:doc] = self.signatures[:doc]
+            self.signatures = grown
+        self.signatures[doc] = signature
+        self.count += 1
+        self.ids.append(question_id)
+        self.positions[question_id] = doc
+        self.meta.append(meta)
+        self.parent.append(doc)
+        self.members[doc] = [doc]
+
+        for match, _ in self._matches(signature, self.threshold, exclude=doc):
+            self._union(doc, match)
+        for bucket, key in zip(self.buckets, self._band_keys(signature)):
+            bucket.setdefault(key, []).append(doc)
+        return doc
+
+    def add(self, row):
+        """
+        Index a PYQ row. Rows already indexed only get their section and
+        labels refreshed; a changed text is picked up by a full rebuild.
+
+        Returns:
+            bool: True if the row was new to the index
+        """
+        question_id = pyq_db.question_id(row)
+        doc = self.positions.get(question_id)
+        if doc is not None:
+            meta = self.meta[doc]
+            for key in ("section", "subject", "topic"):
+                if key in row and row[key] != meta[key]:
+                    meta[key] = row[key]
+                    self.dirty = True
+                    self.touched.add(question_id)
+            return False
+
+        signature = self.signature(row)
+        if signature is None:
+            return False
+        meta = {"section": row.get("section"), "subject": row.get("subject"), "topic": row.get("topic"),
+                "hash": text_hash(row)}
+        self._append(question_id, signature, meta)
+        self.dirty = True
+        self.touched.add(question_id)
+        return True
+
+    def set_label(self, question_id, stage, label):
+        doc = self.positions.get(question_id)
+        if doc is not None and self.meta[doc][stage] != label:
+            self.meta[doc][stage] = label
+            self.dirty = True
+            self.touched.add(question_id)
+
+    def merge(self, saved):
+        """
+        Take in what another process saved: questions this index lacks, and
+        the labels of questions it has not changed itself since loading.
+        """
+        for doc, question_id in enumerate(saved.ids):
+            own = self.positions.get(question_id)
+            if own is None:
+                self._append(question_id, saved.signatures[doc], dict(saved.meta[doc]))
+            elif question_id not in self.touched:
+                for key in ("section", "subject", "topic"):
+                    self.meta[own][key] = saved.meta[doc][key]
+
+    def cluster(self, question_id):
+        """Ids of the near-duplicate cluster of an indexed question, itself excluded"""
+        doc = self.positions.get(question_id)
+        if doc is None:
+            return []
+        return [self.ids[member] for member in sorted(self.members[self._find(doc)]) if member != doc]
+
+    def similar(self, row, min_similarity=None):
+        """Indexed questions similar to a row (indexed or not) as (id, similarity) pairs"""
+        question_id = pyq_db.question_id(row)
+        doc = self.positions.get(question_id)
+        signature = self.signatures[doc] if doc is not None else self.signature(row)
+        if signature is None:
+            return []
+        matches = self._matches(signature, self.threshold if min_similarity is None else min_similarity, exclude=doc)
+        return [(self.ids[match], round(similarity, 3)) for match, similarity in matches]
+
+    def reusable_label(self, row, stage, min_similarity):
+        """
+        Label of a row's near duplicates for stage ("subject" or "topic").
+        Only labeled duplicates in the same section count (for topics also
+        with the same subject), and the label must exist in the current
+        taxonomy. The most common label wins, ties go to the closest match.
+
+        Returns:
+            tuple: (label, source id, similarity), or None
+        """
+        question_id = pyq_db.question_id(row)
+        doc = self.positions.get(question_id)
+        signature = self.signatures[doc] if doc is not None else self.signature(row)
+        if signature is None:
+            return None
+
+        section = row.get("section")
+        if stage == "subject":
+            allowed = set(papers.subjects_for(section))
+        else:
+            allowed = set(papers.topics_for(section, row.get("subject")) or ())
+
+        votes = Counter()
+        best = {}
+        for match, similarity in self._matches(signature, min_similarity, exclude=doc):
+            meta = self.meta[match]
+            label = meta[stage]
+            if not label or label not in allowed or meta["section"] != section:
+                continue
+            if stage == "topic" and meta["subject"] != row.get("subject"):
+                continue
+            votes[label] += 1
+            best.setdefault(label, (self.ids[match], round(similarity, 3)))
+        if not votes:
+            return None
+        label = max(votes, key=lambda l: (votes[l], best[l][1]))
+        return (label,) + best[label]
+
+    def stats(self):
+        sizes = [len(members) for members in self.members.values() if len(members) > 1]
+        return {"questions": self.count, "clusters": len(sizes), "clustered": sum(sizes),
+                "largest": max(sizes, default=0)}
+
+    def save(self, path=None):
+        path = path or NEAR_DUP_CONFIG["index_file"]
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f,
+                params=self.params(),
+                ids=np.array(self.ids, dtype=str),
+                signatures=self.signatures[:self.count],
+                sections=np.array([m["section"] or "" for m in self.meta], dtype=str),
+                subjects=np.array([m["subject"] or "" for m in self.meta], dtype=str),
+                topics=np.array([m["topic"] or "" for m in self.meta], dtype=str),
+                hashes=np.array([m["hash"] for m in self.meta], dtype=np.uint32),
+            )
+        os.replace(tmp_path, path)
+        self.dirty = False
+        self.touched.clear()
+
+    @classmethod
+    def load(cls, path=None, config=NEAR_DUP_CONFIG):
+        """Index saved at path; empty if the file is missing or was built with other parameters"""
+        path = path or config["index_file"]
+        loaded = cls(config)
+        if not os.path.exists(path):
+            return loaded
+        with np.load(path) as data:
+            if not np.array_equal(data["params"], loaded.params()):
+                logger.warning(f"{path} was built with different MinHash parameters; starting a new index")
+                return loaded
+            columns = [data[name].tolist() for name in ("ids", "sections", "subjects", "topics", "hashes")]
+            signatures = data["signatures"]
+        # Buckets and clusters are rebuilt rather than stored; this is one pass of band lookups
+        for i, (question_id, section, subject, topic, hash_value) in enumerate(zip(*columns)):
+            meta = {"section": section or None, "subject": subject or None, "topic": topic or None,
+                    "hash": hash_value}
+            loaded._append(question_id, signatures[i], meta)
+        return loaded
+
+def get_index():
+    """Process-wide index, loaded from NEAR_DUP_CONFIG["index_file"] on first use"""
+    global index
+    with index_lock:
+        if index is None:
+            index = NearDuplicateIndex.load()
+    return index
+
+def add_rows(rows):
+    """Index rows as they are stored; returns how many were new"""
+    loaded = get_index()
+    with index_lock:
+        return sum(loaded.add(row) for row in rows)
+
+def reused_label(record, stage):
+    """Label to copy from a near duplicate of record instead of asking the model, or None"""
+    loaded = get_index()
+    with index_lock:
+        reuse = loaded.reusable_label(record, stage, NEAR_DUP_CONFIG["reuse_threshold"])
+    if not reuse:
+        return None
+    label, source, similarity = reuse
+    logger.info(f"Reusing {stage} '{label}' from {source} (similarity {similarity})",
+                extra={"record_id": pyq_db.question_id(record)})
+    return label
+
+def record_label(record, stage, label):
+    """Keep the in-memory index in step with a label written to PYQ"""
+    loaded = get_index()
+    with index_lock:
+        loaded.set_label(pyq_db.question_id(record), stage, label)
+
+@contextlib.contextmanager
+def writer_lock(path=None):
+    """Hold the index file's lock, so one process at a time reads, merges and writes it"""
+    path = path or NEAR_DUP_CONFIG["index_file"]
+    if fcntl is None:
+        yield
+        return
+    with open(path + ".lock", 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def save_index():
+    """Merge in other processes' saves and write the index, if it changed since it was loaded or saved"""
+    with index_lock:
+        if index is not None and index.dirty:
+            with writer_lock():
+                index.merge(NearDuplicateIndex.load())
+                index.save()
+            logger.info(f"Saved near-duplicate index: {index.stats()}")
+
+def build(paper_codes=None, full=False):
+    """Bring the index up to date with PYQ, starting over when full or when texts changed"""
+    global index
+    rows = pyq_db.fetch_rows(paper_codes)
+    # Load and save under one writer lock; a rebuild must not merge back what it dropped
+    with index_lock, writer_lock():
+        loaded = NearDuplicateIndex() if full else NearDuplicateIndex.load()
+        changed = [row for row in rows
+                   if pyq_db.question_id(row) in loaded.positions
+                   and loaded.meta[loaded.positions[pyq_db.question_id(row)]]["hash"] != text_hash(row)]
+        if changed:
+            logger.info(f"{len(changed)} indexed questions changed text; rebuilding the index")
+            loaded = NearDuplicateIndex()
+        started = time.perf_counter()
+        added = sum(loaded.add(row) for row in rows)
+        elapsed = time.perf_counter() - started
+        index = loaded
+        if loaded.dirty:
+            loaded.save()
+    logger.info(f"Indexed {added} new questions in {elapsed:.2f}s")
+    return loaded
+
+def reuse_labels(stage, rows, update):
+    """
+    Copy labels onto unlabeled rows from their labeled near duplicates.
+
+    Args:
+        stage: "subject" or "topic"
+        rows: PYQ rows to consider, e.g. from pyq_db.fetch_rows
+        update: Called as update(paper, year, page_number, question_number,
+            label) and returning True on success, e.g. a classifier's
+            update_subject/update_topic
+    """
+    copied = 0
+    for row in rows:
+        if row[stage] or (stage == "topic" and not row["subject"]):
+            continue
+        label = reused_label(row, stage)
+        if label and update(row["paper"], row["year"], row["page_number"], row["question_number"], label):
+            record_label(row, stage, label)
+            copied += 1
+    save_index()
+    logger.info(f"Copied {stage} labels onto {copied} questions")
+    return copied
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Near-duplicate questions across years (MinHash + LSH)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_parser = commands.add_parser("build", help="index PYQ rows not yet in the index")
+    build_parser.add_argument("--papers", help="comma-separated paper codes (default: all)")
+    build_parser.add_argument("--full", action="store_true", help="rebuild from scratch")
+    similar_parser = commands.add_parser("similar", help="show the cluster of a question id, e.g. EE-2016-4-7")
+    similar_parser.add_argument("question_id")
+    reuse_parser = commands.add_parser("reuse", help="copy labels from near duplicates onto unlabeled rows")
+    reuse_parser.add_argument("stage", choices=STAGES)
+    reuse_parser.add_argument("--papers", help="comma-separated paper codes (default: all)")
+    commands.add_parser("stats", help="index and cluster counts")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        pyq_db.init_connection_pool()
+        print(build(args.papers.split(",") if args.papers else None, args.full).stats())
+    elif args.command == "similar":
+        loaded = get_index()
+        started = time.perf_counter()
+        members = loaded.cluster(args.question_id)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if args.question_id not in loaded.positions:
+            print(f"{args.question_id} is not indexed")
+        for member in members:
+            print(member)
+        print(f"{len(members)} similar questions in {elapsed_ms:.3f} ms")
+    elif args.command == "reuse":
+        pyq_db.init_connection_pool()
+        reuse_labels(args.stage, pyq_db.fetch_rows(args.papers.split(",") if args.papers else None),
+                     functools.partial(pyq_db.update_label, args.stage))
+    else:
+        print(get_index().stats())
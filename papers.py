@@ -0,0 +1,98 @@
+import json
+import os
+import re
+import threading
+from pathlib import Path
+
+# Paper definitions (EE, CS, EC, ...) live in one JSON file per paper under
+# PAPERS_CONFIG["paper_dir"]: code, name, pdf_glob, the subject list and a
+# subject -> topic -> description taxonomy. GA.json holds the General
+# Aptitude section every paper shares; it has no PDFs of its own.
+PAPERS_CONFIG = {
+    "paper_dir": os.path.join(os.path.dirname(os.path.abspath(__file__)), "papers"),
+    "shared_section": "GA",
+    "default_paper": "EE",  # paper of rows and files that predate multi-paper runs
+}
+
+papers = None
+papers_lock = threading.Lock()
+
+def load_papers():
+    """All paper definitions by code, read once per process"""
+    global papers
+    with papers_lock:
+        if papers is None:
+            loaded = {}
+            for path in sorted(Path(PAPERS_CONFIG["paper_dir"]).glob("*.json")):
+                with open(path) as f:
+                    paper = json.load(f)
+                loaded[paper["code"]] = paper
+            papers = loaded
+    return papers
+
+def get_paper(code):
+    """Paper definition for code, or None if there is no such paper"""
+    return load_papers().get(code)
+
+def pdf_papers(codes=None):
+    """
+    Papers that have question PDFs, optionally restricted to codes.
+
+    Raises:
+        ValueError: If a requested code has no paper definition
+    """
+    available = {code: p for code, p in load_papers().items() if p.get("pdf_glob")}
+    if not codes:
+        return list(available.values())
+    unknown = [code for code in codes if code not in available]
+    if unknown:
+        raise ValueError(f"Unknown paper(s): {', '.join(unknown)}. Available: {', '.join(sorted(available))}")
+    return [available[code] for code in codes]
+
+def subjects_for(section):
+    """Subject list of a section (a paper code or GA)"""
+    paper = get_paper(section)
+    return paper.get("subjects", []) if paper else []
+
+def topics_for(section, subject):
+    """Topic -> description mapping of a subject in a section, or None"""
+    paper = get_paper(section)
+    return paper.get("topics", {}).get(subject) if paper else None
+
+def infer_section(paper_code, year, question_number):
+    """
+    General Aptitude questions by position: Q56-65 from 2010 to 2015 and
+    Q1-10 from 2016 onwards. Papers before 2010 have no GA section.
+    """
+    if year >= 2016 and question_number <= 10:
+        return PAPERS_CONFIG["shared_section"]
+    if 2010 <= year <= 2015 and 56 <= question_number <= 65:
+        return PAPERS_CONFIG["shared_section"]
+    return paper_code
+
+def question_marks(year, question_number):
+    """
+    Marks of a question by position: from 2016 Q1-5 and Q11-35 carry one
+    mark and the rest two; from 2010 to 2015 Q1-25 and Q56-60 carry one mark
+    and the rest two. None for earlier papers, whose layout varied.
+    """
+    if year >= 2016:
+        return 1 if question_number <= 5 or 11 <= question_number <= 35 else 2
+    if year >= 2010:
+        return 1 if question_number <= 25 or 56 <= question_number <= 60 else 2
+    return None
+
+def paper_clause(codes):
+    """SQL predicate restricting PYQ rows to the given paper codes ("" for all)"""
+    if not codes:
+        return ""
+    # Codes are interpolated, so only accept ones with a paper definition
+    unknown = [code for code in codes if get_paper(code) is None]
+    if unknown:
+        raise ValueError(f"Unknown paper(s): {', '.join(unknown)}")
+    return "PYQ.paper IN (" + ", ".join(f"'{code}'" for code in codes) + ")"
+
+def year_from_filename(path):
+    """First four-digit year in a file name, e.g. "CS2019.pdf" -> "2019" """
+    match = re.search(r'(19|20)\d{2}', Path(path).stem)
+    return match.group(0) if match else None
@@ -1,6 +1,9 @@
-from pdf2image import convert_from_path
+from pdf2image import convert_from_path, pdfinfo_from_path
 from pathlib import Path
 import os
+import sys
+import papers
+from tracing import span
 
 def create_folder_structure():
     base_dir = Path("gate_images")
@@ -10,36 +13,64 @@ def create_folder_structure():
         year_dir = base_dir / str(year)
         year_dir.mkdir(exist_ok=True)
 
-def extract_pages_from_pdf(pdf_path):
+def year_from_pdf(pdf_path):
     # Get year from filename (e.g., "EE2008.pdf" -> "2008")
-    year = pdf_path.stem[2:]
+    return papers.year_from_filename(pdf_path)
+
+def page_image_path(year, page_number, paper="EE"):
+    return Path(f"gate_images/{year}") / f"{year}_{paper}_{page_number:02d}.png"
+
+def page_count(pdf_path):
+    return pdfinfo_from_path(pdf_path)["Pages"]
+
+def render_page(pdf_path, page_number, paper="EE"):
+    """Render a single page, so pages can be handed on as soon as they exist"""
+    output_path = page_image_path(year_from_pdf(pdf_path), page_number, paper)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+
+    with span("pdf.render", page=page_number):
+        images = convert_from_path(
+            pdf_path,
+            fmt="png",
+            first_page=page_number,
+            last_page=page_number,
+        )
+    with span("image.save"):
+        images[0].save(output_path, "PNG")
+    return output_path
+
+def extract_pages_from_pdf(pdf_path, paper="EE"):
+    year = year_from_pdf(pdf_path)
 
     # Standard A4 size in pixels at 200 DPI
     # A4 = 210mm × 297mm
     # At 200 DPI this is approximately 1654 × 2339 pixels
 
     # Convert PDF to images
-    images = convert_from_path(
-        pdf_path,
-        fmt="png",
-    )
+    with span("pdf.render", pdf=str(pdf_path)):
+        images = convert_from_path(
+            pdf_path,
+            fmt="png",
+        )
 
     # Save each page
-    output_dir = Path(f"gate_images/{year}")
     for i, image in enumerate(images, start=1):
-        output_path = output_dir / f"{year}_EE_{i:02d}.png"
-        image.save(output_path, "PNG")
+        output_path = page_image_path(year, i, paper)
+        with span("image.save"):
+            image.save(output_path, "PNG")
         print(f"Saved {output_path}")
 
-def process_all_pdfs():
+def process_all_pdfs(paper_codes=None):
     # Create folder structure
     create_folder_structure()
 
-    # Process each PDF
+    # Process each PDF of every configured paper (or only paper_codes)
     pdf_dir = Path(".")  # current directory, adjust if needed
-    for pdf_file in pdf_dir.glob("EE*.pdf"):
-        print(f"Processing {pdf_file}...")
-        extract_pages_from_pdf(pdf_file)
+    for paper in papers.pdf_papers(paper_codes):
+        for pdf_file in pdf_dir.glob(paper["pdf_glob"]):
+            print(f"Processing {pdf_file}...")
+            extract_pages_from_pdf(pdf_file, paper["code"])
 
 if __name__ == "__main__":
-    process_all_pdfs()
+    # Optional paper codes, e.g. `python pdf_image_extractor.py EE CS`
+    process_all_pdfs(sys.argv[1:] or None)
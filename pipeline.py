@@ -0,0 +1,368 @@
+import argparse
+import json
+import os
+import queue
+import re
+import threading
+from pathlib import Path
+
+import analytics_cube
+import dead_letter
+import llm_usage
+import near_duplicates
+import papers
+import pdf_image_extractor
+import questionTranscribe
+import subjectClassiferLLAMA
+import topicClassiferLLAMA
+from pipeline_log import get_logger
+
+# One non-interactive run from PDF to topic label. Stages are linked by bounded
+# queues, so a page is transcribed as soon as it is rendered and a question is
+# classified as soon as it is stored. Several papers share the stage workers
+# and the per-host limits in rate_limit.py.
+PIPELINE_CONFIG = {
+    "pdf_dir": ".",
+    "papers": None,  # paper codes to run, None for every paper in papers/ with a pdf_glob
+    "queue_size": 16,
+    "checkpoint_file": "pipeline_checkpoint.jsonl",
+    # Threads per stage
+    "concurrency": {
+        "render": 2,
+        "transcribe": 4,
+        "store": 2,
+        "subject": 8,
+        "topic": 8,
+    },
+}
+
+STAGE_ORDER = ["render", "transcribe", "store", "subject", "topic"]
+
+# Marks the end of a stage's input
+STOP = object()
+
+logger = get_logger("pipeline")
+
+class Checkpoint:
+    """
+    Append-only JSONL log of finished page stages. Replaying it on start lets
+    a restarted run resume a page after its last completed stage instead of
+    rendering and transcribing it again. Question progress is read back from
+    PYQ itself, so runs without a checkpoint never redo stored work.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.pages = {}
+        self.transcriptions = {}
+
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # torn last line from an interrupted run
+                    self._apply(entry)
+
+        self.file = open(path, 'a')
+
+    def _apply(self, entry):
+        # Question entries from older runs are superseded by the labels in PYQ
+        if entry["kind"] != "page":
+            return
+        # Keys written before multi-paper runs have no paper prefix
+        if entry["key"].count("/") == 1:
+            entry["key"] = f"{papers.PAPERS_CONFIG['default_paper']}/{entry['key']}"
+
+        self.pages[entry["key"]] = entry["stage"]
+        if "questions" in entry:
+            self.transcriptions[entry["key"]] = entry["questions"]
+
+    def mark(self, kind, key, stage, **extra):
+        entry = dict(kind=kind, key=key, stage=stage, **extra)
+        with self.lock:
+            self._apply(entry)
+            self.file.write(json.dumps(entry) + "\n")
+            self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+def page_key(page):
+    return f"{page['paper']}/{page['year']}/{page['page_number']}"
+
+def question_record(page, question):
+    """PYQ row for a transcribed question"""
+    options = [re.sub(r'^[A-D]\)\s*', '', opt) for opt in question.get('options', [])]
+    options += [None] * (4 - len(options))
+    year = int(page['year'])
+    return {
+        'paper': page['paper'],
+        'year': year,
+        'page_number': page['page_number'],
+        'question_number': question['question_number'],
+        'section': papers.infer_section(page['paper'], year, question['question_number']),
+        'question_text': question['question_text'],
+        'question_type': question['question_type'],
+        'option_a': options[0],
+        'option_b': options[1],
+        'option_c': options[2],
+        'option_d': options[3],
+        'has_diagram': bool(question.get('has_diagram')),
+        'image_description': None,
+        'subject': None,
+        'topic': None,
+    }
+
+def store_records(records):
+    """Insert newly transcribed questions into PYQ; rows that already exist are left untouched"""
+    conn = None
+    try:
+        conn = subjectClassiferLLAMA.get_connection_from_pool()
+        if not conn:
+            return False
+        cursor = conn.cursor()
+        cursor.executemany(
+            """INSERT IGNORE INTO PYQ (paper, year, page_number, question_number, section, question_text,
+                                       question_type, option_a, option_b, option_c, option_d,
+                                       has_diagram, image_description)
+               VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)""",
+            [(r['paper'], r['year'], r['page_number'], r['question_number'], r['section'], r['question_text'],
+              r['question_type'], r['option_a'], r['option_b'], r['option_c'], r['option_d'],
+              r['has_diagram'], r['image_description']) for r in records]
+        )
+        conn.commit()
+        cursor.close()
+        return True
+    except Exception as e:
+        logger.error(f"Error storing records: {e}")
+        if conn:
+            conn.rollback()
+        return False
+    finally:
+        if conn:
+            conn.close()
+
+def open_clause(stage, classifier):
+    """SQL flag that is false once a question is dead-lettered for stage (and the classifier skips dead letters)"""
+    return dead_letter.skip_clause(stage) if classifier.SKIP_DEAD_LETTERS else "1"
+
+def fetch_stored(paper_code, year=None, page_number=None):
+    """
+    PYQ rows of a paper, or of one of its pages, keyed by (year, page_number).
+    Each row carries open_subject / open_topic flags from open_clause().
+    Returns None if PYQ could not be read.
+    """
+    conn = None
+    try:
+        conn = subjectClassiferLLAMA.get_connection_from_pool()
+        if not conn:
+            return None
+        cursor = conn.cursor(dictionary=True)
+        query = f"""SELECT PYQ.*, {open_clause("subject", subjectClassiferLLAMA)} AS open_subject,
+                           {open_clause("topic", topicClassiferLLAMA)} AS open_topic
+                    FROM PYQ WHERE paper = %s"""
+        params = [paper_code]
+        if year is not None:
+            query += " AND year = %s AND page_number = %s"
+            params += [int(year), page_number]
+        cursor.execute(query, params)
+        stored = {}
+        for row in cursor.fetchall():
+            stored.setdefault((row['year'], row['page_number']), []).append(row)
+        cursor.close()
+        return stored
+    except Exception as e:
+        logger.error(f"Error reading stored questions of {paper_code}: {e}")
+        return None
+    finally:
+        if conn:
+            conn.close()
+
+class Pipeline:
+    """Runs the five stages concurrently, connected by bounded queues"""
+
+    def __init__(self, config=PIPELINE_CONFIG):
+        self.config = config
+        self.checkpoint = Checkpoint(config["checkpoint_file"])
+        self.queues = {stage: queue.Queue(maxsize=config["queue_size"]) for stage in STAGE_ORDER}
+        self.counts = {stage: 0 for stage in STAGE_ORDER}
+        self.paper_counts = {}
+        self.counts_lock = threading.Lock()
+
+    # Stage functions take one item and return the items for the next stage
+
+    def render(self, page):
+        image_path = pdf_image_extractor.page_image_path(page['year'], page['page_number'], page['paper'])
+        if not image_path.exists():
+            image_path = pdf_image_extractor.render_page(page['pdf_path'], page['page_number'], page['paper'])
+        page['image_path'] = str(image_path)
+        self.checkpoint.mark("page", page_key(page), "render")
+        return [page]
+
+    def transcribe(self, page):
+        questions, valid = questionTranscribe.transcribe_page(page['image_path'], paper=page['paper'])
+        if not valid:
+            logger.warning(f"Failed to transcribe {page_key(page)}; it will be retried on the next run")
+            return []
+        page['questions'] = questions
+        self.checkpoint.mark("page", page_key(page), "transcribe", questions=questions)
+        return [page]
+
+    def store(self, page):
+        stored = fetch_stored(page['paper'], page['year'], page['page_number'])
+        if stored is None:
+            return []
+        existing = stored.get((int(page['year']), page['page_number']), [])
+        existing_numbers = {row['question_number'] for row in existing}
+        records = [question_record(page, q) for q in page['questions']
+                   if q['question_number'] not in existing_numbers]
+        if records and not store_records(records):
+            return []
+        near_duplicates.add_rows(records)
+        analytics_cube.update_records(records)
+        self.checkpoint.mark("page", page_key(page), "store")
+        # Questions stored by an earlier run keep their text and labels and only continue if unlabeled
+        self._queue_unlabeled(existing)
+        return records
+
+    def subject(self, record):
+        return [record] if subjectClassiferLLAMA.classify_and_update(record, "pipeline") else []
+
+    def topic(self, record):
+        topicClassiferLLAMA.classify_and_update(record, "pipeline")
+        return []
+
+    def _queue_unlabeled(self, rows):
+        """Queue stored rows at the label stage they still need, skipping dead-lettered ones"""
+        for row in rows:
+            open_subject = row.pop('open_subject')
+            open_topic = row.pop('open_topic')
+            if row['subject'] is None:
+                if open_subject:
+                    self.queues["subject"].put(row)
+            elif row['topic'] is None and open_topic:
+                self.queues["topic"].put(row)
+
+    def _worker(self, stage, next_stage):
+        inbox = self.queues[stage]
+        handler = getattr(self, stage)
+        while True:
+            item = inbox.get()
+            if item is STOP:
+                break
+            try:
+                outputs = handler(item)
+            except Exception as e:
+                logger.exception(f"Stage {stage} failed: {e}")
+                outputs = []
+            with self.counts_lock:
+                self.counts[stage] += 1
+                paper_counts = self.paper_counts.setdefault(item['paper'], dict.fromkeys(STAGE_ORDER, 0))
+                paper_counts[stage] += 1
+            if next_stage:
+                for output in outputs:
+                    self.queues[next_stage].put(output)
+
+    def _start_stage(self, stage, next_stage):
+        """Start the stage's workers and a closer that stops the next stage"""
+        workers = [
+            threading.Thread(target=self._worker, args=(stage, next_stage), daemon=True)
+            for _ in range(self.config["concurrency"][stage])
+        ]
+        for worker in workers:
+            worker.start()
+
+        def close():
+            for worker in workers:
+                worker.join()
+            if next_stage:
+                for _ in range(self.config["concurrency"][next_stage]):
+                    self.queues[next_stage].put(STOP)
+
+        closer = threading.Thread(target=close, daemon=True)
+        closer.start()
+        return closer
+
+    def _seed_paper(self, paper):
+        """
+        Queue every page of a paper at the stage it still needs. Pages with
+        questions in PYQ only send their unlabeled questions on; other pages
+        resume after their checkpointed stage.
+        """
+        stored = fetch_stored(paper['code'])
+        if stored is None:
+            logger.error(f"Skipping {paper['code']}: could not read its stored questions")
+            return
+        pdf_paths = sorted(Path(self.config["pdf_dir"]).glob(paper["pdf_glob"]))
+        for pdf_path in pdf_paths:
+            year = pdf_image_extractor.year_from_pdf(pdf_path)
+            for page_number in range(1, pdf_image_extractor.page_count(pdf_path) + 1):
+                page = {'pdf_path': str(pdf_path), 'paper': paper['code'], 'year': year, 'page_number': page_number}
+                key = page_key(page)
+                done = self.checkpoint.pages.get(key)
+                rows = stored.get((int(year), page_number))
+
+                if rows:
+                    self._queue_unlabeled(rows)
+                elif done in ("transcribe", "store") and key in self.checkpoint.transcriptions:
+                    page['questions'] = self.checkpoint.transcriptions[key]
+                    self.queues["store"].put(page)
+                else:
+                    self.queues["render"].put(page)
+
+    def _seed(self):
+        """Seed each paper from its own thread so all papers move through the stages together"""
+        seeders = [
+            threading.Thread(target=self._seed_paper, args=(paper,), daemon=True)
+            for paper in papers.pdf_papers(self.config["papers"])
+        ]
+        for seeder in seeders:
+            seeder.start()
+        for seeder in seeders:
+            seeder.join()
+
+        for _ in range(self.config["concurrency"]["render"]):
+            self.queues["render"].put(STOP)
+
+    def run(self):
+        subjectClassiferLLAMA.init_connection_pool()
+        topicClassiferLLAMA.init_connection_pool()
+        if not subjectClassiferLLAMA.check_paper_column():
+            return
+        dead_letter.ensure_table(subjectClassiferLLAMA.get_connection_from_pool)
+
+        closers = [
+            self._start_stage(stage, STAGE_ORDER[i + 1] if i + 1 < len(STAGE_ORDER) else None)
+            for i, stage in enumerate(STAGE_ORDER)
+        ]
+        self._seed()
+        for closer in closers:
+            closer.join()
+
+        self.checkpoint.close()
+        near_duplicates.save_index()
+        analytics_cube.flush()
+        logger.info("Pipeline completed. Items handled per stage: " +
+                    ", ".join(f"{stage}={self.counts[stage]}" for stage in STAGE_ORDER))
+        for paper, counts in sorted(self.paper_counts.items()):
+            logger.info(f"  {paper}: " + ", ".join(f"{stage}={counts[stage]}" for stage in STAGE_ORDER))
+        llm_usage.print_run_summary()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run PDF -> transcription -> PYQ -> subject -> topic")
+    parser.add_argument("--pdf-dir", default=PIPELINE_CONFIG["pdf_dir"])
+    parser.add_argument("--papers", help="comma-separated paper codes (default: every configured paper)")
+    parser.add_argument("--checkpoint", default=PIPELINE_CONFIG["checkpoint_file"])
+    for stage in STAGE_ORDER:
+        parser.add_argument(f"--{stage}-workers", type=int, default=PIPELINE_CONFIG["concurrency"][stage])
+    args = parser.parse_args()
+
+    config = dict(PIPELINE_CONFIG,
+                  pdf_dir=args.pdf_dir,
+                  papers=args.papers.split(",") if args.papers else PIPELINE_CONFIG["papers"],
+                  checkpoint_file=args.checkpoint,
+                  concurrency={stage: getattr(args, f"{stage}_workers") for stage in STAGE_ORDER})
+    Pipeline(config).run()
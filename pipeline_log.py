@@ -0,0 +1,150 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import threading
+import time
+
+# Non-blocking logging for the worker threads. Loggers only enqueue records;
+# a background listener thread formats and writes them to the console, a
+# JSON-lines file and a sampled DEBUG sink for raw model responses. Nothing
+# is set up on import: the listener starts (and the log files are created)
+# when the first record is logged.
+LOG_CONFIG = {
+    "console_level": "INFO",
+    "json_file": "pipeline_log.jsonl",  # INFO and above, one JSON object per line
+    "debug_file": "pipeline_debug.jsonl",  # sampled DEBUG records (raw responses)
+    "debug_sample_rate": 0.05,
+    "progress_interval": 10.0,  # seconds between progress summaries
+}
+
+# Extra attributes copied into the JSON records when present
+STRUCTURED_FIELDS = ("record_id", "worker_id", "attempt", "elapsed_s", "response", "reason")
+
+listener = None
+configure_lock = threading.Lock()
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "msg": record.getMessage(),
+        }
+        for field in STRUCTURED_FIELDS:
+            if hasattr(record, field):
+                entry[field] = getattr(record, field)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+class DebugSampler(logging.Filter):
+    """Keeps every non-DEBUG record and a random sample of DEBUG ones"""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno > logging.DEBUG or random.random() < self.rate
+
+class OnlyDebug(logging.Filter):
+    def filter(self, record):
+        return record.levelno == logging.DEBUG
+
+class ConfigureOnFirstRecord(logging.Handler):
+    """Placeholder on the "gate" logger that configures logging for the first record"""
+
+    def handle(self, record):
+        configure()
+        for handler in logging.getLogger("gate").handlers:
+            if handler is not self:
+                handler.handle(record)
+        return True
+
+def configure():
+    """Set up the queue handler and background listener once per process"""
+    global listener
+    with configure_lock:
+        if listener is not None:
+            return
+
+        console = logging.StreamHandler()
+        console.setLevel(LOG_CONFIG["console_level"])
+        console.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(threadName)s %(message)s"))
+        handlers = [console]
+
+        if LOG_CONFIG["json_file"]:
+            json_handler = logging.FileHandler(LOG_CONFIG["json_file"])
+            json_handler.setLevel(logging.INFO)
+            json_handler.setFormatter(JsonFormatter())
+            handlers.append(json_handler)
+
+        if LOG_CONFIG["debug_file"]:
+            debug_handler = logging.FileHandler(LOG_CONFIG["debug_file"])
+            debug_handler.addFilter(OnlyDebug())
+            debug_handler.setFormatter(JsonFormatter())
+            handlers.append(debug_handler)
+
+        # Unsampled DEBUG records are dropped before they are enqueued
+        queue_handler = logging.handlers.QueueHandler(queue.SimpleQueue())
+        queue_handler.addFilter(DebugSampler(LOG_CONFIG["debug_sample_rate"]))
+
+        # Swap the handler list in one step so a concurrent first record is not handled twice
+        root = logging.getLogger("gate")
+        root.handlers = [h for h in root.handlers if h is not placeholder] + [queue_handler]
+
+        listener = logging.handlers.QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+        listener.start()
+        atexit.register(listener.stop)
+
+def get_logger(name):
+    """Logger under the shared non-blocking "gate" hierarchy"""
+    return logging.getLogger(f"gate.{name}")
+
+placeholder = ConfigureOnFirstRecord()
+logging.getLogger("gate").setLevel(logging.DEBUG)
+logging.getLogger("gate").propagate = False
+logging.getLogger("gate").addHandler(placeholder)
+
+class ProgressReporter:
+    """Counts finished items and logs a summary at most every interval seconds"""
+
+    def __init__(self, logger, label, total=None, interval=None):
+        self.logger = logger
+        self.label = label
+        self.total = total
+        self.interval = LOG_CONFIG["progress_interval"] if interval is None else interval
+        self.started = time.monotonic()
+        self.last_report = self.started
+        self.done = 0
+        self.failed = 0
+        self.lock = threading.Lock()
+
+    def advance(self, success=True):
+        with self.lock:
+            if success:
+                self.done += 1
+            else:
+                self.failed += 1
+            now = time.monotonic()
+            if now - self.last_report < self.interval:
+                return
+            self.last_report = now
+            done, failed = self.done, self.failed
+        self._report(done, failed, now)
+
+    def _report(self, done, failed, now):
+        elapsed = now - self.started
+        of_total = f"/{self.total}" if self.total else ""
+        self.logger.info(
+            f"{self.label}: {done}{of_total} done, {failed} failed, {done / max(elapsed, 1e-9):.2f}/s",
+            extra={"elapsed_s": round(elapsed, 1)},
+        )
+
+    def finish(self):
+        self._report(self.done, self.failed, time.monotonic())
@@ -0,0 +1,112 @@
+import mysql.connector
+from mysql.connector import pooling
+
+import papers
+from pipeline_log import get_logger
+
+# Shared PYQ access for the tools that read the question bank outside the
+# classifiers (static export, search index, near duplicates, analytics cube,
+# question store and API, diagram crops). The classifiers keep their own pools
+# so they stay runnable as standalone scripts.
+DB_CONFIG = {
+    'host': '',
+    'user': '',
+    'password': '',
+    'database': '',
+}
+
+POOL_SIZE = 10
+
+# PYQ columns shipped to clients and read by the offline tools
+QUESTION_COLUMNS = [
+    "paper", "year", "page_number", "question_number", "section", "question_text",
+    "question_type", "option_a", "option_b", "option_c", "option_d",
+    "has_diagram", "image_description", "diagram_image", "subject", "topic",
+]
+
+LABEL_STAGES = ("subject", "topic")
+
+logger = get_logger("db")
+
+# Create a connection pool
+connection_pool = None
+
+def init_connection_pool():
+    """Initialize connection pool"""
+    global connection_pool
+    if connection_pool is not None:
+        return  # Already initialized (or provided by the caller)
+    try:
+        connection_pool = pooling.MySQLConnectionPool(
+            pool_name="pyq_tools",
+            pool_size=POOL_SIZE,
+            **DB_CONFIG
+        )
+        logger.info("Connection pool created successfully")
+    except Exception as e:
+        logger.error(f"Error creating connection pool: {e}")
+
+def get_connection_from_pool():
+    """Get a connection from the pool"""
+    try:
+        return connection_pool.get_connection()
+    except Exception as e:
+        logger.error(f"Error getting connection from pool: {e}")
+        return None
+
+def question_id(row):
+    """Public id of a PYQ row, e.g. "EE-2016-4-7" """
+    return f"{row['paper']}-{row['year']}-{row['page_number']}-{row['question_number']}"
+
+def fetch_rows(paper_codes=None):
+    """
+    PYQ rows with QUESTION_COLUMNS, ordered so exports built from them are stable.
+
+    Raises:
+        mysql.connector.Error: If PYQ could not be read, so callers never
+            mistake a failed read for an empty question bank
+    """
+    conn = None
+    try:
+        conn = get_connection_from_pool()
+        if not conn:
+            raise mysql.connector.Error(msg="no database connection")
+        cursor = conn.cursor(dictionary=True)
+        query = f"SELECT {', '.join(QUESTION_COLUMNS)} FROM PYQ"
+        if paper_codes:
+            query += " WHERE " + papers.paper_clause(paper_codes)
+        cursor.execute(query + " ORDER BY paper, year, page_number, question_number")
+        rows = cursor.fetchall()
+        cursor.close()
+        return rows
+    finally:
+        if conn:
+            conn.close()
+
+def update_label(stage, paper, year, page_number, question_number, label):
+    """Set the subject or topic of one record; same call shape as the classifiers' update functions"""
+    if stage not in LABEL_STAGES:
+        raise ValueError(f"Unknown label stage: {stage}")
+    conn = None
+    try:
+        conn = get_connection_from_pool()
+        if not conn:
+            logger.error("Failed to get database connection from pool")
+            return False
+        cursor = conn.cursor()
+        cursor.execute(
+            f"""UPDATE PYQ SET {stage} = %s
+               WHERE paper = %s AND year = %s AND page_number = %s AND question_number = %s""",
+            (label, paper, year, page_number, question_number)
+        )
+        conn.commit()
+        cursor.close()
+        return True
+    except mysql.connector.Error as e:
+        logger.error(f"Error updating record: {e}")
+        if conn:
+            conn.rollback()
+        return False
+    finally:
+        if conn:
+            conn.close()
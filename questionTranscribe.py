@@ -1,24 +1,48 @@
 import os
 import json
 import re
+import time
+import llm_usage
+import rate_limit
+from pipeline_log import get_logger
+from tracing import span, traced
 import google.generativeai as genai
 from google.ai.generativelanguage_v1beta.types import content
 from PIL import Image  # Import Pillow (PIL Fork) for image handling
 
-def gemini_extract_question_data(image_path):
+# Gemini API configuration. client_options/transport can point the client at
+# another endpoint, e.g. {"api_endpoint": "http://127.0.0.1:8765"} with "rest".
+GEMINI_CONFIG = {
+    "api_key": "",
+    "model": "gemini-1.5-flash",
+    "transport": None,
+    "client_options": None,
+}
+
+# Default API host, used for the shared rate limit when client_options has no endpoint
+GEMINI_ENDPOINT = "generativelanguage.googleapis.com"
+
+logger = get_logger("transcribe")
+
+@traced("transcribe.page")
+def gemini_extract_question_data(image_path, paper="EE"):
     """
     Extracts question data from the image at image_path using the Gemini API,
-    following the specified schema.
+    following the specified schema. paper is the GATE paper code named in the prompt.
     """
     try:
-        genai.configure(api_key="")
+        genai.configure(
+            api_key=GEMINI_CONFIG["api_key"],
+            transport=GEMINI_CONFIG["transport"],
+            client_options=GEMINI_CONFIG["client_options"],
+        )
 
         generation_config = {
             "temperature": 1.0,
             "max_output_tokens": 8192,
             "response_schema": content.Schema(
                 type = content.Type.ARRAY,
-                description = "Schema for extracting GATE EE questions from images using OCR. This schema prioritizes consistency and unambiguous formatting. When in doubt, ALWAYS use the more explicit MathJax formatting. **FAILURE TO USE MATHJAX CORRECTLY IS UNACCEPTABLE.**", # Stronger warning
+                description = f"Schema for extracting GATE {paper} questions from images using OCR. This schema prioritizes consistency and unambiguous formatting. When in doubt, ALWAYS use the more explicit MathJax formatting. **FAILURE TO USE MATHJAX CORRECTLY IS UNACCEPTABLE.**", # Stronger warning
                 items = content.Schema(
                     type = content.Type.OBJECT,
                     enum = [],
@@ -98,17 +122,18 @@ def gemini_extract_question_data(image_path):
 
 
         model = genai.GenerativeModel(
-            model_name="gemini-1.5-flash",
+            model_name=GEMINI_CONFIG["model"],
             generation_config=generation_config,
         )
 
-        pil_image = Image.open(image_path) # Load image using PIL
+        with span("image.open"):
+            pil_image = Image.open(image_path) # Load image using PIL
 
         contents = [
                     pil_image, # Pass PIL Image object directly
-                    """
-                    **EXTRACT GATE EE QUESTIONS WITH PERFECT MATHJAX FORMATTING - THIS IS CRITICAL.**
-
+                    f"""
+                    **EXTRACT GATE {paper} QUESTIONS WITH PERFECT MATHJAX FORMATTING - THIS IS CRITICAL.**
+""" + """
                     Follow these strict rules:
 
                     1.  **NO UNICODE MATH SYMBOLS:** Absolutely NO Unicode characters for math (degree, subscript, delta, ohms, etc.).
@@ -127,28 +152,40 @@ def gemini_extract_question_data(image_path):
 
 
 
-        response = model.generate_content(contents=contents)
-        response.resolve() # Resolve the response to get the content
+        llm_usage.set_record(str(image_path))
+        rate_limit.acquire((GEMINI_CONFIG["client_options"] or {}).get("api_endpoint", GEMINI_ENDPOINT))
+        started = time.monotonic()
+        try:
+            with span("gemini.generate"):
+                response = model.generate_content(contents=contents)
+                response.resolve() # Resolve the response to get the content
+        except Exception:
+            llm_usage.record_call("transcribe", GEMINI_CONFIG["model"], {}, time.monotonic() - started, "error")
+            raise
+        llm_usage.record_call("transcribe", GEMINI_CONFIG["model"], llm_usage.usage_from_gemini(response),
+                              time.monotonic() - started)
 
         if response.text:
             try:
-                question_data_list = json.loads(response.text)
+                with span("json.decode"):
+                    question_data_list = json.loads(response.text)
                 return question_data_list
             except json.JSONDecodeError as e:
-                print(f"Error decoding JSON response from Gemini: {e}")
-                print(f"Response text was: {response.text[:200]}") # Print the raw response for debugging
+                llm_usage.mark_invalid("transcribe")
+                logger.error(f"Error decoding JSON response from Gemini: {e}", extra={"record_id": image_path})
+                logger.debug("Raw Gemini response", extra={"record_id": image_path, "response": response.text})
                 return None
         else:
-            print("Gemini API returned an empty response text.")
+            logger.warning("Gemini API returned an empty response text.", extra={"record_id": image_path})
             return None
 
 
     except Exception as e:
-        print(f"Error during Gemini API call or processing: {e}")
+        logger.error(f"Error during Gemini API call or processing: {e}", extra={"record_id": image_path})
         return None
 
 
-def process_images(root_dir, year=None, output_file="output_temp_1.0.json", retry_short_content=True):
+def process_images(root_dir, year=None, output_file="output_temp_1.0.json", retry_short_content=True, paper="EE"):
     """
     Processes images with validation to ensure question and option data is complete.
 
@@ -157,6 +194,7 @@ def process_images(root_dir, year=None, output_file="output_temp_1.0.json", retr
         year: Specific year directory to process (if None, processes all years)
         output_file: JSON file to store results
         retry_short_content: Whether to retry processing images with suspiciously short content
+        paper: GATE paper code; only that paper's images ({year}_{paper}_{page}.png) are processed
     """
     output_data = {}
     reprocess_list = []  # Track items that need reprocessing
@@ -166,7 +204,7 @@ def process_images(root_dir, year=None, output_file="output_temp_1.0.json", retr
         try:
             with open(output_file, 'r') as f:
                 output_data = json.load(f)
-                print(f"Resuming from existing JSON file: {output_file}")
+                logger.info(f"Resuming from existing JSON file: {output_file}")
 
                 # Validate existing data first
                 if retry_short_content:
@@ -192,15 +230,15 @@ def process_images(root_dir, year=None, output_file="output_temp_1.0.json", retr
 
                             if should_reprocess:
                                 reprocess_list.append((year_dir, page_no))
-                                print(f"Flagging {year_dir}/{page_no} for reprocessing due to suspicious content")
+                                logger.warning(f"Flagging {year_dir}/{page_no} for reprocessing due to suspicious content")
         except json.JSONDecodeError:
-            print(f"Warning: Existing JSON file '{output_file}' is corrupted or invalid. Starting fresh.")
+            logger.warning(f"Existing JSON file '{output_file}' is corrupted or invalid. Starting fresh.")
             output_data = {}
 
     # Determine which year directories to process
     if year:
         if not os.path.isdir(os.path.join(root_dir, year)):
-            print(f"Error: Year directory '{year}' not found in '{root_dir}'.")
+            logger.error(f"Year directory '{year}' not found in '{root_dir}'.")
             return output_data
         year_dirs = [year]
     else:
@@ -209,7 +247,7 @@ def process_images(root_dir, year=None, output_file="output_temp_1.0.json", retr
     # Process flagged reprocessing items first
     for year_dir_name, page_no in reprocess_list:
         if year_dir_name not in year_dirs:
-            print(f"Skipping reprocess of {year_dir_name}/{page_no} as year not in scope")
+            logger.info(f"Skipping reprocess of {year_dir_name}/{page_no} as year not in scope")
             continue
 
         year_dir_path = os.path.join(root_dir, year_dir_name)
@@ -217,35 +255,37 @@ def process_images(root_dir, year=None, output_file="output_temp_1.0.json", retr
         image_files = [f for f in os.listdir(year_dir_path)
                       if f.lower().endswith(('.png', '.jpg', '.jpeg', '.tiff', '.bmp'))
                       and f.startswith(year_dir_name)
+                      and f"_{paper}_" in f
                       and re.search(r'_(' + page_no + r'|0*' + page_no + r')\.', f)]
 
         if not image_files:
-            print(f"Warning: Could not find image file for {year_dir_name}/{page_no} for reprocessing")
+            logger.warning(f"Could not find image file for {year_dir_name}/{page_no} for reprocessing")
             continue
 
         image_path = os.path.join(year_dir_path, image_files[0])
-        print(f"Reprocessing {year_dir_name}/{page_no} ({image_files[0]})")
+        logger.info(f"Reprocessing {year_dir_name}/{page_no} ({image_files[0]})")
 
         # Try extraction with up to 3 retries
         success = False
         for attempt in range(3):
             try:
-                question_data_list = gemini_extract_question_data(image_path)
+                question_data_list = gemini_extract_question_data(image_path, paper)
 
                 # Validate the newly extracted data
                 if validate_question_data(question_data_list):
                     output_data[year_dir_name][page_no] = question_data_list
                     write_to_json(output_data, output_file=output_file)
-                    print(f"Successfully reprocessed {year_dir_name}/{page_no} (Attempt {attempt+1})")
+                    logger.info(f"Successfully reprocessed {year_dir_name}/{page_no} (Attempt {attempt+1})")
                     success = True
                     break
                 else:
-                    print(f"Reprocessing attempt {attempt+1} for {year_dir_name}/{page_no} produced invalid data, retrying...")
+                    logger.warning(f"Reprocessing attempt {attempt+1} for {year_dir_name}/{page_no} produced invalid data, retrying...")
+                    llm_usage.mark_invalid("transcribe")
             except Exception as e:
-                print(f"Error during reprocessing attempt {attempt+1} for {year_dir_name}/{page_no}: {str(e)}")
+                logger.error(f"Error during reprocessing attempt {attempt+1} for {year_dir_name}/{page_no}: {str(e)}")
 
         if not success:
-            print(f"Failed to reprocess {year_dir_name}/{page_no} after multiple attempts")
+            logger.error(f"Failed to reprocess {year_dir_name}/{page_no} after multiple attempts")
 
     # Process regular files
     for year_dir_name in sorted(year_dirs):
@@ -258,19 +298,21 @@ def process_images(root_dir, year=None, output_file="output_temp_1.0.json", retr
 
         for image_file in sorted(image_files):
             if not image_file.startswith(year_dir_name):
-                print(f"Warning: Skipping image file '{image_file}' as filename doesn't start with year.")
+                logger.warning(f"Skipping image file '{image_file}' as filename doesn't start with year.")
                 continue
+            if f"_{paper}_" not in image_file:
+                continue  # another paper's page
 
             page_no_match = re.search(r'_(\d+)\.', image_file)
             if page_no_match:
                 page_no = page_no_match.group(1).lstrip('0')
             else:
-                print(f"Warning: Could not extract page number from filename '{image_file}'. Skipping.")
+                logger.warning(f"Could not extract page number from filename '{image_file}'. Skipping.")
                 continue
 
             # Skip if page already processed and not flagged for reprocessing
             if page_no in output_data[year_dir_name] and (year_dir_name, page_no) not in reprocess_list:
-                print(f"Page {year_dir_name}/{page_no} already processed. Skipping.")
+                logger.info(f"Page {year_dir_name}/{page_no} already processed. Skipping.")
                 continue
 
             image_path = os.path.join(year_dir_path, image_file)
@@ -279,22 +321,23 @@ def process_images(root_dir, year=None, output_file="output_temp_1.0.json", retr
             # Try extraction with up to 3 retries
             for attempt in range(3):
                 try:
-                    question_data_list = gemini_extract_question_data(image_path)
+                    question_data_list = gemini_extract_question_data(image_path, paper)
 
                     # Validate the newly extracted data
                     if validate_question_data(question_data_list):
                         output_data[year_dir_name][page_no] = question_data_list
                         write_to_json(output_data, output_file=output_file)
-                        print(f"Data for {year_dir_name}/{page_no} written to JSON (Attempt {attempt+1})")
+                        logger.info(f"Data for {year_dir_name}/{page_no} written to JSON (Attempt {attempt+1})")
                         success = True
                         break
                     else:
-                        print(f"Processing attempt {attempt+1} for {year_dir_name}/{page_no} produced invalid data, retrying...")
+                        logger.warning(f"Processing attempt {attempt+1} for {year_dir_name}/{page_no} produced invalid data, retrying...")
+                        llm_usage.mark_invalid("transcribe")
                 except Exception as e:
-                    print(f"Error during processing attempt {attempt+1} for {year_dir_name}/{page_no}: {str(e)}")
+                    logger.error(f"Error during processing attempt {attempt+1} for {year_dir_name}/{page_no}: {str(e)}")
 
             if not success:
-                print(f"Failed to process {year_dir_name}/{page_no} after multiple attempts")
+                logger.error(f"Failed to process {year_dir_name}/{page_no} after multiple attempts")
                 # Still save what we have, but mark it as potentially problematic
                 if question_data_list:
                     output_data[year_dir_name][page_no] = question_data_list
@@ -303,6 +346,33 @@ def process_images(root_dir, year=None, output_file="output_temp_1.0.json", retr
 
     return output_data
 
+def transcribe_page(image_path, max_attempts=3, paper="EE"):
+    """
+    Extracts and validates the questions on one page image.
+
+    Args:
+        image_path: Path of the page image
+        max_attempts: Number of extraction attempts before giving up
+        paper: GATE paper code of the page
+
+    Returns:
+        tuple: (question_data_list, valid) where question_data_list is the last
+        extraction (possibly None) and valid tells whether it passed validation
+    """
+    question_data_list = None
+    for attempt in range(max_attempts):
+        try:
+            question_data_list = gemini_extract_question_data(image_path, paper)
+            if validate_question_data(question_data_list):
+                return question_data_list, True
+            logger.warning(f"Attempt {attempt+1} produced invalid data, retrying...",
+                           extra={"record_id": image_path, "attempt": attempt + 1})
+            llm_usage.mark_invalid("transcribe")
+        except Exception as e:
+            logger.error(f"Error during attempt {attempt+1}: {str(e)}", extra={"record_id": image_path, "attempt": attempt + 1})
+
+    return question_data_list, False
+
 def validate_question_data(question_data_list):
     """
     Validates if the extracted question data meets quality standards.
@@ -333,6 +403,7 @@ def validate_question_data(question_data_list):
     return True
 
 
+@traced("json.write")
 def write_to_json(data, output_file="output_temp_1.0.json"):
     """
     Writes the processed data to a JSON file. This version overwrites the file each time.
@@ -340,12 +411,14 @@ def write_to_json(data, output_file="output_temp_1.0.json"):
     """
     with open(output_file, 'w') as f:
         json.dump(data, f, indent=4)
-    print(f"JSON updated: {output_file}")  # More informative message
+    logger.debug(f"JSON updated: {output_file}")
 
 if __name__ == "__main__":
     root_directory = input("Enter the root directory containing year directories: ")
     process_specific_year = input("Process specific year? (Enter year or leave blank for all years): ")
-    output_json_file = "output_temp_1.0.json"  # Define output JSON file name
+    paper_code = input("Paper code (leave blank for EE): ").strip().upper() or "EE"
+    # Define output JSON file name, one per paper since pages are keyed by year and page only
+    output_json_file = "output_temp_1.0.json" if paper_code == "EE" else f"output_temp_1.0_{paper_code}.json"
 
     if not os.path.isdir(root_directory):
         print(f"Error: Root directory '{root_directory}' is not found.")
@@ -353,7 +426,9 @@ if __name__ == "__main__":
         processed_data = process_images(
             root_directory,
             year=process_specific_year if process_specific_year else None,
-            output_file=output_json_file
+            output_file=output_json_file,
+            paper=paper_code
         )
         print("Image processing and JSON generation completed.")
         print(f"Final output (also incrementally saved) is in: {output_json_file}")
+        llm_usage.print_run_summary()
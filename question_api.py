@@ -0,0 +1,315 @@
+import argparse
+import asyncio
+import gzip
+import hashlib
+import json
+import signal
+import time
+import zlib
+from collections import OrderedDict
+from urllib.parse import parse_qsl, urlsplit
+
+import pyq_db
+import question_store
+import static_export
+from pipeline_log import get_logger
+
+# Read-only JSON API over the question bank. The bank is loaded once into an
+# immutable QuestionBank snapshot with indexes by question key, year, subject
+# and topic; requests are answered from that snapshot without touching the
+# database. A background task re-reads PYQ every reload_interval seconds (or
+# on SIGHUP) and swaps in a new snapshot when anything changed, which also
+# changes the ETag of every response. Until the first snapshot loads, every
+# request gets a 503 and loading is retried every retry_interval seconds.
+# With "store" set, snapshots are read from a question_store.py file instead
+# of PYQ.
+API_CONFIG = {
+    "host": "127.0.0.1",
+    "port": 8080,
+    "per_page": 20,
+    "max_per_page": 100,
+    "reload_interval": 30.0,  # seconds, 0 to only reload on SIGHUP
+    "retry_interval": 5.0,  # seconds between load attempts while no snapshot is loaded
+    "gzip_min_bytes": 1024,
+    "gzip_level": 6,
+    "response_cache": 2048,  # encoded responses kept per snapshot
+    "max_header_bytes": 16384,
+    "store": None,  # path of a question_store.py file to serve instead of PYQ
+}
+
+FILTERS = ("paper", "year", "subject", "topic", "section", "type")
+
+logger = get_logger("api")
+
+class QuestionBank:
+    """Immutable snapshot of the exported questions and their indexes"""
+
+    def __init__(self, rows):
+        self.entries = []
+        self.by_key = {}
+        self.indexes = {name: {} for name in FILTERS}
+        for row in rows:
+            entry = static_export.question_entry(row)
+            entry["paper"] = row["paper"]
+            entry["page"] = row["page_number"]
+            position = len(self.entries)
+            self.entries.append(entry)
+            self.by_key[(row["paper"], row["year"], row["page_number"], row["question_number"])] = entry
+            values = {"paper": row["paper"], "year": str(row["year"]), "subject": row["subject"],
+                      "topic": row["topic"], "section": row["section"], "type": row["question_type"]}
+            for name, value in values.items():
+                if value is not None:
+                    self.indexes[name].setdefault(value, []).append(position)
+        self.version = hashlib.sha256(static_export.serialize(self.entries)).hexdigest()[:12]
+        self.responses = OrderedDict()
+
+    def query(self, filters):
+        """Positions of the entries matching every filter, in bank order"""
+        if not filters:
+            return range(len(self.entries))
+        # Start from the smallest index list and check the other filters per entry
+        lists = sorted((self.indexes[name].get(value, []) for name, value in filters.items()), key=len)
+        if len(lists) == 1:
+            return lists[0]
+        others = [set(positions) for positions in lists[1:]]
+        return [p for p in lists[0] if all(p in other for other in others)]
+
+    def facets(self):
+        return {name: {value: len(positions) for value, positions in sorted(index.items())}
+                for name, index in self.indexes.items() if name != "topic"}
+
+def etags(header):
+    """Entity tags listed in an If-None-Match header, weak ones compared by value"""
+    return {tag.strip().removeprefix("W/") for tag in header.split(",") if tag.strip()}
+
+def json_body(value):
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+class QuestionAPI:
+    """HTTP/1.1 handler serving the current QuestionBank snapshot"""
+
+    def __init__(self, config=API_CONFIG):
+        self.config = config
+        self.bank = None
+        self.loaded_at = None
+        self.reload_lock = asyncio.Lock()
+        self.requests = 0
+
+    async def reload(self):
+        """
+        Re-read PYQ off the event loop and swap snapshots if it changed. A
+        failed or empty read keeps the current snapshot (or none, so requests
+        keep getting 503s).
+
+        Returns:
+            bool: True if a new snapshot was installed
+        """
+        async with self.reload_lock:
+            started = time.perf_counter()
+            try:
+                rows = await asyncio.get_running_loop().run_in_executor(None, self.fetch_rows)
+            except Exception as e:
+                logger.error(f"Reload failed: {e}")
+                return False
+            if not rows:
+                logger.error("Reload returned no questions; "
+                             + ("keeping the current snapshot" if self.bank else "no snapshot loaded yet"))
+                return False
+            bank = await asyncio.get_running_loop().run_in_executor(None, QuestionBank, rows)
+            if self.bank and bank.version == self.bank.version:
+                return False
+            self.bank = bank
+            self.loaded_at = time.time()
+            logger.info(f"Loaded {len(bank.entries)} questions (version {bank.version}) "
+                        f"in {time.perf_counter() - started:.2f}s")
+            return True
+
+    def fetch_rows(self):
+        if self.config["store"]:
+            return list(question_store.QuestionStore(self.config["store"]))
+        return pyq_db.fetch_rows()
+
+    async def reload_forever(self):
+        """Reload every reload_interval seconds, and every retry_interval until a snapshot loads"""
+        while True:
+            if self.bank is None:
+                await asyncio.sleep(self.config["retry_interval"])
+            elif self.config["reload_interval"]:
+                await asyncio.sleep(self.config["reload_interval"])
+            else:
+                return
+            try:
+                await self.reload()
+            except Exception as e:
+                logger.error(f"Reload failed: {e}")
+
+    def route(self, path, params):
+        """(status, JSON value) for a GET path and its query parameters"""
+        bank = self.bank
+        parts = [part for part in path.split("/") if part]
+        if parts == ["health"]:
+            return 200, {"status": "ok", "version": bank.version, "questions": len(bank.entries),
+                         "loaded_at": self.loaded_at, "requests": self.requests}
+        if parts == ["facets"]:
+            return 200, bank.facets()
+        if parts == ["questions"]:
+            filters = {name: params[name] for name in FILTERS if params.get(name)}
+            try:
+                page = max(int(params.get("page", 1)), 1)
+                per_page = min(max(int(params.get("per_page", self.config["per_page"])), 1),
+                               self.config["max_per_page"])
+            except ValueError:
+                return 400, {"error": "page and per_page must be integers"}
+            positions = bank.query(filters)
+            start = (page - 1) * per_page
+            return 200, {
+                "version": bank.version,
+                "total": len(positions),
+                "page": page,
+                "per_page": per_page,
+                "questions": [bank.entries[p] for p in positions[start:start + per_page]],
+            }
+        if len(parts) == 5 and parts[0] == "questions":
+            try:
+                key = (parts[1], int(parts[2]), int(parts[3]), int(parts[4]))
+            except ValueError:
+                return 404, {"error": "not found"}
+            entry = bank.by_key.get(key)
+            return (200, entry) if entry else (404, {"error": "not found"})
+        return 404, {"error": "not found"}
+
+    def respond(self, target, accept_gzip):
+        """(status, headers, body) for a GET target, served from the snapshot's response cache"""
+        bank = self.bank
+        url = urlsplit(target)
+        params = dict(parse_qsl(url.query))
+        cache_key = (url.path, tuple(sorted(params.items())))
+        cached = bank.responses.get(cache_key)
+        if cached:
+            bank.responses.move_to_end(cache_key)
+        else:
+            status, value = self.route(url.path, params)
+            body = json_body(value)
+            etag = f'"{bank.version}-{zlib.crc32(body):08x}"'
+            gzipped = (gzip.compress(body, self.config["gzip_level"], mtime=0)
+                       if len(body) >= self.config["gzip_min_bytes"] else None)
+            cached = (status, etag, body, gzipped)
+            if url.path.strip("/") != "health":  # live counters
+                bank.responses[cache_key] = cached
+            if len(bank.responses) > self.config["response_cache"]:
+                bank.responses.popitem(last=False)
+
+        status, etag, body, gzipped = cached
+        headers = {"Content-Type": "application/json; charset=utf-8", "ETag": etag,
+                   "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+        if gzipped is not None and accept_gzip:
+            headers["Content-Encoding"] = "gzip"
+            body = gzipped
+        return status, headers, body
+
+    async def handle(self, reader, writer):
+        """Serve requests on one connection until the client closes it"""
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except asyncio.LimitOverrunError:
+                    await self.write(writer, 431, {}, b"", "HTTP/1.1", False)
+                    break
+
+                lines = head.decode("latin-1").split("\r\n")
+                try:
+                    method, target, version = lines[0].split(" ", 2)
+                except ValueError:
+                    await self.write(writer, 400, {}, b"", "HTTP/1.1", False)
+                    break
+                headers = {}
+                for line in lines[1:]:
+                    name, _, value = line.partition(":")
+                    if name:
+                        headers[name.strip().lower()] = value.strip()
+                keep_alive = (headers.get("connection", "").lower() != "close"
+                              if version == "HTTP/1.1" else headers.get("connection", "").lower() == "keep-alive")
+
+                # Request bodies are not used; a small one is read and dropped so the next
+                # request starts at the right byte, anything else ends the connection
+                if "transfer-encoding" in headers:
+                    await self.write(writer, 400, {}, b"", version, False)
+                    break
+                try:
+                    body_length = int(headers.get("content-length", 0))
+                except ValueError:
+                    body_length = -1
+                if body_length < 0:
+                    await self.write(writer, 400, {}, b"", version, False)
+                    break
+                if body_length > self.config["max_header_bytes"]:
+                    keep_alive = False
+                elif body_length:
+                    try:
+                        await reader.readexactly(body_length)
+                    except (asyncio.IncompleteReadError, ConnectionError):
+                        break
+
+                self.requests += 1
+                if method not in ("GET", "HEAD"):
+                    await self.write(writer, 405, {"Allow": "GET, HEAD"}, b"", version, False)
+                    break
+                if self.bank is None:
+                    await self.write(writer, 503, {"Retry-After": "1"}, b"", version, keep_alive)
+                else:
+                    status, response_headers, body = self.respond(target, "gzip" in headers.get("accept-encoding", ""))
+                    if status == 200 and response_headers["ETag"] in etags(headers.get("if-none-match", "")):
+                        response_headers.pop("Content-Encoding", None)
+                        status, body = 304, b""
+                    await self.write(writer, status, response_headers, b"" if method == "HEAD" else body,
+                                     version, keep_alive, len(body))
+                if not keep_alive:
+                    break
+        finally:
+            writer.close()
+
+    async def write(self, writer, status, headers, body, version, keep_alive, length=None):
+        reason = {200: "OK", 304: "Not Modified", 400: "Bad Request", 404: "Not Found",
+                  405: "Method Not Allowed", 431: "Request Header Fields Too Large",
+                  503: "Service Unavailable"}[status]
+        lines = [f"{version} {status} {reason}"]
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        lines.append(f"Content-Length: {len(body) if length is None else length}")
+        lines.append("Connection: keep-alive" if keep_alive else "Connection: close")
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+async def serve(config=API_CONFIG):
+    api = QuestionAPI(config)
+    await api.reload()  # on failure the server starts anyway and answers 503 until a retry succeeds
+    server = await asyncio.start_server(api.handle, config["host"], config["port"],
+                                        limit=config["max_header_bytes"])
+    loop = asyncio.get_running_loop()
+    try:
+        loop.add_signal_handler(signal.SIGHUP, lambda: asyncio.ensure_future(api.reload()))
+    except (NotImplementedError, AttributeError, RuntimeError):  # no SIGHUP on Windows or off the main thread
+        pass
+    asyncio.ensure_future(api.reload_forever())
+
+    logger.info(f"Serving questions on http://{config['host']}:{config['port']}")
+    async with server:
+        await server.serve_forever()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Read-only question API over an in-memory snapshot of PYQ")
+    parser.add_argument("--host", default=API_CONFIG["host"])
+    parser.add_argument("--port", type=int, default=API_CONFIG["port"])
+    parser.add_argument("--reload-interval", type=float, default=API_CONFIG["reload_interval"])
+    parser.add_argument("--store", default=API_CONFIG["store"], help="serve a question_store.py file instead of PYQ")
+    args = parser.parse_args()
+
+    if not args.store:
+        pyq_db.init_connection_pool()
+    try:
+        asyncio.run(serve(dict(API_CONFIG, host=args.host, port=args.port, reload_interval=args.reload_interval,
+                               store=args.store)))
+    except KeyboardInterrupt:
+        pass
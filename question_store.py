@@ -0,0 +1,259 @@
+import argparse
+import json
+import mmap
+import os
+import resource
+import time
+from pathlib import Path
+
+import numpy as np
+
+import pyq_db
+from pipeline_log import get_logger
+
+# Columnar, memory-mapped copy of the question bank (the QUESTION_COLUMNS
+# of PYQ, see pyq_db.py). One file: an 8-byte magic, the header length, a JSON header
+# describing the columns, then 8-byte aligned column blocks:
+#   fixed   - small integers, one array per column
+#   label   - int16 codes into a per-column value list (-1 for None)
+#   text    - uint64 end offsets into a UTF-8 blob, plus a packed null bitmap
+# Opening the file maps it and reads the header; columns are NumPy views over
+# the map and strings are decoded only when a row view asks for them.
+STORE_CONFIG = {
+    "path": "question_bank.qcol",
+}
+
+MAGIC = b"QCOL\x00\x00\x00\x01"
+
+FIXED_COLUMNS = {
+    "year": "<i2",
+    "page_number": "<i2",
+    "question_number": "<i2",
+    "has_diagram": "u1",
+}
+LABEL_COLUMNS = ["paper", "section", "question_type", "subject", "topic"]
+TEXT_COLUMNS = ["question_text", "option_a", "option_b", "option_c", "option_d",
+                "image_description", "diagram_image"]
+
+COLUMNS = list(pyq_db.QUESTION_COLUMNS)
+
+logger = get_logger("store")
+
+def _align(n):
+    return (n + 7) & ~7
+
+def encode_columns(rows):
+    """Column name -> (header entry, list of byte blocks) for rows"""
+    encoded = {}
+    for name, dtype in FIXED_COLUMNS.items():
+        values = np.array([int(row[name] or 0) for row in rows], dtype=dtype)
+        encoded[name] = ({"kind": "fixed", "dtype": dtype}, [values.tobytes()])
+
+    for name in LABEL_COLUMNS:
+        values, codes = [], {}
+        column = np.empty(len(rows), dtype="<i2")
+        for i, row in enumerate(rows):
+            value = row[name]
+            if value is None:
+                column[i] = -1
+                continue
+            if value not in codes:
+                codes[value] = len(values)
+                values.append(value)
+            column[i] = codes[value]
+        encoded[name] = ({"kind": "label", "dtype": "<i2", "values": values}, [column.tobytes()])
+
+    for name in TEXT_COLUMNS:
+        chunks = [(row[name] or "").encode("utf-8") for row in rows]
+        ends = np.cumsum([len(chunk) for chunk in chunks], dtype="<u8")
+        nulls = np.packbits(np.array([row[name] is None for row in rows], dtype=bool))
+        encoded[name] = ({"kind": "text"}, [ends.tobytes(), nulls.tobytes(), b"".join(chunks)])
+    return encoded
+
+def write_store(rows, path=None):
+    """Write rows (dicts with pyq_db.QUESTION_COLUMNS) as a columnar store file"""
+    path = Path(path or STORE_CONFIG["path"])
+    encoded = encode_columns(rows)
+
+    # Block offsets are relative to the end of the header, so the header can be sized afterwards
+    header = {"rows": len(rows), "columns": {}}
+    position = 0
+    for name in COLUMNS:
+        info, blocks = encoded[name]
+        info["blocks"] = []
+        for block in blocks:
+            info["blocks"].append([position, len(block)])
+            position = _align(position + len(block))
+        header["columns"][name] = info
+    header_bytes = json.dumps(header, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    data_start = _align(len(MAGIC) + 8 + len(header_bytes))
+
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(len(header_bytes).to_bytes(8, "little"))
+        f.write(header_bytes)
+        f.write(b"\0" * (data_start - f.tell()))
+        for name in COLUMNS:
+            info, blocks = encoded[name]
+            for (offset, length), block in zip(info["blocks"], blocks):
+                f.seek(data_start + offset)
+                f.write(block)
+    os.replace(tmp_path, path)
+    logger.info(f"Wrote {len(rows)} questions to {path} ({path.stat().st_size} bytes)")
+
+class QuestionRow:
+    """
+    Lazy view of one stored question. Supports row["column"], row.get() and
+    attribute access, so it can stand in for a PYQ dict row.
+    """
+    __slots__ = ("store", "index")
+
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+
+    def __getitem__(self, name):
+        return self.store.value(name, self.index)
+
+    def __getattr__(self, name):
+        # Slots are unset while copy/pickle rebuild a row; looking them up here would recurse
+        if name in QuestionRow.__slots__:
+            raise AttributeError(name)
+        try:
+            return self.store.value(name, self.index)
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def get(self, name, default=None):
+        return self.store.value(name, self.index) if name in self.store.columns else default
+
+    def __contains__(self, name):
+        return name in self.store.columns
+
+    def keys(self):
+        return list(COLUMNS)
+
+    def as_dict(self):
+        return {name: self.store.value(name, self.index) for name in COLUMNS}
+
+    def __repr__(self):
+        return f"QuestionRow({pyq_db.question_id(self)})"
+
+class QuestionStore:
+    """Read-only, memory-mapped question bank"""
+
+    def __init__(self, path=None):
+        self.path = Path(path or STORE_CONFIG["path"])
+        with open(self.path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{self.path} is not a question store file")
+        header_length = int.from_bytes(self.map[len(MAGIC):len(MAGIC) + 8], "little")
+        header_end = len(MAGIC) + 8 + header_length
+        header = json.loads(self.map[len(MAGIC) + 8:header_end])
+        data_start = _align(header_end)
+
+        self.rows = header["rows"]
+        self.columns = {}
+        for name, info in header["columns"].items():
+            blocks = [(data_start + offset, length) for offset, length in info["blocks"]]
+            if info["kind"] in ("fixed", "label"):
+                offset, length = blocks[0]
+                array = np.frombuffer(self.map, dtype=info["dtype"], count=self.rows, offset=offset)
+                self.columns[name] = (info["kind"], array, info.get("values"))
+            else:
+                (ends_offset, _), (nulls_offset, nulls_length), (blob_offset, _) = blocks
+                ends = np.frombuffer(self.map, dtype="<u8", count=self.rows, offset=ends_offset)
+                nulls = np.frombuffer(self.map, dtype="u1", count=nulls_length, offset=nulls_offset)
+                self.columns[name] = ("text", ends, (nulls, blob_offset))
+
+    def __len__(self):
+        return self.rows
+
+    def __getitem__(self, index):
+        if not -self.rows <= index < self.rows:
+            raise IndexError(index)
+        return QuestionRow(self, index % self.rows)
+
+    def __iter__(self):
+        return (QuestionRow(self, i) for i in range(self.rows))
+
+    def value(self, name, index):
+        kind, array, extra = self.columns[name]
+        if kind == "fixed":
+            value = int(array[index])
+            return bool(value) if name == "has_diagram" else value
+        if kind == "label":
+            code = array[index]
+            return None if code < 0 else extra[code]
+        nulls, blob_offset = extra
+        if nulls[index >> 3] & (0x80 >> (index & 7)):
+            return None
+        start = int(array[index - 1]) if index else 0
+        return self.map[blob_offset + start:blob_offset + int(array[index])].decode("utf-8")
+
+    def code(self, name, value):
+        """Code of a label value in a label column: -1 for None, -2 for a value not in the store"""
+        if value is None:
+            return -1
+        values = self.columns[name][2]
+        return values.index(value) if value in values else -2
+
+    def where(self, **filters):
+        """
+        Row indices matching every filter on fixed or label columns, e.g.
+        where(year=2016, subject="Power Systems").
+        """
+        mask = np.ones(self.rows, dtype=bool)
+        for name, value in filters.items():
+            kind, array, _ = self.columns[name]
+            if kind == "label":
+                mask &= array == self.code(name, value)
+            elif kind == "fixed":
+                mask &= array == value
+            else:
+                raise ValueError(f"Cannot filter on text column {name}")
+        return np.flatnonzero(mask)
+
+    def close(self):
+        self.columns = {}
+        self.map.close()
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Columnar, memory-mapped copy of the question bank")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_parser = commands.add_parser("build", help="write the store from PYQ")
+    build_parser.add_argument("--out", default=STORE_CONFIG["path"])
+    build_parser.add_argument("--papers", help="comma-separated paper codes (default: all)")
+    info_parser = commands.add_parser("info", help="open the store and report sizes and timings")
+    info_parser.add_argument("--path", default=STORE_CONFIG["path"])
+    show_parser = commands.add_parser("show", help="print the questions matching filters")
+    show_parser.add_argument("--path", default=STORE_CONFIG["path"])
+    show_parser.add_argument("--year", type=int)
+    show_parser.add_argument("--paper")
+    show_parser.add_argument("--subject")
+    show_parser.add_argument("--topic")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        pyq_db.init_connection_pool()
+        write_store(pyq_db.fetch_rows(args.papers.split(",") if args.papers else None), args.out)
+    elif args.command == "info":
+        started = time.perf_counter()
+        store = QuestionStore(args.path)
+        opened_ms = (time.perf_counter() - started) * 1000
+        print(f"{len(store)} questions, {store.path.stat().st_size} bytes, opened in {opened_ms:.2f} ms, "
+              f"peak RSS {peak_rss_mb():.1f} MB")
+        for name, (kind, _, extra) in store.columns.items():
+            print(f"  {name:20s} {kind}" + (f" ({len(extra)} values)" if kind == "label" else ""))
+    else:
+        store = QuestionStore(args.path)
+        filters = {name: getattr(args, name) for name in ("year", "paper", "subject", "topic")
+                   if getattr(args, name) is not None}
+        for index in store.where(**filters):
+            row = store[int(index)]
+            print(f"{pyq_db.question_id(row)}  [{row['subject']} / {row['topic']}]  {row['question_text'][:80]}")
@@ -0,0 +1,29 @@
+import re
+
+# Question text helpers shared by the search index and the near-duplicate
+# index. Kept free of database and export imports so the classifiers can use
+# near_duplicates.py without loading the export stack.
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "if", "in", "is", "it",
+    "its", "of", "on", "or", "that", "the", "this", "to", "was", "which", "with",
+}
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+(?:_[a-z0-9]+)?(?:\.[0-9]+)?')
+
+def tokenize(text):
+    """
+    Search terms of a text with inline MathJax. \\(\\Omega\\) gives "omega",
+    \\text{ V} gives "v", 90^\\circ gives "90" and "deg", and a subscripted
+    symbol such as V_1 or V_{in} gives both "v" and "v_1"/"v_in".
+    """
+    if not text:
+        return []
+    text = re.sub(r'\\[()\[\]]', ' ', text)
+    text = re.sub(r'\\(?:text|mathrm|mathbf|operatorname)\s*\{([^{}]*)\}', r' \1 ', text)
+    text = re.sub(r'\^\s*\{?\s*\\circ\s*\}?', ' deg ', text)
+    text = re.sub(r'\\?([A-Za-z]+)_\{?\\?([A-Za-z0-9]+)\}?', r' \1 \1_\2 ', text)
+    text = re.sub(r'\\([A-Za-z]+)', r' \1 ', text)
+    return [t for t in TOKEN_PATTERN.findall(text.lower()) if t not in STOPWORDS]
+
+def document_text(row):
+    return " ".join(row.get(key) or "" for key in ("question_text", "option_a", "option_b", "option_c", "option_d"))
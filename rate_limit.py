@@ -0,0 +1,62 @@
+import threading
+import time
+from urllib.parse import urlparse
+
+# Process-wide request limits per API host. Every paper, stage and worker
+# thread in a run draws from the same bucket, so adding papers adds queued
+# work rather than extra load on the provider. Hosts not listed are unlimited.
+RATE_LIMITS = {
+    "openrouter.ai": {"rate": 10.0, "burst": 20},  # requests per second, bucket size
+    "generativelanguage.googleapis.com": {"rate": 2.0, "burst": 4},
+}
+
+limiters = {}
+limiters_lock = threading.Lock()
+
+class TokenBucket:
+    """Blocking token bucket shared by all threads that use the same host"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Wait until a request may be sent, returns the seconds waited"""
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+def host_of(endpoint):
+    """Host name of a base URL or bare host"""
+    if not endpoint:
+        return None
+    return urlparse(endpoint).hostname if "//" in endpoint else endpoint.split(":")[0]
+
+def limiter_for(endpoint):
+    """Shared bucket for the endpoint's host, or None if it is not limited"""
+    host = host_of(endpoint)
+    limit = RATE_LIMITS.get(host)
+    if not limit:
+        return None
+    with limiters_lock:
+        if host not in limiters:
+            limiters[host] = TokenBucket(limit["rate"], limit["burst"])
+        return limiters[host]
+
+def acquire(endpoint):
+    """Block until the endpoint's host allows another request"""
+    limiter = limiter_for(endpoint)
+    if limiter:
+        limiter.acquire()
@@ -0,0 +1,135 @@
+import argparse
+import json
+import math
+import time
+import zlib
+from pathlib import Path
+
+import pyq_db
+import static_export
+from pipeline_log import get_logger
+from question_text import document_text, tokenize
+
+# Offline full-text index over question text and options. Terms are hashed
+# into SEARCH_CONFIG["shards"] posting files (crc32(term) % shards), so a
+# browser client loads docs.json once and then only the shards of the terms
+# it queries. Ranking is BM25.
+SEARCH_CONFIG = {
+    "out_dir": "site_data/search",
+    "shards": 32,
+    "k1": 1.2,
+    "b": 0.75,
+}
+
+logger = get_logger("search")
+
+def shard_of(term, shards):
+    return zlib.crc32(term.encode("utf-8")) % shards
+
+def build_index(rows):
+    """
+    Inverted index for PYQ rows.
+
+    Returns:
+        tuple: (docs, postings) where docs is {"ids", "lengths", "avgdl"} and
+        postings maps term -> ([doc number deltas], [term frequencies])
+    """
+    ids, lengths, term_docs = [], [], {}
+    for doc, row in enumerate(rows):
+        tokens = tokenize(document_text(row))
+        ids.append(pyq_db.question_id(row))
+        lengths.append(len(tokens))
+        counts = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        for term, tf in counts.items():
+            term_docs.setdefault(term, []).append((doc, tf))
+
+    postings = {}
+    for term, docs in term_docs.items():
+        # Doc numbers are ascending, so gaps keep the files small
+        deltas = [docs[0][0]] + [docs[i][0] - docs[i - 1][0] for i in range(1, len(docs))]
+        postings[term] = (deltas, [tf for _, tf in docs])
+
+    avgdl = sum(lengths) / max(len(lengths), 1)
+    return {"ids": ids, "lengths": lengths, "avgdl": round(avgdl, 3)}, postings
+
+def write_index(docs, postings, out_dir=None):
+    """Write docs.json and the posting shards, each with compressed copies"""
+    out_dir = Path(out_dir or SEARCH_CONFIG["out_dir"])
+    shards = [{} for _ in range(SEARCH_CONFIG["shards"])]
+    for term, posting in postings.items():
+        shards[shard_of(term, SEARCH_CONFIG["shards"])][term] = posting
+
+    files = {"docs.json": dict(docs, shards=SEARCH_CONFIG["shards"], k1=SEARCH_CONFIG["k1"], b=SEARCH_CONFIG["b"])}
+    for i, shard in enumerate(shards):
+        files[f"terms-{i:03d}.json"] = shard
+
+    for name, value in files.items():
+        data = static_export.serialize(value)
+        static_export.write_atomic(out_dir / name, data)
+        for suffix, encoded in static_export.compressed_variants(data).items():
+            static_export.write_atomic(out_dir / (name + suffix), encoded)
+
+    logger.info(f"Indexed {len(docs['ids'])} questions, {len(postings)} terms into {out_dir}")
+
+class SearchIndex:
+    """Ranked lookups over a written index; posting shards are loaded on first use"""
+
+    def __init__(self, index_dir=None):
+        self.index_dir = Path(index_dir or SEARCH_CONFIG["out_dir"])
+        with open(self.index_dir / "docs.json") as f:
+            self.docs = json.load(f)
+        self.shards = {}
+
+    def _postings(self, term):
+        shard = shard_of(term, self.docs["shards"])
+        if shard not in self.shards:
+            with open(self.index_dir / f"terms-{shard:03d}.json") as f:
+                self.shards[shard] = json.load(f)
+        return self.shards[shard].get(term)
+
+    def search(self, query, limit=10):
+        """Best matching question ids for query as (id, score) pairs"""
+        n = len(self.docs["ids"])
+        k1, b, avgdl = self.docs["k1"], self.docs["b"], self.docs["avgdl"] or 1.0
+        lengths = self.docs["lengths"]
+        scores = {}
+        for term in set(tokenize(query)):
+            posting = self._postings(term)
+            if not posting:
+                continue
+            deltas, tfs = posting
+            idf = math.log(1 + (n - len(deltas) + 0.5) / (len(deltas) + 0.5))
+            doc = 0
+            for delta, tf in zip(deltas, tfs):
+                doc += delta
+                norm = tf + k1 * (1 - b + b * lengths[doc] / avgdl)
+                scores[doc] = scores.get(doc, 0.0) + idf * tf * (k1 + 1) / norm
+
+        best = sorted(scores.items(), key=lambda item: -item[1])[:limit]
+        return [(self.docs["ids"][doc], round(score, 4)) for doc, score in best]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or query the question search index")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_parser = commands.add_parser("build", help="index PYQ rows")
+    build_parser.add_argument("--out", default=SEARCH_CONFIG["out_dir"])
+    build_parser.add_argument("--papers", help="comma-separated paper codes (default: all)")
+    query_parser = commands.add_parser("query", help="run a ranked lookup")
+    query_parser.add_argument("query")
+    query_parser.add_argument("--index", default=SEARCH_CONFIG["out_dir"])
+    query_parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        pyq_db.init_connection_pool()
+        rows = pyq_db.fetch_rows(args.papers.split(",") if args.papers else None)
+        write_index(*build_index(rows), args.out)
+    else:
+        started = time.perf_counter()
+        results = SearchIndex(args.index).search(args.query, args.limit)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        for question_id, score in results:
+            print(f"{score:8.3f}  {question_id}")
+        print(f"{len(results)} results in {elapsed_ms:.1f} ms")
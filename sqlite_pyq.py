@@ -0,0 +1,110 @@
+import re
+import sqlite3
+import threading
+import mysql.connector
+
+# SQLite stand-in for the MySQL PYQ database, used by benchmark.py. It
+# implements the small part of the mysql.connector pool/connection/cursor
+# API the classifiers use, translates their MySQL dialect and counts database
+# round trips. Lease mode (FOR UPDATE SKIP LOCKED) is not supported.
+PYQ_SCHEMA = """
+CREATE TABLE IF NOT EXISTS PYQ (
+    paper TEXT NOT NULL DEFAULT 'EE',
+    year INTEGER NOT NULL,
+    page_number INTEGER NOT NULL,
+    question_number INTEGER NOT NULL,
+    section TEXT NOT NULL,
+    question_text TEXT NOT NULL,
+    question_type TEXT NOT NULL,
+    option_a TEXT, option_b TEXT, option_c TEXT, option_d TEXT,
+    has_diagram INTEGER NOT NULL DEFAULT 0,
+    image_description TEXT, diagram_image TEXT,
+    subject TEXT, topic TEXT,
+    subject_confidence REAL, topic_confidence REAL,
+    lease_owner TEXT, lease_expires TEXT,
+    PRIMARY KEY (paper, year, page_number, question_number)
+);
+"""
+
+def translate(query):
+    """Rewrite the MySQL-specific parts of a classifier query for SQLite"""
+    query = query.replace("%s", "?")
+    query = query.replace("NOW()", "datetime('now')")
+    query = query.replace(" ON UPDATE CURRENT_TIMESTAMP", "")
+    query = query.replace("ON DUPLICATE KEY UPDATE", "ON CONFLICT DO UPDATE SET")
+    query = query.replace("INSERT IGNORE", "INSERT OR IGNORE")
+    return re.sub(r'VALUES\((\w+)\)', r'excluded.\1', query)
+
+class SQLiteCursor:
+    def __init__(self, connection, dictionary):
+        self.connection = connection
+        self.cursor = connection.raw.cursor()
+        self.dictionary = dictionary
+
+    def _run(self, method, query, params):
+        self.connection.pool.count_round_trip()
+        try:
+            return method(translate(query), params)
+        except sqlite3.Error as e:
+            raise mysql.connector.Error(msg=str(e))
+
+    def execute(self, query, params=()):
+        self._run(self.cursor.execute, query, tuple(params))
+
+    def executemany(self, query, seq_params):
+        self._run(self.cursor.executemany, query, [tuple(p) for p in seq_params])
+
+    def fetchall(self):
+        rows = self.cursor.fetchall()
+        if not self.dictionary:
+            return rows
+        columns = [d[0] for d in self.cursor.description]
+        return [dict(zip(columns, row)) for row in rows]
+
+    def close(self):
+        self.cursor.close()
+
+class SQLiteConnection:
+    def __init__(self, pool, raw):
+        self.pool = pool
+        self.raw = raw
+
+    def cursor(self, dictionary=False):
+        return SQLiteCursor(self, dictionary)
+
+    def start_transaction(self):
+        pass
+
+    def commit(self):
+        self.pool.count_round_trip()
+        self.raw.commit()
+
+    def rollback(self):
+        self.raw.rollback()
+
+    def close(self):
+        pass  # Connections are per thread and live as long as the pool
+
+class SQLitePool:
+    """Pool-like wrapper handing out one SQLite connection per thread"""
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.round_trips = 0
+
+        conn = sqlite3.connect(path)
+        conn.executescript(PYQ_SCHEMA)
+        conn.close()
+
+    def count_round_trip(self):
+        with self.lock:
+            self.round_trips += 1
+
+    def get_connection(self):
+        if not hasattr(self.local, "conn"):
+            raw = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            raw.execute("PRAGMA journal_mode=WAL")
+            self.local.conn = SQLiteConnection(self, raw)
+        return self.local.conn
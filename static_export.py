@@ -0,0 +1,244 @@
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+from pathlib import Path
+
+import mysql.connector
+
+import mathml_render
+import near_duplicates
+import pyq_db
+from pipeline_log import get_logger
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, shards are then only gzipped
+    brotli = None
+
+# Static export of the question bank for the website. Questions are grouped
+# into per-year, per-subject and per-topic shards of each paper, written as
+# minified JSON plus .gz/.br siblings under content-hashed names so they can be
+# cached forever. manifest.json maps shard names to their current files; a
+# rebuild only writes shards whose content hash changed.
+EXPORT_CONFIG = {
+    "out_dir": "site_data",
+    "hash_length": 12,
+    "gzip_level": 9,
+    "brotli_quality": 11,
+    "prune_stale": True,  # delete files of shards that changed or disappeared
+    "prerender_math": True,  # ship text/options as HTML with MathML (needs latex2mathml)
+    "similar_questions": True,  # add near-duplicate ids from near_duplicates.py's index
+    "diagram_dir": "diagrams",  # content-hashed copies of diagram_crops.py's crops, inside out_dir
+}
+
+MANIFEST_NAME = "manifest.json"
+
+logger = get_logger("export")
+
+def slug(text):
+    """File-name-safe lowercase form of a subject or topic"""
+    return re.sub(r'[^a-z0-9]+', '-', str(text).lower()).strip('-') or "none"
+
+def question_entry(row, images=None):
+    """Compact client representation of a PYQ row; images maps diagram_image to its exported URL"""
+    options = [row[f"option_{c}"] for c in "abcd" if row.get(f"option_{c}")]
+    entry = {
+        "id": pyq_db.question_id(row),
+        "year": row["year"],
+        "q": row["question_number"],
+        "section": row["section"],
+        "type": row["question_type"],
+        "text": row["question_text"],
+        "subject": row["subject"],
+        "topic": row["topic"],
+    }
+    if options:
+        entry["options"] = options
+    if row["has_diagram"]:
+        entry["diagram"] = row["image_description"] or True
+        if images and row["diagram_image"] in images:
+            entry["image"] = images[row["diagram_image"]]
+    return entry
+
+def text_format():
+    """Format of the exported text and options: "html+mathml" or raw "tex" """
+    return "html+mathml" if EXPORT_CONFIG["prerender_math"] and mathml_render.available() else "tex"
+
+def export_diagrams(rows, out_dir):
+    """
+    Copy the crops of rows into out_dir under content-hashed names.
+
+    Returns:
+        dict: diagram_image -> URL relative to out_dir, for the crops that exist
+    """
+    images = {}
+    copied = 0
+    for source in sorted({row["diagram_image"] for row in rows if row["has_diagram"] and row["diagram_image"]}):
+        path = Path(source)
+        if not path.exists():
+            logger.warning(f"Diagram {source} not found; exporting its question without an image")
+            continue
+        data = path.read_bytes()
+        content_hash = hashlib.sha256(data).hexdigest()[:EXPORT_CONFIG["hash_length"]]
+        url = f"{EXPORT_CONFIG['diagram_dir']}/{content_hash}{path.suffix}"
+        if not (out_dir / url).exists():
+            write_atomic(out_dir / url, data)
+            copied += 1
+        images[source] = url
+    if images:
+        logger.info(f"Diagrams: {len(images)} exported, {copied} new")
+    return images
+
+def build_shards(rows, images=None):
+    """Shard name -> list of question entries, by year, subject and topic per paper"""
+    prerender = text_format() == "html+mathml"
+    similar = near_duplicates.get_index() if EXPORT_CONFIG["similar_questions"] else None
+    shards = {}
+    for row in rows:
+        entry = question_entry(row, images)
+        if similar:
+            cluster = similar.cluster(entry["id"])
+            if cluster:
+                entry["similar"] = cluster
+        if prerender:
+            entry = mathml_render.render_entry(entry)
+        paper = row["paper"]
+        shards.setdefault(f"{paper}/year/{row['year']}", []).append(entry)
+        if row["subject"]:
+            shards.setdefault(f"{paper}/subject/{slug(row['subject'])}", []).append(entry)
+            if row["topic"]:
+                shards.setdefault(f"{paper}/topic/{slug(row['subject'])}/{slug(row['topic'])}", []).append(entry)
+    return shards
+
+def serialize(value):
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False, sort_keys=True).encode("utf-8")
+
+def write_atomic(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def compressed_variants(data):
+    """Encoded copies of data by file suffix"""
+    variants = {".gz": gzip.compress(data, EXPORT_CONFIG["gzip_level"], mtime=0)}
+    if brotli:
+        variants[".br"] = brotli.compress(data, quality=EXPORT_CONFIG["brotli_quality"])
+    return variants
+
+def load_manifest(out_dir):
+    path = out_dir / MANIFEST_NAME
+    if not path.exists():
+        return {"shards": {}}
+    with open(path) as f:
+        return json.load(f)
+
+def shard_files(shard_info):
+    """Every file belonging to a manifest shard entry"""
+    return [shard_info["file"]] + [shard_info["file"] + suffix for suffix in shard_info.get("encodings", [])]
+
+def export(out_dir=None, paper_codes=None, force=False):
+    """
+    Write changed shards and the manifest.
+
+    Args:
+        out_dir: Output directory (default EXPORT_CONFIG["out_dir"])
+        paper_codes: Papers to export, None for all
+        force: Rewrite every shard even if its content hash is unchanged
+
+    Returns:
+        dict: Counts of written, unchanged and removed shards, or None if the
+        export was aborted and the previous one left untouched
+    """
+    out_dir = Path(out_dir or EXPORT_CONFIG["out_dir"])
+    old_manifest = load_manifest(out_dir)
+    old_shards = old_manifest["shards"]
+
+    try:
+        rows = pyq_db.fetch_rows(paper_codes)
+    except mysql.connector.Error as e:
+        logger.error(f"Error retrieving records, export aborted: {e}")
+        return None
+    # An empty result where the last export had questions is far more likely a
+    # broken database than an emptied bank; pruning would take the site down
+    replaced = [name for name in old_shards if not paper_codes or name.split("/")[0] in paper_codes]
+    if not rows and replaced:
+        logger.error(f"PYQ returned no questions but {out_dir / MANIFEST_NAME} lists {len(replaced)} shards; "
+                     f"export aborted")
+        return None
+    if EXPORT_CONFIG["prerender_math"] and not mathml_render.available():
+        logger.warning("latex2mathml is not installed; exporting raw MathJax")
+    mathml_render.load_cache()
+    shards = build_shards(rows, export_diagrams(rows, out_dir))
+    if text_format() == "html+mathml":
+        mathml_render.save_cache()
+        math_stats = mathml_render.write_report()
+        logger.info(f"MathML: {math_stats['misses']} expressions converted, {math_stats['hits']} cache hits, "
+                    f"{math_stats['failed']} failed (see {mathml_render.MATHML_CONFIG['report_file']})")
+    if paper_codes:
+        # Keep other papers' shards from the previous export
+        shards_kept = {name: info for name, info in old_shards.items() if name.split("/")[0] not in paper_codes}
+    else:
+        shards_kept = {}
+
+    new_shards = dict(shards_kept)
+    written = unchanged = 0
+    for name, entries in sorted(shards.items()):
+        data = serialize(entries)
+        content_hash = hashlib.sha256(data).hexdigest()[:EXPORT_CONFIG["hash_length"]]
+        file_name = f"{name}.{content_hash}.json"
+
+        old = old_shards.get(name)
+        if not force and old and old["hash"] == content_hash and (out_dir / file_name).exists():
+            new_shards[name] = old
+            unchanged += 1
+            continue
+
+        write_atomic(out_dir / file_name, data)
+        info = {"file": file_name, "hash": content_hash, "count": len(entries), "bytes": len(data), "encodings": []}
+        for suffix, encoded in compressed_variants(data).items():
+            write_atomic(out_dir / (file_name + suffix), encoded)
+            info["encodings"].append(suffix)
+            info[f"{suffix[1:]}_bytes"] = len(encoded)
+        new_shards[name] = info
+        written += 1
+
+    manifest = {
+        "version": hashlib.sha256(serialize({n: s["hash"] for n, s in new_shards.items()})).hexdigest()[:12],
+        "papers": sorted({name.split("/")[0] for name in new_shards}),
+        "text_format": text_format(),
+        "shards": new_shards,
+    }
+    manifest_data = serialize(manifest)
+    write_atomic(out_dir / MANIFEST_NAME, manifest_data)
+    write_atomic(out_dir / (MANIFEST_NAME + ".gz"), gzip.compress(manifest_data, EXPORT_CONFIG["gzip_level"], mtime=0))
+
+    # Files of replaced or vanished shards are only removed once the new manifest is in place
+    removed = 0
+    if EXPORT_CONFIG["prune_stale"]:
+        live = {f for info in new_shards.values() for f in shard_files(info)}
+        for name, info in old_shards.items():
+            for file_name in shard_files(info):
+                if file_name not in live and (out_dir / file_name).exists():
+                    (out_dir / file_name).unlink()
+            if name not in new_shards:
+                removed += 1
+
+    logger.info(f"Exported {len(rows)} questions to {out_dir}: {written} shards written, "
+                f"{unchanged} unchanged, {removed} removed")
+    return {"written": written, "unchanged": unchanged, "removed": removed}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the question bank as precompressed static shards")
+    parser.add_argument("--out", default=EXPORT_CONFIG["out_dir"])
+    parser.add_argument("--papers", help="comma-separated paper codes (default: all)")
+    parser.add_argument("--force", action="store_true", help="rewrite every shard")
+    args = parser.parse_args()
+
+    pyq_db.init_connection_pool()
+    if export(args.out, args.papers.split(",") if args.papers else None, args.force) is None:
+        raise SystemExit(1)
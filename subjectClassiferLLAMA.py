@@ -1,33 +1,28 @@
 import mysql.connector
+import argparse
 import concurrent.futures
+import math
+import os
 import re
+import socket
 import time
 from openai import OpenAI
 from mysql.connector import pooling
-
-# Subject lists
-ee_subjects = [
-    "Engineering Mathematics",
-    "Electric circuits",
-    "Electromagnetic Fields",
-    "Signals and Systems",
-    "Electrical Machines",
-    "Power Systems",
-    "Control Systems",
-    "Electrical and Electronic Measurements",
-    "Analog Electronics",
-    "Digital Electronics",
-    "Power Electronics"
-]
-
-ga_subjects = [
-    "Verbal Aptitude",
-    "Quantitative Aptitude",
-    "Analytical Aptitude",
-    "Spatial Aptitude"
-]
+import analytics_cube
+import dead_letter
+import llm_usage
+import near_duplicates
+import papers
+import rate_limit
+from hedging import HedgedCaller
+from pipeline_log import ProgressReporter, get_logger
+from tracing import span, traced
 
 # Database connection details - replace with your actual credentials
+# PYQ must have the paper column: every query and update is keyed by it. Tables
+# created before multi-paper runs need this migration (main() checks for it):
+#   ALTER TABLE PYQ ADD paper VARCHAR(8) NOT NULL DEFAULT 'EE' FIRST,
+#       DROP PRIMARY KEY, ADD PRIMARY KEY (paper, year, page_number, question_number);
 DB_CONFIG = {
     'host': '',
     'user': '',
@@ -42,67 +37,260 @@ PROVIDER_CONFIG = {
     "model": "meta-llama/llama-3.1-70b-instruct",
 }
 
+# Hedging: if the primary provider has not answered by the given latency
+# percentile, the same prompt also goes to FALLBACK_PROVIDER_CONFIG and the
+# first valid answer wins. max_hedge_rate caps hedges as a share of all calls.
+FALLBACK_PROVIDER_CONFIG = {
+    "base_url": "https://openrouter.ai/api/v1",
+    "api_key": "",
+    "model": "meta-llama/llama-3.1-8b-instruct",
+}
+
+HEDGE_CONFIG = {
+    "enabled": False,
+    "percentile": 0.95,
+    "max_hedge_rate": 0.1,
+    "min_samples": 20,
+    "initial_delay": 15.0,  # seconds, used until min_samples latencies are seen
+}
+
+# Output mode: "xml" asks for the full <subject>...</subject> string, "code"
+# numbers the subject list and asks for the number only. Codes are mapped back
+# locally, so there is nothing to misspell and only a few output tokens.
+OUTPUT_MODE = "xml"
+
+CODE_MODE_CONFIG = {
+    "max_tokens": 4,
+    "logprobs": True,  # Set False for providers/models that reject logprobs
+    "top_logprobs": 5,
+}
+
+# Column that receives the top-probability margin in code mode (None to skip).
+# To record it: ALTER TABLE PYQ ADD subject_confidence FLOAT NULL;
+# then set CONFIDENCE_COLUMN = "subject_confidence"
+CONFIDENCE_COLUMN = None
+
+# Skip rows already in the dead-letter table (see dead_letter.py redrive)
+SKIP_DEAD_LETTERS = True
+
+# Copy the subject of a labeled near duplicate from another year (see
+# near_duplicates.py) instead of calling the model. Only then are labels also
+# written back to the index; otherwise `near_duplicates.py build` refreshes it.
+REUSE_NEAR_DUPLICATES = False
+
+# Paper codes to classify, e.g. ["EE", "CS"] (None for every paper in PYQ).
+# Subject and topic lists come from the paper definitions in papers/.
+PAPER_FILTER = None
+
+# Lease mode lets workers on several hosts share the PYQ table. Each worker
+# claims a chunk of rows with SELECT ... FOR UPDATE SKIP LOCKED (MySQL 8.0+)
+# and stamps a lease on them; rows whose lease expired are claimable again.
+# Requires: ALTER TABLE PYQ ADD lease_owner VARCHAR(128) NULL,
+#                           ADD lease_expires DATETIME NULL;
+LEASE_CONFIG = {
+    "chunk_size": 5,
+    "lease_seconds": 600,
+    "claim_retries": 5,  # failed claims in a row before a worker gives up
+    "retry_delay": 2.0,  # seconds, doubled after each failed claim
+}
+
+logger = get_logger("subject")
+
 # Create a connection pool
 connection_pool = None
 
+# Rate-limited progress summary for the current run
+progress = None
+
+# Hedged request runner, created by init_hedger when hedging is enabled
+hedger = None
+
 def init_connection_pool():
     """Initialize connection pool"""
     global connection_pool
+    if connection_pool is not None:
+        return  # Already initialized (or provided by the caller)
     try:
         connection_pool = pooling.MySQLConnectionPool(
             pool_name="mypool",
             pool_size=10,
             **DB_CONFIG
         )
-        print("Connection pool created successfully")
+        logger.info("Connection pool created successfully")
     except Exception as e:
-        print(f"Error creating connection pool: {e}")
+        logger.error(f"Error creating connection pool: {e}")
+
+def init_hedger():
+    """Initialize the hedged request runner if HEDGE_CONFIG enables it"""
+    global hedger
+    if HEDGE_CONFIG["enabled"]:
+        hedger = HedgedCaller(
+            PROVIDER_CONFIG,
+            FALLBACK_PROVIDER_CONFIG,
+            percentile=HEDGE_CONFIG["percentile"],
+            max_hedge_rate=HEDGE_CONFIG["max_hedge_rate"],
+            min_samples=HEDGE_CONFIG["min_samples"],
+            initial_delay=HEDGE_CONFIG["initial_delay"],
+        )
 
+@traced("db.pool_get")
 def get_connection_from_pool():
     """Get a connection from the pool"""
     global connection_pool
     try:
         return connection_pool.get_connection()
     except Exception as e:
-        print(f"Error getting connection from pool: {e}")
+        logger.error(f"Error getting connection from pool: {e}")
         return None
 
+def check_paper_column():
+    """True if PYQ has the paper column; logs the required migration otherwise"""
+    conn = None
+    try:
+        conn = get_connection_from_pool()
+        if not conn:
+            logger.error("Failed to get database connection from pool")
+            return False
+        cursor = conn.cursor()
+        cursor.execute("SELECT paper FROM PYQ LIMIT 0")
+        cursor.fetchall()
+        cursor.close()
+        return True
+    except mysql.connector.Error as e:
+        logger.error(f"Cannot read PYQ.paper ({e}). Add the column with the migration "
+                     f"documented next to DB_CONFIG before classifying.")
+        return False
+    finally:
+        if conn:
+            conn.close()
+
+@traced("db.fetch_unclassified")
 def get_unclassified_records():
     """Get records from database where subject IS NULL"""
     conn = None
     try:
         conn = get_connection_from_pool()
         cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT * FROM PYQ WHERE subject IS NULL")
+        query = "SELECT * FROM PYQ WHERE subject IS NULL"
+        if SKIP_DEAD_LETTERS:
+            query += " AND " + dead_letter.skip_clause("subject")
+        if PAPER_FILTER:
+            query += " AND " + papers.paper_clause(PAPER_FILTER)
+        cursor.execute(query)
         records = cursor.fetchall()
         cursor.close()
         return records
     except mysql.connector.Error as e:
-        print(f"Error retrieving records: {e}")
+        logger.error(f"Error retrieving records: {e}")
         return []
     finally:
         if conn:
             conn.close()
 
-def update_subject(year, page_number, question_number, subject):
+def claim_records(owner, chunk_size):
+    """
+    Atomically claim up to chunk_size unleased (or expired) records for owner.
+
+    Returns:
+        list: Claimed records, empty when nothing is left to claim, or None
+        if the claim failed (no connection or a database error)
+    """
+    conn = None
+    try:
+        conn = get_connection_from_pool()
+        if not conn:
+            return None
+
+        conn.start_transaction()
+        cursor = conn.cursor(dictionary=True)
+        query = """SELECT * FROM PYQ
+               WHERE subject IS NULL
+                 AND (lease_expires IS NULL OR lease_expires < NOW())"""
+        if SKIP_DEAD_LETTERS:
+            query += " AND " + dead_letter.skip_clause("subject")
+        if PAPER_FILTER:
+            query += " AND " + papers.paper_clause(PAPER_FILTER)
+        cursor.execute(
+            query + """
+               ORDER BY paper, year, page_number, question_number
+               LIMIT %s
+               FOR UPDATE SKIP LOCKED""",
+            (chunk_size,)
+        )
+        records = cursor.fetchall()
+
+        if records:
+            cursor.executemany(
+                """UPDATE PYQ SET lease_owner = %s,
+                          lease_expires = NOW() + INTERVAL %s SECOND
+                   WHERE paper = %s AND year = %s AND page_number = %s AND question_number = %s""",
+                [(owner, LEASE_CONFIG["lease_seconds"], r['paper'], r['year'], r['page_number'], r['question_number'])
+                 for r in records]
+            )
+        conn.commit()
+        cursor.close()
+        return records
+    except mysql.connector.Error as e:
+        logger.error(f"Error claiming records: {e}")
+        if conn:
+            conn.rollback()
+        return None
+    finally:
+        if conn:
+            conn.close()
+
+def release_leases(records, owner):
+    """Release the leases owner holds on records"""
+    if not records:
+        return
+    conn = None
+    try:
+        conn = get_connection_from_pool()
+        if not conn:
+            return
+
+        cursor = conn.cursor()
+        cursor.executemany(
+            """UPDATE PYQ SET lease_owner = NULL, lease_expires = NULL
+               WHERE paper = %s AND year = %s AND page_number = %s AND question_number = %s
+                 AND lease_owner = %s""",
+            [(r['paper'], r['year'], r['page_number'], r['question_number'], owner) for r in records]
+        )
+        conn.commit()
+        cursor.close()
+    except mysql.connector.Error as e:
+        logger.error(f"Error releasing leases: {e}")
+        if conn:
+            conn.rollback()
+    finally:
+        if conn:
+            conn.close()
+
+@traced("db.update")
+def update_subject(paper, year, page_number, question_number, subject, confidence=None):
     """Update the subject field for a specific record with a fresh connection"""
     conn = None
     try:
         conn = get_connection_from_pool()
         if not conn:
-            print("Failed to get database connection from pool")
+            logger.error("Failed to get database connection from pool")
             return False
 
         cursor = conn.cursor()
-        query = """UPDATE PYQ SET subject = %s
-                   WHERE year = %s AND page_number = %s AND question_number = %s"""
-        params = (subject, year, page_number, question_number)
+        if confidence is not None and CONFIDENCE_COLUMN:
+            query = f"""UPDATE PYQ SET subject = %s, {CONFIDENCE_COLUMN} = %s
+                   WHERE paper = %s AND year = %s AND page_number = %s AND question_number = %s"""
+            params = (subject, confidence, paper, year, page_number, question_number)
+        else:
+            query = """UPDATE PYQ SET subject = %s
+                   WHERE paper = %s AND year = %s AND page_number = %s AND question_number = %s"""
+            params = (subject, paper, year, page_number, question_number)
         cursor.execute(query, params)
         conn.commit()
         cursor.close()
         return True
     except mysql.connector.Error as e:
-        print(f"Error updating record: {e}")
+        logger.error(f"Error updating record: {e}")
         if conn:
             conn.rollback()
         return False
@@ -125,37 +313,140 @@ def validate_xml_response(response, subjects):
 
         return None
     except Exception as e:
-        print(f"Error validating XML: {e}")
+        logger.error(f"Error validating XML: {e}")
         return None
 
-def query_deepseek(system_prompt, question_prompt):
-    """Query the DeepSeek API"""
+def label_codes(labels):
+    """Number the labels 1..N so the model can answer with a short code"""
+    return {str(i): label for i, label in enumerate(labels, start=1)}
+
+def validate_code_response(response, subjects):
+    """Map a numeric code response back to its subject"""
+    match = re.search(r'\d+', response)
+    if not match:
+        return None
+
+    return label_codes(subjects).get(match.group(0))
+
+def parse_label(response, subjects):
+    """Validate a response in the current OUTPUT_MODE and extract the subject"""
+    if OUTPUT_MODE == "code":
+        return validate_code_response(response, subjects)
+    return validate_xml_response(response, subjects)
+
+def code_confidence(choice):
+    """
+    Margin between the probability of the returned code and of the most
+    likely other code, or None without logprobs. A code such as "12" can span
+    several tokens, so its probability is the product over all of them; an
+    alternative shares the prefix up to the token where it diverges.
+    """
+    logprobs = getattr(choice, "logprobs", None)
+    if not logprobs or not logprobs.content:
+        return None
+
+    tokens = logprobs.content
+    start = next((i for i, t in enumerate(tokens) if t.token.strip().isdigit()), None)
+    if start is None:
+        return None
+    end = start
+    while end < len(tokens) and tokens[end].token.strip().isdigit():
+        end += 1
+
+    code_prob = 1.0
+    runner_up = 0.0
+    for token_info in tokens[start:end]:
+        alternatives = [math.exp(c.logprob) for c in token_info.top_logprobs or [] if c.token != token_info.token]
+        if alternatives:
+            runner_up = max(runner_up, code_prob * max(alternatives))
+        code_prob *= math.exp(token_info.logprob)
+    return round(max(code_prob - runner_up, 0.0), 4)
+
+def build_request(system_prompt, question_prompt, provider=None, **create_kwargs):
+    """Chat completion request body; create_kwargs are added to it as is"""
+    provider = provider or PROVIDER_CONFIG
+    request = {
+        "model": provider.get("model"),
+        "messages": [
+            {
+                "role": "user",
+                "content": system_prompt + question_prompt
+            }
+        ],
+        "temperature": 0.5,
+    }
+    request.update(create_kwargs)
+    return request
+
+def code_mode_arguments():
+    """Extra request arguments for code mode: a short completion and, if enabled, logprobs"""
+    arguments = {"max_tokens": CODE_MODE_CONFIG["max_tokens"]}
+    if CODE_MODE_CONFIG["logprobs"]:
+        arguments["logprobs"] = True
+        arguments["top_logprobs"] = CODE_MODE_CONFIG["top_logprobs"]
+    return arguments
+
+def request_completion(system_prompt, question_prompt, provider=None, **create_kwargs):
+    """Send one rate-limited, usage-tracked chat completion; None on API errors"""
     try:
+        provider = provider or PROVIDER_CONFIG
         client = OpenAI(
-            base_url=PROVIDER_CONFIG.get("base_url"),
-            api_key=PROVIDER_CONFIG.get("api_key"),
-        )
-
-        completion = client.chat.completions.create(
-            model=PROVIDER_CONFIG.get("model"),
-            messages=[
-                {
-                    "role": "user",
-                    "content": system_prompt + question_prompt
-                }
-            ],
-            temperature=0.5,
+            base_url=provider.get("base_url"),
+            api_key=provider.get("api_key"),
         )
 
-        return completion.choices[0].message.content
+        rate_limit.acquire(provider.get("base_url"))
+        started = time.monotonic()
+        try:
+            with span("llm.chat", model=provider.get("model")):
+                completion = client.chat.completions.create(
+                    **build_request(system_prompt, question_prompt, provider, **create_kwargs))
+        except Exception:
+            llm_usage.record_call("subject", provider.get("model"), {}, time.monotonic() - started, "error")
+            raise
+        llm_usage.record_call("subject", provider.get("model"), llm_usage.usage_from_openai(completion),
+                              time.monotonic() - started)
+        return completion
     except Exception as e:
-        print(f"Error querying API: {e}")
+        logger.error(f"Error querying API: {e}")
         time.sleep(2)  # Add delay on API error
         return None
+
+def query_deepseek(system_prompt, question_prompt, provider=None):
+    """Query the DeepSeek API"""
+    completion = request_completion(system_prompt, question_prompt, provider)
+    return completion.choices[0].message.content if completion else None
+
+def query_label_code(system_prompt, question_prompt, provider=None):
+    """Query the API for a short label code, returns (content, confidence)"""
+    completion = request_completion(system_prompt, question_prompt, provider, **code_mode_arguments())
+    if not completion:
+        return None, None
+    choice = completion.choices[0]
+    return choice.message.content, code_confidence(choice)
+
+def query_model(system_prompt, question_prompt, provider=None):
+    """Query in the current OUTPUT_MODE, returns (response, confidence)"""
+    if OUTPUT_MODE == "code":
+        return query_label_code(system_prompt, question_prompt, provider)
+    return query_deepseek(system_prompt, question_prompt, provider), None
+
 def construct_prompt(record):
     """Construct prompt based on record data with strict formatting instructions."""
-    # Select the appropriate subject list based on the question's section.
-    subjects = ee_subjects if record['section'] == 'EE' else ga_subjects
+    # Select the subject list of the question's section (its paper or GA).
+    subjects = papers.subjects_for(record['section'])
+    if not subjects:
+        return None, None, []
+
+    if OUTPUT_MODE == "code":
+        numbered = "\n".join(f"{code}. {label}" for code, label in label_codes(subjects).items())
+        system_prompt = f"""You are an extremely precise classifier for GATE exam questions.
+Choose the single, most appropriate subject for the question from this numbered list:
+{numbered}
+Respond with ONLY the number of the chosen subject and nothing else.
+Now, classify the following question:
+"""
+        return system_prompt, format_question(record), subjects
 
     # System prompt with strict instructions.
     system_prompt = f"""You are an extremely precise classifier for GATE exam questions.
@@ -167,12 +458,15 @@ IMPORTANT:
 3. The required format is EXACTLY:
     <subject>Your Chosen Subject</subject>
 No extra whitespace, punctuation, text, explanations, or line breaks are allowed.
-For example, if the correct subject is Electrical Machines, your entire response must be:
-<subject>Electrical Machines</subject>
+For example, if the correct subject is {subjects[0]}, your entire response must be:
+<subject>{subjects[0]}</subject>
 Now, classify the following question:
 """
 
-    # Question prompt with the actual question content.
+    return system_prompt, format_question(record), subjects
+
+def format_question(record):
+    """Question prompt with the actual question content."""
     question_prompt = f"Question: {record['question_text']}\n"
 
     # If the question has options, add them.
@@ -186,93 +480,144 @@ Now, classify the following question:
     if record['has_diagram'] and record['image_description']:
         question_prompt += f"Image Description: {record['image_description']}\n"
 
-    return system_prompt, question_prompt, subjects
+    return question_prompt
 
+@traced("subject.classify")
 def process_record(record):
     """Process a single record with retry logic and detailed logging."""
     max_retries = 5
     retry_count = 0
+    last_response = None
+    reason = "API error"
 
     while retry_count < max_retries:
         # Construct prompt
         system_prompt, question_prompt, subjects = construct_prompt(record)
-        record_identifier = f"year={record['year']}, page={record['page_number']}, question={record['question_number']}"
+
+        if system_prompt is None or not subjects:
+            logger.warning(f"No subjects defined for section: {record['section']}")
+            dead_letter.record_failure(get_connection_from_pool, record, "subject", "no subjects defined for section")
+            return record, None, None
+
+        record_identifier = f"paper={record['paper']}, year={record['year']}, page={record['page_number']}, question={record['question_number']}"
+        llm_usage.set_record(f"{record['paper']}/{record['year']}/{record['page_number']}/{record['question_number']}")
         # print(f"Processing record: {record_identifier}")
 
         # Query the model
+        confidence = None
         try:
-            response = query_deepseek(system_prompt, question_prompt)
+            if hedger:
+                response, confidence = hedger.call(
+                    lambda provider: query_model(system_prompt, question_prompt, provider),
+                    lambda result: bool(result[0]) and parse_label(result[0], subjects) is not None
+                )
+            else:
+                response, confidence = query_model(system_prompt, question_prompt)
         except Exception as e:
-            print(f"API call failed for record {record_identifier}: {e}")
+            logger.error(f"API call failed: {e}", extra={"record_id": record_identifier})
             response = None  # Set response to None to force a retry
 
         if response:
-            print(f"Raw API response for {record_identifier}:\n{response}")  # Log the raw response
+            last_response = response
+            logger.debug("Raw API response", extra={"record_id": record_identifier, "response": response})
 
             # Validate the response
-            subject = validate_xml_response(response, subjects)
+            subject = parse_label(response, subjects)
 
             if subject:
                 # print(f"Successfully classified {record_identifier} as: {subject}")
-                return record, subject
+                return record, subject, confidence
             else:
-                print(f"Invalid XML or subject for {record_identifier}. Response: {response}")
+                reason = "invalid response"
+                llm_usage.mark_invalid("subject")
+                logger.warning("Invalid XML or subject", extra={"record_id": record_identifier, "response": response})
         else:
-                print(f"API returned None (likely an error) for {record_identifier}.")
+                logger.warning("API returned None (likely an error)", extra={"record_id": record_identifier})
 
         retry_count += 1
-        print(f"Retry {retry_count}/{max_retries} for record {record_identifier}")
+        logger.debug(f"Retry {retry_count}/{max_retries}", extra={"record_id": record_identifier, "attempt": retry_count})
         time.sleep(2)  # Increased delay: API calls can be slow
 
-    print(f"Failed to classify record {record_identifier} after {max_retries} retries")
-    return record, None
+    logger.error(f"Failed to classify after {max_retries} retries", extra={"record_id": record_identifier, "reason": reason})
+    dead_letter.record_failure(get_connection_from_pool, record, "subject", reason, last_response, max_retries)
+    return record, None, None
+
+def store_label(record, subject, confidence=None):
+    """
+    Write a subject to PYQ (retrying once) and keep the analytics cube (and,
+    with REUSE_NEAR_DUPLICATES, the near-duplicate index) in step. Used by
+    classify_and_update and by batch_classifier.py; a subject of None clears it.
+
+    Returns:
+        bool: True if PYQ was updated
+    """
+    for attempt in range(2):
+        if attempt:
+            time.sleep(2)  # If update fails, wait and retry once
+        # Update the database - using a fresh connection each time
+        if update_subject(record['paper'], record['year'], record['page_number'], record['question_number'], subject, confidence):
+            record['subject'] = subject
+            if REUSE_NEAR_DUPLICATES:
+                near_duplicates.record_label(record, "subject", subject)
+            analytics_cube.update_records([record])
+            return True
+    return False
+
+def classify_and_update(record, worker_id):
+    """Classify one record and write the subject, returns True on success"""
+    subject = near_duplicates.reused_label(record, "subject") if REUSE_NEAR_DUPLICATES else None
+    if subject:
+        confidence = None
+    else:
+        # Process the record
+        _, subject, confidence = process_record(record)
+
+    if subject:
+        if store_label(record, subject, confidence):
+            return True
+        dead_letter.record_failure(get_connection_from_pool, record, "subject", "database update failed", subject)
+
+    return False
 
 def worker_function(records, worker_id):
     """Worker function to process a batch of records"""
     processed_count = 0
     total_count = len(records)
 
-    print(f"Worker {worker_id}: Started processing {total_count} records.")
+    logger.debug(f"Worker {worker_id}: Started processing {total_count} records.")
 
     for record in records:
-        # Process the record
-        _, subject = process_record(record)
-
-        if subject:
-            # Update the database - using a fresh connection each time
-            success = update_subject(record['year'], record['page_number'], record['question_number'], subject)
-
-            if success:
-                processed_count += 1
-                # print(f"Worker {worker_id}: Updated record year={record['year']}, page={record['page_number']}, question={record['question_number']} with subject={subject}")
-            else:
-                # If update fails, wait and retry once
-                time.sleep(2)
-                success = update_subject(record['year'], record['page_number'], record['question_number'], subject)
-                if success:
-                    processed_count += 1
-                    print(f"Worker {worker_id}: Updated record on retry: year={record['year']}, page={record['page_number']}, question={record['question_number']} with subject={subject}")
+        success = classify_and_update(record, worker_id)
+        if success:
+            processed_count += 1
+        if progress:
+            progress.advance(success)
 
         # Small delay between records to prevent overwhelming the database
         time.sleep(0.3)
 
-    print(f"Worker {worker_id}: Completed. Processed {processed_count}/{total_count} records.")
+    logger.info(f"Worker {worker_id}: Completed. Processed {processed_count}/{total_count} records.")
     return processed_count
 
 def main():
     """Main function to orchestrate the classification process"""
+    global progress
     # Initialize the connection pool
     init_connection_pool()
+    if not check_paper_column():
+        return
+    init_hedger()
+    dead_letter.ensure_table(get_connection_from_pool)
 
     # Get unclassified records
     records = get_unclassified_records()
 
     if not records:
-        print("No unclassified records found. Exiting.")
+        logger.info("No unclassified records found. Exiting.")
         return
 
     total_records = len(records)
-    print(f"Found {total_records} unclassified records.")
+    logger.info(f"Found {total_records} unclassified records.")
 
     # Define number of workers (reduced to avoid overwhelming the connection pool)
     num_workers = 20
@@ -287,14 +632,98 @@ def main():
             worker_batches.append(batch)
 
     # Process records using multiple workers
+    progress = ProgressReporter(logger, "Subject classification", total_records)
     with concurrent.futures.ThreadPoolExecutor(max_workers=num_workers) as executor:
         futures = [executor.submit(worker_function, batch, i) for i, batch in enumerate(worker_batches)]
 
         # Wait for all workers to complete
         processed_counts = [future.result() for future in concurrent.futures.as_completed(futures)]
+    progress.finish()
 
     total_processed = sum(processed_counts)
-    print(f"Classification completed. Successfully processed {total_processed}/{total_records} records.")
+    logger.info(f"Classification completed. Successfully processed {total_processed}/{total_records} records.")
+    if hedger:
+        logger.info(hedger.summary())
+    if REUSE_NEAR_DUPLICATES:
+        near_duplicates.save_index()
+    analytics_cube.flush()
+    llm_usage.print_run_summary()
+
+def lease_worker_function(worker_id):
+    """Worker function that keeps claiming leased chunks until none are left"""
+    owner = f"{socket.gethostname()}:{os.getpid()}:{worker_id}"
+    processed_count = 0
+
+    logger.debug(f"Worker {worker_id}: Claiming records as {owner}.")
+
+    failed_claims = 0
+    while True:
+        records = claim_records(owner, LEASE_CONFIG["chunk_size"])
+        if records is None:
+            # Pool exhausted or a transient database error: back off instead of stopping
+            failed_claims += 1
+            if failed_claims > LEASE_CONFIG["claim_retries"]:
+                logger.error(f"Worker {worker_id}: Giving up after {failed_claims} failed claims.")
+                break
+            delay = LEASE_CONFIG["retry_delay"] * 2 ** (failed_claims - 1)
+            logger.warning(f"Worker {worker_id}: Claim failed, retrying in {delay:.0f}s.")
+            time.sleep(delay)
+            continue
+        failed_claims = 0
+        if not records:
+            break
+
+        done = []
+        for record in records:
+            success = classify_and_update(record, worker_id)
+            if success:
+                processed_count += 1
+                done.append(record)
+            if progress:
+                progress.advance(success)
+
+            # Small delay between records to prevent overwhelming the database
+            time.sleep(0.3)
+
+        # Failed records keep their lease so they are only retried once it expires
+        release_leases(done, owner)
+
+    logger.info(f"Worker {worker_id}: Completed. Processed {processed_count} claimed records.")
+    return processed_count
+
+def main_leased(num_workers=10):
+    """Run lease-based workers that can share the database with other hosts"""
+    global progress
+    init_connection_pool()
+    if not check_paper_column():
+        return
+    init_hedger()
+    dead_letter.ensure_table(get_connection_from_pool)
+
+    progress = ProgressReporter(logger, "Subject classification")
+    with concurrent.futures.ThreadPoolExecutor(max_workers=num_workers) as executor:
+        futures = [executor.submit(lease_worker_function, i) for i in range(num_workers)]
+        processed_counts = [future.result() for future in concurrent.futures.as_completed(futures)]
+    progress.finish()
+
+    logger.info(f"Leased classification completed. Successfully processed {sum(processed_counts)} records.")
+    if hedger:
+        logger.info(hedger.summary())
+    if REUSE_NEAR_DUPLICATES:
+        near_duplicates.save_index()
+    analytics_cube.flush()
+    llm_usage.print_run_summary()
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lease", action="store_true",
+                        help="claim rows with leases so several hosts can run concurrently")
+    parser.add_argument("--papers", help="comma-separated paper codes to classify (default: all)")
+    args = parser.parse_args()
+    if args.papers:
+        PAPER_FILTER = args.papers.split(",")
+
+    if args.lease:
+        main_leased()
+    else:
+        main()
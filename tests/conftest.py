@@ -0,0 +1,42 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pipeline_log
+
+# Tests log to the console only
+pipeline_log.LOG_CONFIG.update(json_file=None, debug_file=None)
+
+
+def make_row(paper, year, page_number, question_number, question_text, section=None, question_type="MCQ",
+             options=("", "", "", ""), subject=None, topic=None, has_diagram=False, image_description=None,
+             diagram_image=None):
+    """PYQ row with every pyq_db.QUESTION_COLUMNS key"""
+    option_a, option_b, option_c, option_d = (option or None for option in options)
+    return {
+        "paper": paper, "year": year, "page_number": page_number, "question_number": question_number,
+        "section": section or paper, "question_text": question_text, "question_type": question_type,
+        "option_a": option_a, "option_b": option_b, "option_c": option_c, "option_d": option_d,
+        "has_diagram": has_diagram, "image_description": image_description, "diagram_image": diagram_image,
+        "subject": subject, "topic": topic,
+    }
+
+
+@pytest.fixture
+def question_rows():
+    return [
+        make_row("EE", 2016, 1, 1, "Choose the word most similar in meaning to \"candid\".", section="GA",
+                 options=("frank", "secretive", "angry", "tired"), subject="Verbal Aptitude", topic="Vocabulary"),
+        make_row("EE", 2016, 3, 12, "The eigenvalues of the matrix \\(A\\) are \\(\\lambda_1 = 2\\) and \\(\\lambda_2 = 3\\). "
+                 "Find \\(\\det(A)\\).", question_type="NAT", subject="Engineering Mathematics", topic="Linear Algebra"),
+        make_row("EE", 2017, 4, 40, "A resistor of \\(10\\,\\Omega\\) carries a current \\(I_{in} = 2\\text{ A}\\). "
+                 "The power dissipated is", options=("20 W", "40 W", "5 W", "10 W"),
+                 subject="Electric circuits", topic="Network Elements", has_diagram=True,
+                 image_description="Circuit with one resistor", diagram_image="diagrams/EE/2017/4-40.png"),
+        make_row("EE", 2017, 5, 44, "Thévenin equivalent resistance seen from terminals a–b is",
+                 options=("2 Ω", "4 Ω", "6 Ω", "8 Ω"), subject="Electric circuits", topic=None),
+        make_row("CS", 2019, 2, 20, "The number of edges in a complete graph on \\(n\\) vertices is", question_type="MSQ"),
+    ]
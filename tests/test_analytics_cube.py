@@ -0,0 +1,78 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+import analytics_cube
+
+
+def subject_total(cube, subject, measure="questions", section="EE"):
+    return int(cube.select(section=section, subject=subject, measure=measure).sum())
+
+
+@pytest.fixture
+def cube(question_rows, tmp_path):
+    return analytics_cube.build(question_rows, tmp_path)
+
+
+def test_build_counts_questions_and_marks(cube):
+    assert subject_total(cube, "Electric circuits") == 2
+    assert subject_total(cube, "Electric circuits", "marks") == 4  # Q40 and Q44 of 2017 carry two marks
+    assert subject_total(cube, "Engineering Mathematics", "marks") == 1
+    assert subject_total(cube, "Verbal Aptitude", section="GA") == 1
+    assert int(cube.select(section="CS").sum()) == 1  # unlabeled rows count at the section leaf
+    assert int(cube.select(measure="questions").sum()) == 5
+    assert cube.trend(section="EE", measure="questions") == {2016: 1, 2017: 2, 2019: 0}
+
+
+def test_relabel_moves_one_count(cube, question_rows):
+    total_marks = int(cube.select().sum())
+    relabeled = dict(question_rows[3], subject="Engineering Mathematics", topic="Calculus")
+    assert cube.update(relabeled)
+    assert not cube.update(relabeled)
+    assert subject_total(cube, "Electric circuits") == 1
+    assert subject_total(cube, "Engineering Mathematics") == 2
+    assert int(cube.select(section="EE", subject="Engineering Mathematics", topic="Calculus").sum()) == 2
+    assert int(cube.select().sum()) == total_marks
+
+
+def test_updates_match_a_rebuild(cube, question_rows, tmp_path):
+    changed = [dict(question_rows[1], topic="Calculus"),
+               dict(question_rows[2], subject=None, topic=None),
+               dict(question_rows[4], section="CS", subject="No such subject")]
+    for row in changed:
+        cube.update(row)
+    rebuilt = analytics_cube.build(question_rows[:1] + changed + question_rows[3:4], tmp_path / "rebuilt")
+    assert np.array_equal(np.asarray(cube.data), np.asarray(rebuilt.data))
+
+
+def test_flush_and_reopen_keeps_coordinates(cube, question_rows, tmp_path):
+    cube.update(dict(question_rows[3], subject="Engineering Mathematics"))
+    cube.flush(tmp_path)
+    reopened = analytics_cube.open_cube(tmp_path, "r+")
+    assert np.array_equal(np.asarray(reopened.data), np.asarray(cube.data))
+    assert reopened.rows == cube.rows
+    # A relabel after reopening moves the saved count instead of adding a second one
+    reopened.update(question_rows[3])
+    assert subject_total(reopened, "Electric circuits") == 2
+    assert int(reopened.select(measure="questions").sum()) == 5
+
+
+def test_shares_sum_to_one(cube):
+    shares = cube.shares("EE", measure="questions")
+    assert shares["Electric circuits"] == pytest.approx(2 / 3)
+    assert sum(shares.values()) == pytest.approx(1.0)
+    assert cube.shares("EE", year=2019) == dict.fromkeys(shares, 0.0)
+
+
+@pytest.mark.skipif(analytics_cube.fcntl is None, reason="needs flock")
+def test_second_process_cannot_write(cube, tmp_path):
+    code = ("import analytics_cube, sys\n"
+            "try:\n"
+            f"    analytics_cube.build([], {str(tmp_path)!r})\n"
+            "except RuntimeError:\n"
+            "    sys.exit(3)\n")
+    result = subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(os.path.abspath(analytics_cube.__file__)))
+    assert result.returncode == 3
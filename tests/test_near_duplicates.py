@@ -0,0 +1,41 @@
+import pytest
+
+import near_duplicates
+
+
+@pytest.fixture
+def index_file(question_rows, tmp_path, monkeypatch):
+    path = str(tmp_path / "near_duplicates.npz")
+    monkeypatch.setitem(near_duplicates.NEAR_DUP_CONFIG, "index_file", path)
+    monkeypatch.setattr(near_duplicates, "index", None)
+    saved = near_duplicates.NearDuplicateIndex()
+    for row in question_rows:
+        saved.add(row)
+    saved.save(path)
+    return path
+
+
+def test_save_index_merges_other_processes_saves(index_file, question_rows):
+    # This process labels one question while another process adds a question and labels a different one
+    near_duplicates.record_label({"paper": "EE", "year": 2017, "page_number": 5, "question_number": 44},
+                                 "topic", "Network Theorems")
+    other = near_duplicates.NearDuplicateIndex.load(index_file)
+    other.add(dict(question_rows[3], year=2018, page_number=6, question_number=30,
+                   question_text="The Norton equivalent current seen from terminals a–b is"))
+    other.set_label("CS-2019-2-20", "subject", "Discrete Mathematics")
+    with near_duplicates.writer_lock(index_file):
+        other.save(index_file)
+
+    near_duplicates.save_index()
+    merged = near_duplicates.NearDuplicateIndex.load(index_file)
+    assert merged.count == 6 and "EE-2018-6-30" in merged.positions
+    assert merged.meta[merged.positions["EE-2017-5-44"]]["topic"] == "Network Theorems"
+    assert merged.meta[merged.positions["CS-2019-2-20"]]["subject"] == "Discrete Mathematics"
+    assert not near_duplicates.index.touched
+
+
+def test_save_index_skips_unchanged_index(index_file):
+    near_duplicates.get_index()
+    before = open(index_file, "rb").read()
+    near_duplicates.save_index()
+    assert open(index_file, "rb").read() == before
@@ -0,0 +1,52 @@
+import pytest
+
+import papers
+
+
+@pytest.mark.parametrize("year, question_number, section", [
+    (2016, 1, "GA"),
+    (2016, 10, "GA"),
+    (2016, 11, "EE"),
+    (2023, 65, "EE"),
+    (2012, 55, "EE"),
+    (2012, 56, "GA"),
+    (2015, 65, "GA"),
+    (2010, 66, "EE"),
+    (2009, 1, "EE"),
+    (2009, 60, "EE"),
+])
+def test_infer_section_by_position(year, question_number, section):
+    assert papers.infer_section("EE", year, question_number) == section
+
+
+def test_infer_section_keeps_paper_code():
+    assert papers.infer_section("CS", 2019, 30) == "CS"
+    assert papers.infer_section("CS", 2019, 3) == papers.PAPERS_CONFIG["shared_section"]
+
+
+def test_paper_clause():
+    assert papers.paper_clause(None) == ""
+    assert papers.paper_clause(["EE", "CS"]) == "PYQ.paper IN ('EE', 'CS')"
+    with pytest.raises(ValueError):
+        papers.paper_clause(["EE'; DROP TABLE PYQ; --"])
+
+
+@pytest.mark.parametrize("year, question_number, marks", [
+    (2016, 1, 1),
+    (2016, 5, 1),
+    (2016, 6, 2),
+    (2016, 10, 2),
+    (2016, 11, 1),
+    (2016, 35, 1),
+    (2016, 36, 2),
+    (2016, 65, 2),
+    (2012, 25, 1),
+    (2012, 26, 2),
+    (2012, 55, 2),
+    (2012, 56, 1),
+    (2012, 60, 1),
+    (2012, 61, 2),
+    (2009, 1, None),
+])
+def test_question_marks_by_position(year, question_number, marks):
+    assert papers.question_marks(year, question_number) == marks
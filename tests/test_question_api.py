@@ -0,0 +1,103 @@
+import asyncio
+import re
+
+import question_api
+
+
+def ids(bank, positions):
+    return [bank.entries[p]["id"] for p in positions]
+
+
+def test_query_filters(question_rows):
+    bank = question_api.QuestionBank(question_rows)
+    assert list(bank.query({})) == [0, 1, 2, 3, 4]
+    assert ids(bank, bank.query({"subject": "Electric circuits"})) == ["EE-2017-4-40", "EE-2017-5-44"]
+    assert ids(bank, bank.query({"year": "2016"})) == ["EE-2016-1-1", "EE-2016-3-12"]
+    assert ids(bank, bank.query({"paper": "EE", "section": "GA"})) == ["EE-2016-1-1"]
+    assert ids(bank, bank.query({"year": "2017", "subject": "Electric circuits", "topic": "Network Elements"})) \
+        == ["EE-2017-4-40"]
+    assert ids(bank, bank.query({"type": "MSQ", "paper": "CS"})) == ["CS-2019-2-20"]
+    assert list(bank.query({"subject": "Electric circuits", "year": "2016"})) == []
+    assert list(bank.query({"topic": "No such topic"})) == []
+
+
+def test_facets_and_version(question_rows):
+    bank = question_api.QuestionBank(question_rows)
+    facets = bank.facets()
+    assert "topic" not in facets
+    assert facets["year"] == {"2016": 2, "2017": 2, "2019": 1}
+    assert facets["section"] == {"CS": 1, "EE": 3, "GA": 1}
+    assert question_api.QuestionBank(question_rows).version == bank.version
+    assert question_api.QuestionBank(question_rows[:-1]).version != bank.version
+
+
+def test_route_pages_and_lookups(question_rows):
+    api = question_api.QuestionAPI()
+    api.bank = question_api.QuestionBank(question_rows)
+    status, value = api.route("/questions", {"paper": "EE", "per_page": "2", "page": "2"})
+    assert status == 200
+    assert (value["total"], value["page"], value["per_page"]) == (4, 2, 2)
+    assert [entry["id"] for entry in value["questions"]] == ["EE-2017-4-40", "EE-2017-5-44"]
+    assert api.route("/questions/EE/2016/3/12", {})[1]["id"] == "EE-2016-3-12"
+    assert api.route("/questions/EE/2016/3/99", {})[0] == 404
+    assert api.route("/questions/EE/x/3/12", {})[0] == 404
+    assert api.route("/questions", {"page": "two"})[0] == 400
+
+
+def test_etags():
+    assert question_api.etags('"a", W/"b" ,') == {'"a"', '"b"'}
+    assert question_api.etags("") == set()
+
+
+def exchange(api, raw):
+    """Status codes the API sends back for raw request bytes before closing or going idle"""
+    async def run():
+        server = await asyncio.start_server(api.handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(raw)
+        data = b""
+        try:
+            while chunk := await asyncio.wait_for(reader.read(65536), 0.5):
+                data += chunk
+        except asyncio.TimeoutError:
+            data += b"<open>"
+        writer.close()
+        server.close()
+        return [int(code) for code in re.findall(rb"HTTP/1.1 (\d{3})", data)], data.endswith(b"<open>")
+    return asyncio.run(run())
+
+
+def test_request_framing(question_rows):
+    api = question_api.QuestionAPI()
+    # A POST body is never parsed as the next request; the connection is closed after the 405
+    assert exchange(api, b"POST /questions HTTP/1.1\r\nContent-Length: 17\r\n\r\n"
+                         b"GET / HTTP/1.1\r\n\r\n") == ([405], False)
+    assert exchange(api, b"GET /health HTTP/1.1\r\n\r\n") == ([503], True)
+
+    api.bank = question_api.QuestionBank(question_rows)
+    # A small body on a GET is skipped and the connection stays usable
+    assert exchange(api, b"GET /facets HTTP/1.1\r\nContent-Length: 5\r\n\r\nhello"
+                         b"GET /health HTTP/1.1\r\n\r\n") == ([200, 200], True)
+    assert exchange(api, b"GET /facets HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n"
+                         b"0\r\n\r\n") == ([400], False)
+    assert exchange(api, b"GET /facets HTTP/1.1\r\nContent-Length: -3\r\n\r\n") == ([400], False)
+
+
+def test_failed_reload_keeps_snapshot(question_rows, monkeypatch):
+    api = question_api.QuestionAPI()
+
+    def fail():
+        raise ConnectionError("database down")
+    monkeypatch.setattr(api, "fetch_rows", fail)
+    assert not asyncio.run(api.reload())
+    monkeypatch.setattr(api, "fetch_rows", lambda: [])
+    assert not asyncio.run(api.reload())
+    assert api.bank is None
+
+    monkeypatch.setattr(api, "fetch_rows", lambda: question_rows)
+    assert asyncio.run(api.reload())
+    version = api.bank.version
+    monkeypatch.setattr(api, "fetch_rows", lambda: [])
+    assert not asyncio.run(api.reload())
+    assert api.bank.version == version
@@ -0,0 +1,65 @@
+import copy
+
+import pytest
+
+import pyq_db
+import question_store
+
+
+@pytest.fixture
+def store(question_rows, tmp_path):
+    path = tmp_path / "bank.qcol"
+    question_store.write_store(question_rows, path)
+    opened = question_store.QuestionStore(path)
+    yield opened
+    opened.close()
+
+
+def test_round_trip(store, question_rows):
+    assert len(store) == len(question_rows)
+    for row, stored in zip(question_rows, store):
+        assert stored.as_dict() == {name: row[name] for name in pyq_db.QUESTION_COLUMNS}
+    assert store[-1]["paper"] == "CS"
+    with pytest.raises(IndexError):
+        store[len(question_rows)]
+
+
+def test_row_access(store):
+    row = store[3]
+    assert row["question_text"].startswith("Thévenin")
+    assert row.option_b == "4 Ω"
+    assert row.get("topic", "unset") is None
+    assert row.get("no_such_column", "default") == "default"
+    assert "subject" in row and "no_such_column" not in row
+    assert row.has_diagram is False and store[2].has_diagram is True
+    with pytest.raises(AttributeError):
+        row.no_such_column
+    assert repr(row) == "QuestionRow(EE-2017-5-44)"
+
+
+def test_row_copies(store):
+    row = store[2]
+    copied = copy.copy(row)
+    assert copied.as_dict() == row.as_dict()
+
+
+def test_where(store):
+    assert store.where(year=2017).tolist() == [2, 3]
+    assert store.where(subject="Electric circuits", topic=None).tolist() == [3]
+    assert store.where(subject=None).tolist() == [4]
+    assert store.where(paper="EE", section="GA").tolist() == [0]
+    assert store.where(subject="No such subject").tolist() == []
+    with pytest.raises(ValueError):
+        store.where(question_text="x")
+
+
+def test_empty_store(tmp_path):
+    question_store.write_store([], tmp_path / "empty.qcol")
+    empty = question_store.QuestionStore(tmp_path / "empty.qcol")
+    assert len(empty) == 0 and list(empty) == [] and empty.where(year=2016).tolist() == []
+
+
+def test_rejects_other_files(tmp_path):
+    (tmp_path / "other.qcol").write_bytes(b"not a store at all")
+    with pytest.raises(ValueError):
+        question_store.QuestionStore(tmp_path / "other.qcol")
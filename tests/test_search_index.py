@@ -0,0 +1,60 @@
+import json
+
+import search_index
+from question_text import tokenize
+
+
+def decode(posting):
+    """(doc numbers, term frequencies) of a delta-encoded posting"""
+    deltas, tfs = posting
+    docs, doc = [], 0
+    for delta in deltas:
+        doc += delta
+        docs.append(doc)
+    return docs, tfs
+
+
+def test_tokenize_mathjax():
+    assert tokenize("\\(10\\,\\Omega\\)") == ["10", "omega"]
+    assert tokenize("2\\text{ V}") == ["2", "v"]
+    assert tokenize("90^\\circ") == ["90", "deg"]
+    assert tokenize("V_1 and V_{in}") == ["v", "v_1", "v", "v_in"]
+    assert tokenize("the value of a") == ["value"]
+    assert tokenize(None) == []
+
+
+def test_build_index_postings(question_rows):
+    docs, postings = search_index.build_index(question_rows)
+    assert docs["ids"] == ["EE-2016-1-1", "EE-2016-3-12", "EE-2017-4-40", "EE-2017-5-44", "CS-2019-2-20"]
+    assert docs["lengths"][2] == len(tokenize(search_index.document_text(question_rows[2])))
+    assert docs["avgdl"] == round(sum(docs["lengths"]) / len(docs["lengths"]), 3)
+
+    assert decode(postings["lambda_1"]) == ([1], [1])
+    assert decode(postings["lambda"]) == ([1], [2])
+    assert decode(postings["w"]) == ([2], [4])
+    assert "is" not in postings  # stopword
+    for term, posting in postings.items():
+        numbers, tfs = decode(posting)
+        assert numbers == sorted(set(numbers)), term
+        assert len(numbers) == len(tfs) and min(tfs) >= 1, term
+
+
+def test_written_index_round_trip(question_rows, tmp_path):
+    docs, postings = search_index.build_index(question_rows)
+    search_index.write_index(docs, postings, tmp_path)
+    assert (tmp_path / "docs.json.gz").exists()
+
+    shard_terms = {}
+    for i in range(search_index.SEARCH_CONFIG["shards"]):
+        with open(tmp_path / f"terms-{i:03d}.json") as f:
+            for term, posting in json.load(f).items():
+                assert search_index.shard_of(term, search_index.SEARCH_CONFIG["shards"]) == i
+                shard_terms[term] = posting
+    assert shard_terms == {term: [list(deltas), list(tfs)] for term, (deltas, tfs) in postings.items()}
+
+    index = search_index.SearchIndex(tmp_path)
+    results = index.search("power dissipated in the resistor")
+    assert results[0][0] == "EE-2017-4-40"
+    assert [question_id for question_id, _ in index.search("eigenvalues det")] == ["EE-2016-3-12"]
+    assert index.search("transformer") == []
+    assert len(index.search("the of is", limit=3)) == 0
@@ -0,0 +1,25 @@
+import static_export
+
+
+def test_export_diagrams_copies_crops_by_content(question_rows, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    crop = tmp_path / "diagrams" / "EE" / "2017" / "4-40.png"
+    crop.parent.mkdir(parents=True)
+    crop.write_bytes(b"crop bytes")
+    out_dir = tmp_path / "site_data"
+
+    images = static_export.export_diagrams(question_rows, out_dir)
+    url = images["diagrams/EE/2017/4-40.png"]
+    assert url.startswith(static_export.EXPORT_CONFIG["diagram_dir"] + "/") and url.endswith(".png")
+    assert (out_dir / url).read_bytes() == b"crop bytes"
+
+    entry = static_export.question_entry(question_rows[2], images)
+    assert entry["image"] == url and entry["diagram"] == "Circuit with one resistor"
+    # Without an exported copy the local crop path is never shipped
+    assert "image" not in static_export.question_entry(question_rows[2])
+
+
+def test_export_diagrams_skips_missing_crops(question_rows, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert static_export.export_diagrams(question_rows, tmp_path / "site_data") == {}
+    assert not (tmp_path / "site_data").exists()
@@ -0,0 +1,206 @@
+import argparse
+import atexit
+import collections
+import contextlib
+import contextvars
+import cProfile
+import functools
+import json
+import os
+import pstats
+import runpy
+import sys
+import threading
+import time
+
+# Lightweight span tracing. Spans are no-ops until tracing is enabled with
+# enable() or the PIPELINE_TRACE environment variable (path of the JSONL trace
+# file). Each span records wall and CPU time, thread, parent span and attrs.
+TRACE_CONFIG = {
+    "trace_file": os.environ.get("PIPELINE_TRACE"),
+    "flush_every": 200,  # spans buffered before writing
+}
+
+current_span = contextvars.ContextVar("current_span", default=None)
+
+buffer = []
+buffer_lock = threading.Lock()
+
+def enable(trace_file):
+    """Start writing spans to trace_file"""
+    TRACE_CONFIG["trace_file"] = trace_file
+
+def flush():
+    """Append buffered spans to the trace file"""
+    with buffer_lock:
+        spans = list(buffer)
+        buffer.clear()
+    if spans and TRACE_CONFIG["trace_file"]:
+        with open(TRACE_CONFIG["trace_file"], 'a') as f:
+            f.write("".join(json.dumps(s) + "\n" for s in spans))
+
+atexit.register(flush)
+
+@contextlib.contextmanager
+def span(name, **attrs):
+    """Time the enclosed block as a span called name"""
+    if not TRACE_CONFIG["trace_file"]:
+        yield
+        return
+
+    parent = current_span.get()
+    token = current_span.set(name)
+    started = time.time()
+    wall_start = time.perf_counter()
+    cpu_start = time.thread_time()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        record = {
+            "name": name,
+            "parent": parent,
+            "ts": started,
+            "wall_s": time.perf_counter() - wall_start,
+            "cpu_s": time.thread_time() - cpu_start,
+            "thread": threading.current_thread().name,
+        }
+        if attrs:
+            record["attrs"] = attrs
+        if error:
+            record["error"] = error
+        current_span.reset(token)
+
+        with buffer_lock:
+            buffer.append(record)
+            full = len(buffer) >= TRACE_CONFIG["flush_every"]
+        if full:
+            flush()
+
+def traced(name=None):
+    """Decorator that wraps every call of the function in a span"""
+    def decorator(fn):
+        span_name = name or f"{fn.__module__}.{fn.__name__}"
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+def report(trace_file):
+    """Print per-span-name counts, wall/CPU totals and wall-time percentiles"""
+    spans = collections.defaultdict(list)
+    with open(trace_file) as f:
+        for line in f:
+            record = json.loads(line)
+            spans[record["name"]].append(record)
+
+    print(f"{'span':<28}{'count':>7}{'wall s':>10}{'cpu s':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}")
+    for name, records in sorted(spans.items(), key=lambda item: -sum(r["wall_s"] for r in item[1])):
+        walls = [r["wall_s"] for r in records]
+        print(f"{name:<28}{len(records):>7}{sum(walls):>10.2f}{sum(r['cpu_s'] for r in records):>10.2f}"
+              f"{percentile(walls, 0.5) * 1000:>9.1f}{percentile(walls, 0.95) * 1000:>9.1f}"
+              f"{percentile(walls, 0.99) * 1000:>9.1f}{sum(1 for r in records if 'error' in r):>8}")
+
+class SamplingProfiler:
+    """Samples the stacks of all threads at a fixed interval"""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def write_collapsed(self, path):
+        """Write stacks in the collapsed format flamegraph tools read"""
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+    def print_top(self, limit=20):
+        leaf_counts = collections.Counter()
+        for stack, count in self.stacks.items():
+            leaf_counts[stack.rsplit(";", 1)[-1]] += count
+        total = sum(leaf_counts.values()) or 1
+        print(f"Top functions by samples ({total} samples):")
+        for leaf, count in leaf_counts.most_common(limit):
+            print(f"{count / total:>7.1%}  {leaf}")
+
+def profile_script(script, script_args, mode, output):
+    """Run a script as __main__ under cProfile or the sampling profiler"""
+    sys.argv = [script] + script_args
+    sys.path.insert(0, os.path.dirname(os.path.abspath(script)))
+
+    if mode == "cprofile":
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            runpy.run_path(script, run_name="__main__")
+        finally:
+            profiler.disable()
+            profiler.dump_stats(output)
+            pstats.Stats(profiler).sort_stats("cumulative").print_stats(25)
+            print(f"cProfile stats written to {output}")
+    else:
+        profiler = SamplingProfiler()
+        profiler.start()
+        try:
+            runpy.run_path(script, run_name="__main__")
+        finally:
+            profiler.stop()
+            profiler.write_collapsed(output)
+            profiler.print_top()
+            print(f"Collapsed stacks written to {output}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Trace reports and profiling for pipeline entry points")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    report_parser = commands.add_parser("report", help="summarize a trace file")
+    report_parser.add_argument("trace_file")
+
+    profile_parser = commands.add_parser("profile", help="run a script under a profiler")
+    profile_parser.add_argument("--mode", choices=["cprofile", "sample"], default="cprofile")
+    profile_parser.add_argument("--output", help="stats file (default: <script>.prof or <script>.stacks)")
+    profile_parser.add_argument("--trace", help="also write spans to this trace file")
+    profile_parser.add_argument("script")
+    profile_parser.add_argument("script_args", nargs=argparse.REMAINDER)
+
+    args = parser.parse_args()
+    if args.command == "report":
+        report(args.trace_file)
+    else:
+        if args.trace:
+            # The script imports its own copy of this module, which reads the env var
+            os.environ["PIPELINE_TRACE"] = args.trace
+        default_output = os.path.splitext(args.script)[0] + (".prof" if args.mode == "cprofile" else ".stacks")
+        profile_script(args.script, args.script_args, args.mode, args.output or default_output)